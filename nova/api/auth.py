@@ -18,6 +18,7 @@ Common Auth Middleware.
 
 from oslo.config import cfg
 from oslo.serialization import jsonutils
+from oslo.utils import strutils
 import webob.dec
 import webob.exc
 
@@ -125,6 +126,10 @@ class NovaKeystoneContext(wsgi.Middleware):
         auth_token = req.headers.get('X_AUTH_TOKEN',
                                      req.headers.get('X_STORAGE_TOKEN'))
 
+        # Admins may ask for the scheduler steps of the request to be traced
+        scheduler_trace = strutils.bool_from_string(
+            req.headers.get('X-Nova-Scheduler-Trace'))
+
         # Build a context, including the auth_token...
         remote_address = req.remote_addr
         if CONF.use_forwarded_for:
@@ -147,7 +152,8 @@ class NovaKeystoneContext(wsgi.Middleware):
                                      auth_token=auth_token,
                                      remote_address=remote_address,
                                      service_catalog=service_catalog,
-                                     request_id=req_id)
+                                     request_id=req_id,
+                                     scheduler_trace=scheduler_trace)
 
         req.environ['nova.context'] = ctx
         return self.application
@@ -21,6 +21,8 @@ from nova import weights
 
 
 class WeightedCell(weights.WeighedObject):
+    __slots__ = ()
+
     def __repr__(self):
         return "WeightedCell [cell: %s, weight: %s]" % (
                 self.obj.name, self.weight)
@@ -21,6 +21,7 @@ import sys
 from oslo.config import cfg
 
 from nova import config
+from nova.i18n import _LW
 from nova import objects
 from nova.openstack.common import log as logging
 from nova.openstack.common.report import guru_meditation_report as gmr
@@ -30,6 +31,11 @@ from nova import version
 
 CONF = cfg.CONF
 CONF.import_opt('scheduler_topic', 'nova.scheduler.rpcapi')
+CONF.import_opt('scheduler_workers', 'nova.scheduler.manager')
+CONF.import_opt('scheduler_optimistic_claims',
+                'nova.scheduler.filter_scheduler')
+CONF.import_opt('scheduler_cache_group_hosts', 'nova.scheduler.group_cache')
+LOG = logging.getLogger(__name__)
 
 
 def main():
@@ -40,7 +46,20 @@ def main():
 
     gmr.TextGuruMeditation.setup_autorun(version)
 
+    workers = CONF.scheduler_workers
+    if workers > 1 and not CONF.scheduler_optimistic_claims:
+        LOG.warn(_LW("Running %d scheduler workers without "
+                     "scheduler_optimistic_claims, concurrent scheduling "
+                     "decisions may pick the same resources."), workers)
+    if workers > 1 and CONF.scheduler_cache_group_hosts:
+        # NOTE: Each notification is only received by one of the workers,
+        # the caches of the other ones would keep the hosts of the server
+        # group members deleted or moved.
+        LOG.warn(_LW("scheduler_cache_group_hosts is ignored when running "
+                     "%d scheduler workers."), workers)
+        CONF.set_override('scheduler_cache_group_hosts', False)
+
     server = service.Service.create(binary='nova-scheduler',
                                     topic=CONF.scheduler_topic)
-    service.serve(server)
+    service.serve(server, workers=workers)
     service.wait()
@@ -5357,7 +5357,8 @@ class ComputeManager(manager.Manager):
             filters = {'task_state': task_states.REBOOTING,
                        'host': self.host}
             rebooting = objects.InstanceList.get_by_filters(
-                context, filters, expected_attrs=[], use_slave=True)
+                context, filters, expected_attrs=[], use_slave=True,
+                load_fields=['updated_at', 'host', 'node', 'task_state'])
 
             to_poll = []
             for instance in rebooting:
@@ -5700,9 +5701,9 @@ class ComputeManager(manager.Manager):
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
         """
-        db_instances = objects.InstanceList.get_by_host(context,
-                                                             self.host,
-                                                             use_slave=True)
+        db_instances = objects.InstanceList.get_by_host(
+            context, self.host, expected_attrs=[], use_slave=True,
+            load_fields=['host', 'power_state', 'vm_state', 'task_state'])
 
         num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
@@ -85,6 +85,9 @@ class ResourceTracker(object):
             ext_resources.ResourceHandler(CONF.compute_resources)
         self.notifier = rpc.get_notifier()
         self.old_resources = {}
+        # Generation of the compute node after the last write of the
+        # tracker, the schedulers claiming resources increment it.
+        self.generation = None
         self.scheduler_client = scheduler_client.SchedulerClient()
 
     @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
@@ -405,10 +408,30 @@ class ResourceTracker(object):
 
         else:
             # just update the record:
+            if self._compute_node_claimed(context):
+                # NOTE: The usage written by the schedulers is replaced by
+                # the one of the tracker, even if the latter didn't change,
+                # so that the claims of the instances which were never built
+                # here don't stay in the compute node.
+                self.old_resources = {}
             self._update(context, resources)
             LOG.info(_('Compute_service record updated for %(host)s:%(node)s')
                     % {'host': self.host, 'node': self.nodename})
 
+    def _compute_node_claimed(self, context):
+        """Check if the compute node was changed by someone else, like a
+        scheduler claiming resources, since the last write of the tracker.
+        """
+        if self.generation is None:
+            return False
+        service = self._get_service(context)
+        if not service:
+            return False
+        for cn in service['compute_node'] or []:
+            if cn.get('hypervisor_hostname') == self.nodename:
+                return cn.get('generation') != self.generation
+        return False
+
     def _write_ext_resources(self, resources):
         resources['stats'] = {}
         resources['stats'].update(self.stats)
@@ -523,8 +546,10 @@ class ResourceTracker(object):
     def _update_resource_stats(self, context, values):
         stats = values.copy()
         stats['id'] = self.compute_node['id']
-        self.scheduler_client.update_resource_stats(
+        compute_node = self.scheduler_client.update_resource_stats(
             context, (self.host, self.nodename), stats)
+        if isinstance(compute_node, dict):
+            self.generation = compute_node.get('generation')
 
     def _update_usage(self, context, resources, usage, sign=1):
         mem_usage = usage['memory_mb']
@@ -91,6 +91,10 @@ class Stats(dict):
         key = "num_os_type_%s" % os_type
         return self.get(key, 0)
 
+    def num_instance_type(self, instance_type_id):
+        key = "num_type_%s" % instance_type_id
+        return self.get(key, 0)
+
     def update_stats_for_instance(self, instance):
         """Update stats after an instance is changed."""
 
@@ -105,12 +109,13 @@ class Stats(dict):
             self._decrement("num_task_%s" % old_state['task_state'])
             self._decrement("num_os_type_%s" % old_state['os_type'])
             self._decrement("num_proj_%s" % old_state['project_id'])
+            self._decrement("num_type_%s" % old_state['instance_type_id'])
         else:
             # new instance
             self._increment("num_instances")
 
         # Now update stats from the new instance state:
-        (vm_state, task_state, os_type, project_id) = \
+        (vm_state, task_state, os_type, project_id, instance_type_id) = \
                 self._extract_state_from_instance(instance)
 
         if vm_state == vm_states.DELETED:
@@ -122,6 +127,7 @@ class Stats(dict):
             self._increment("num_task_%s" % task_state)
             self._increment("num_os_type_%s" % os_type)
             self._increment("num_proj_%s" % project_id)
+            self._increment("num_type_%s" % instance_type_id)
 
         # save updated I/O workload in stats:
         self["io_workload"] = self.io_workload
@@ -142,8 +148,10 @@ class Stats(dict):
         task_state = instance['task_state']
         os_type = instance['os_type']
         project_id = instance['project_id']
+        instance_type_id = instance.get('instance_type_id')
 
         self.states[uuid] = dict(vm_state=vm_state, task_state=task_state,
-                                 os_type=os_type, project_id=project_id)
+                                 os_type=os_type, project_id=project_id,
+                                 instance_type_id=instance_type_id)
 
-        return (vm_state, task_state, os_type, project_id)
+        return (vm_state, task_state, os_type, project_id, instance_type_id)
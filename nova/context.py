@@ -44,7 +44,8 @@ class RequestContext(object):
                  roles=None, remote_address=None, timestamp=None,
                  request_id=None, auth_token=None, overwrite=True,
                  quota_class=None, user_name=None, project_name=None,
-                 service_catalog=None, instance_lock_checked=False, **kwargs):
+                 service_catalog=None, instance_lock_checked=False,
+                 scheduler_trace=False, **kwargs):
         """:param read_deleted: 'no' indicates deleted records are hidden,
                 'yes' indicates deleted records are visible,
                 'only' indicates that *only* deleted records are visible.
@@ -53,6 +54,9 @@ class RequestContext(object):
            :param overwrite: Set to False to ensure that the greenthread local
                 copy of the index is not overwritten.
 
+           :param scheduler_trace: Set to True to trace the time spent in
+                each step of the scheduler, for admin contexts.
+
            :param kwargs: Extra arguments that might be present, but we ignore
                 because they possibly came in from older rpc messages.
         """
@@ -84,6 +88,7 @@ class RequestContext(object):
             self.service_catalog = []
 
         self.instance_lock_checked = instance_lock_checked
+        self.scheduler_trace = scheduler_trace
 
         # NOTE(markmc): this attribute is currently only used by the
         # rs_limits turnstile pre-processor.
@@ -130,6 +135,7 @@ class RequestContext(object):
                 'service_catalog': self.service_catalog,
                 'project_name': self.project_name,
                 'instance_lock_checked': self.instance_lock_checked,
+                'scheduler_trace': self.scheduler_trace,
                 'tenant': self.tenant,
                 'user': self.user}
 
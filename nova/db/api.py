@@ -196,6 +196,32 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+def compute_node_get_all_changed_since(context, since):
+    """Get computeNodes created, updated or deleted since a point in time.
+
+    :param context: The security context
+    :param since: datetime; only compute nodes whose 'created_at',
+                  'updated_at' or 'deleted_at' is equal or later than this
+                  are returned
+
+    :returns: List of dictionaries each containing compute node properties.
+              Soft-deleted compute nodes are included so that callers can
+              drop them from their caches. The corresponding service is not
+              joined.
+    """
+    return IMPL.compute_node_get_all_changed_since(context, since)
+
+
+def db_utcnow(context):
+    """Get the current time of the database server, in UTC.
+
+    Unlike timeutils.utcnow(), this is the same clock for every service, so
+    it can be used as a point in time for compute_node_get_all_changed_since()
+    which doesn't depend on the clock of the caller.
+    """
+    return IMPL.db_utcnow(context)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get compute nodes by hypervisor hostname.
 
@@ -235,6 +261,46 @@ def compute_node_update(context, compute_id, values):
     return IMPL.compute_node_update(context, compute_id, values)
 
 
+def compute_node_claim(context, compute_id, generation, vcpus, memory_mb,
+                       local_gb):
+    """Consume resources on a compute node if it was not updated since.
+
+    The usage of the compute node is only updated if its generation is
+    still the given one, the generation is then incremented.
+
+    :param context: The security context
+    :param compute_id: ID of the compute node
+    :param generation: Generation of the compute node the claim is based on
+    :param vcpus: Number of VCPUs to consume
+    :param memory_mb: Amount of RAM to consume, in MB
+    :param local_gb: Amount of disk to consume, in GB
+
+    :returns: The new generation of the compute node
+
+    Raises ComputeNodeClaimConflict if the compute node doesn't exist or its
+    generation is not the given one.
+    """
+    return IMPL.compute_node_claim(context, compute_id, generation, vcpus,
+                                   memory_mb, local_gb)
+
+
+def compute_node_release(context, compute_id, vcpus, memory_mb, local_gb):
+    """Give back the resources claimed on a compute node.
+
+    This is the inverse of compute_node_claim(), for the claims of the
+    instances which will not be built on the compute node. The generation
+    of the compute node is incremented.
+
+    :param context: The security context
+    :param compute_id: ID of the compute node
+    :param vcpus: Number of VCPUs to give back
+    :param memory_mb: Amount of RAM to give back, in MB
+    :param local_gb: Amount of disk to give back, in GB
+    """
+    return IMPL.compute_node_release(context, compute_id, vcpus, memory_mb,
+                                     local_gb)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a compute node from the database.
 
@@ -653,13 +719,21 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None, use_slave=False):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, use_slave=False,
+                                columns=None, compact_metadata=False):
+    """Get all instances that match all filters.
+
+    If columns is given, only these columns are loaded, along with the id
+    and uuid of the instances. If compact_metadata is True, the metadata
+    and system_metadata of the instances are key/value dicts.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
                                             columns_to_join=columns_to_join,
-                                            use_slave=use_slave)
+                                            use_slave=use_slave,
+                                            columns=columns,
+                                            compact_metadata=compact_metadata)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -676,11 +750,19 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def instance_get_all_by_host(context, host,
-                             columns_to_join=None, use_slave=False):
-    """Get all instances belonging to a host."""
+                             columns_to_join=None, use_slave=False,
+                             columns=None, compact_metadata=False):
+    """Get all instances belonging to a host.
+
+    If columns is given, only these columns are loaded, along with the id
+    and uuid of the instances. If compact_metadata is True, the metadata
+    and system_metadata of the instances are key/value dicts.
+    """
     return IMPL.instance_get_all_by_host(context, host,
                                          columns_to_join,
-                                         use_slave=use_slave)
+                                         use_slave=use_slave,
+                                         columns=columns,
+                                         compact_metadata=compact_metadata)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -1135,6 +1217,19 @@ def quota_reserve(context, resources, quotas, user_quotas, deltas, expire,
                               project_id=project_id, user_id=user_id)
 
 
+def quota_usage_count(context, resources, project_id, user_id=None):
+    """Count the usage of resources from the database.
+
+    The usage of the whole project is counted if user_id is None.
+
+    :param resources: A dictionary of the resources to count, which have
+                      a usage synchronization function
+    :returns: A dictionary of the resources names to their usage
+    """
+    return IMPL.quota_usage_count(context, resources, project_id,
+                                  user_id=user_id)
+
+
 def reservation_commit(context, reservations, project_id=None, user_id=None):
     """Commit quota reservations."""
     return IMPL.reservation_commit(context, reservations,
@@ -1149,6 +1244,42 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
                                      user_id=user_id)
 
 
+def quota_reserve_optimistic(context, resources, quotas, user_quotas, deltas,
+                             expire, until_refresh, max_age, project_id=None,
+                             user_id=None, max_attempts=10):
+    """Check quotas and create appropriate reservations without locking.
+
+    The quota usages are updated with compare-and-swap updates on their
+    generation. The reservation is attempted again when they were updated
+    concurrently, and it is done as quota_reserve() does after max_attempts
+    attempts.
+    """
+    return IMPL.quota_reserve_optimistic(context, resources, quotas,
+                                         user_quotas, deltas, expire,
+                                         until_refresh, max_age,
+                                         project_id=project_id,
+                                         user_id=user_id,
+                                         max_attempts=max_attempts)
+
+
+def reservation_commit_optimistic(context, reservations, project_id=None,
+                                  user_id=None, max_attempts=10):
+    """Commit quota reservations without locking the quota usages."""
+    return IMPL.reservation_commit_optimistic(context, reservations,
+                                              project_id=project_id,
+                                              user_id=user_id,
+                                              max_attempts=max_attempts)
+
+
+def reservation_rollback_optimistic(context, reservations, project_id=None,
+                                    user_id=None, max_attempts=10):
+    """Roll back quota reservations without locking the quota usages."""
+    return IMPL.reservation_rollback_optimistic(context, reservations,
+                                                project_id=project_id,
+                                                user_id=user_id,
+                                                max_attempts=max_attempts)
+
+
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     """Destroy all quotas associated with a given project and user."""
     return IMPL.quota_destroy_all_by_project_and_user(context,
@@ -1747,6 +1878,17 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return IMPL.aggregate_metadata_get_by_host(context, host, key)
 
 
+def aggregate_metadata_get_all_by_host(context):
+    """Get metadata for all aggregates, grouped by the hosts they contain.
+
+    Returns a dictionary where each key is a hostname and each value is a
+    dictionary in the format returned by aggregate_metadata_get_by_host().
+    Hosts which are not in any aggregate with metadata are not included.
+    return value: {machine: {key: set(value1, value2)}}
+    """
+    return IMPL.aggregate_metadata_get_all_by_host(context)
+
+
 def aggregate_metadata_get_by_metadata_key(context, aggregate_id, key):
     """Get metadata for an aggregate by metadata key."""
     return IMPL.aggregate_metadata_get_by_metadata_key(context, aggregate_id,
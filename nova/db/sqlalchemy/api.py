@@ -21,6 +21,7 @@ import collections
 import copy
 import datetime
 import functools
+import operator
 import sys
 import threading
 import time
@@ -35,11 +36,14 @@ from oslo.utils import timeutils
 import six
 from sqlalchemy import and_
 from sqlalchemy import Boolean
+from sqlalchemy import DateTime
 from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy import Integer
 from sqlalchemy import MetaData
 from sqlalchemy import or_
+from sqlalchemy.orm import class_mapper
 from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import defer
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
@@ -60,7 +64,7 @@ from nova.compute import vm_states
 import nova.context
 from nova.db.sqlalchemy import models
 from nova import exception
-from nova.i18n import _, _LI
+from nova.i18n import _, _LI, _LW
 from nova.openstack.common import log as logging
 from nova.openstack.common import uuidutils
 from nova import quota
@@ -604,6 +608,41 @@ def compute_node_get_all(context, no_date_fields):
     return compute_nodes
 
 
+@require_admin_context
+def compute_node_get_all_changed_since(context, since):
+    # NOTE(msdubov): See compute_node_get_all() for why lower-level 'select'
+    #                queries are used here.
+    engine = get_engine()
+    compute_node = models.ComputeNode.__table__
+
+    changed = or_(compute_node.c.created_at >= since,
+                  compute_node.c.updated_at >= since,
+                  compute_node.c.deleted_at >= since)
+
+    with engine.begin() as conn:
+        compute_node_query = sql.select([compute_node]).\
+                                where(changed).\
+                                order_by(compute_node.c.id)
+        compute_node_rows = conn.execute(compute_node_query).fetchall()
+
+    return [dict(proxy.items()) for proxy in compute_node_rows]
+
+
+@require_admin_context
+def db_utcnow(context):
+    engine = get_engine()
+    if engine.name == 'mysql':
+        # NOTE: NOW() is in the time zone of the session.
+        now = sql.func.utc_timestamp(type_=DateTime)
+    elif engine.name == 'postgresql':
+        now = sql.func.timezone('UTC', sql.func.now(), type_=DateTime)
+    else:
+        now = sql.func.current_timestamp(type_=DateTime)
+
+    with engine.begin() as conn:
+        return conn.execute(sql.select([now])).scalar()
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -635,6 +674,12 @@ def compute_node_update(context, compute_id, values):
 
     session = get_session()
     with session.begin():
+        # Bump the generation first, so that the scheduler claims based on
+        # the previous data of the compute node fail.
+        model_query(context, models.ComputeNode, session=session).\
+            filter_by(id=compute_id).\
+            update({'generation': models.ComputeNode.generation + 1},
+                   synchronize_session=False)
         compute_ref = _compute_node_get(context, compute_id, session=session)
         # Always update this, even if there's going to be no other
         # changes in data.  This ensures that we invalidate the
@@ -647,6 +692,51 @@ def compute_node_update(context, compute_id, values):
     return compute_ref
 
 
+@require_admin_context
+def compute_node_claim(context, compute_id, generation, vcpus, memory_mb,
+                       local_gb):
+    compute_node = models.ComputeNode
+    values = {'vcpus_used': compute_node.vcpus_used + vcpus,
+              'memory_mb_used': compute_node.memory_mb_used + memory_mb,
+              'free_ram_mb': compute_node.free_ram_mb - memory_mb,
+              'local_gb_used': compute_node.local_gb_used + local_gb,
+              'free_disk_gb': compute_node.free_disk_gb - local_gb,
+              'disk_available_least':
+                  compute_node.disk_available_least - local_gb,
+              'generation': compute_node.generation + 1,
+              'updated_at': timeutils.utcnow()}
+    # NOTE: This is a single compare-and-swap UPDATE statement, so that no
+    # lock is needed between the schedulers claiming resources.
+    result = model_query(context, compute_node, read_deleted='no').\
+            filter_by(id=compute_id).\
+            filter_by(generation=generation).\
+            update(values, synchronize_session=False)
+    if not result:
+        raise exception.ComputeNodeClaimConflict(compute_id=compute_id,
+                                                 generation=generation)
+    return generation + 1
+
+
+@require_admin_context
+def compute_node_release(context, compute_id, vcpus, memory_mb, local_gb):
+    compute_node = models.ComputeNode
+    values = {'vcpus_used': compute_node.vcpus_used - vcpus,
+              'memory_mb_used': compute_node.memory_mb_used - memory_mb,
+              'free_ram_mb': compute_node.free_ram_mb + memory_mb,
+              'local_gb_used': compute_node.local_gb_used - local_gb,
+              'free_disk_gb': compute_node.free_disk_gb + local_gb,
+              'disk_available_least':
+                  compute_node.disk_available_least + local_gb,
+              'generation': compute_node.generation + 1,
+              'updated_at': timeutils.utcnow()}
+    # NOTE: Unlike the claim, the release doesn't depend on the generation
+    # of the compute node, the usage is changed relative to its current
+    # value whatever was written since the claim.
+    model_query(context, compute_node, read_deleted='no').\
+            filter_by(id=compute_id).\
+            update(values, synchronize_session=False)
+
+
 @require_admin_context
 def compute_node_delete(context, compute_id):
     """Delete a ComputeNode record."""
@@ -1773,7 +1863,8 @@ def _build_instance_get(context, session=None,
 
 
 def _instances_fill_metadata(context, instances,
-                             manual_joins=None, use_slave=False):
+                             manual_joins=None, use_slave=False,
+                             columns=None, compact_metadata=False):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1782,23 +1873,38 @@ def _instances_fill_metadata(context, instances,
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param columns: list of the instance columns loaded by the query, or
+                    None if all of them were loaded
+    :param compact_metadata: if True, the metadata and system_metadata are
+                             filled as key/value dicts of the non-deleted
+                             items instead of lists of rows
     """
     uuids = [inst['uuid'] for inst in instances]
 
     if manual_joins is None:
         manual_joins = ['metadata', 'system_metadata']
 
-    meta = collections.defaultdict(list)
-    if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids,
-                                                use_slave=use_slave):
-            meta[row['instance_uuid']].append(row)
-
-    sys_meta = collections.defaultdict(list)
-    if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids,
-                                                       use_slave=use_slave):
-            sys_meta[row['instance_uuid']].append(row)
+    if compact_metadata:
+        meta = _instance_metadata_dicts(context, models.InstanceMetadata,
+                                        uuids, manual_joins, 'metadata',
+                                        use_slave=use_slave)
+        sys_meta = _instance_metadata_dicts(context,
+                                            models.InstanceSystemMetadata,
+                                            uuids, manual_joins,
+                                            'system_metadata',
+                                            use_slave=use_slave)
+    else:
+        meta = collections.defaultdict(list)
+        if 'metadata' in manual_joins:
+            for row in _instance_metadata_get_multi(context, uuids,
+                                                    use_slave=use_slave):
+                meta[row['instance_uuid']].append(row)
+
+        sys_meta = collections.defaultdict(list)
+        if 'system_metadata' in manual_joins:
+            for row in _instance_system_metadata_get_multi(
+                    context, uuids, use_slave=use_slave):
+                sys_meta[row['instance_uuid']].append(row)
 
     pcidevs = collections.defaultdict(list)
     if 'pci_devices' in manual_joins:
@@ -1807,7 +1913,14 @@ def _instances_fill_metadata(context, instances,
 
     filled_instances = []
     for inst in instances:
-        inst = dict(inst.iteritems())
+        if columns is None:
+            inst = dict(inst.iteritems())
+        else:
+            # NOTE: iteritems() would load the deferred columns one at a
+            # time, only the loaded columns and relationships are copied.
+            inst = dict((key, value)
+                        for key, value in inst.__dict__.iteritems()
+                        if not key.startswith('_'))
         inst['system_metadata'] = sys_meta[inst['uuid']]
         inst['metadata'] = meta[inst['uuid']]
         if 'pci_devices' in manual_joins:
@@ -1817,6 +1930,37 @@ def _instances_fill_metadata(context, instances,
     return filled_instances
 
 
+def _instance_metadata_dicts(context, model, instance_uuids, manual_joins,
+                             join, use_slave=False):
+    """Return the key/value dicts of the metadata of the instances.
+
+    NOTE: The key/value tuples are fetched by a plain SELECT, so no ORM
+    object is built for each metadata item, which matters when listing
+    thousands of instances. The deleted items are left out, as done by
+    utils.metadata_to_dict() for the rows.
+
+    :param model: InstanceMetadata or InstanceSystemMetadata
+    :param join: 'metadata' or 'system_metadata', the dicts are empty if
+                 it is not in manual_joins
+    """
+    meta = collections.defaultdict(dict)
+    if join not in manual_joins or not instance_uuids:
+        return meta
+
+    if CONF.database.slave_connection == '':
+        use_slave = False
+
+    table = model.__table__
+    query = sql.select([table.c.instance_uuid, table.c.key,
+                        table.c.value]).\
+                where(table.c.instance_uuid.in_(instance_uuids)).\
+                where(table.c.deleted == 0)
+    session = get_session(use_slave=use_slave)
+    for instance_uuid, key, value in session.execute(query):
+        meta[instance_uuid][key] = value
+    return meta
+
+
 def _manual_join_columns(columns_to_join):
     manual_joins = []
     for column in ('metadata', 'system_metadata', 'pci_devices'):
@@ -1826,6 +1970,20 @@ def _manual_join_columns(columns_to_join):
     return manual_joins, columns_to_join
 
 
+def _instance_defer_columns(query, columns):
+    """Defers the loading of the instance columns which are not in columns.
+
+    The id and uuid of the instances are always loaded. If columns is None,
+    all the columns are loaded.
+    """
+    if columns is None:
+        return query
+    for prop in class_mapper(models.Instance).column_attrs:
+        if prop.key not in columns and prop.key not in ('id', 'uuid'):
+            query = query.options(defer(prop.key))
+    return query
+
+
 @require_context
 def instance_get_all(context, columns_to_join=None):
     if columns_to_join is None:
@@ -1849,7 +2007,8 @@ def instance_get_all(context, columns_to_join=None):
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                use_slave=False):
+                                use_slave=False, columns=None,
+                                compact_metadata=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1883,14 +2042,17 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     |                    include or exclude instances whose
     |                    vm_state is SOFT_DELETED.
 
+    If columns is given, only these columns of the instances are loaded,
+    along with their id and uuid.
+
+    If compact_metadata is True, the metadata and system_metadata of the
+    instances are key/value dicts instead of lists of rows.
     """
     # NOTE(mriedem): If the limit is 0 there is no point in even going
     # to the database since nothing is going to be returned anyway.
     if limit == 0:
         return []
 
-    sort_fn = {'desc': desc, 'asc': asc}
-
     if CONF.database.slave_connection == '':
         use_slave = False
 
@@ -1905,9 +2067,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     query_prefix = session.query(models.Instance)
     for column in columns_to_join:
         query_prefix = query_prefix.options(joinedload(column))
-
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
+    query_prefix = _instance_defer_columns(query_prefix, columns)
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1974,19 +2134,57 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               models.InstanceMetadata.instance_uuid,
                               filters)
 
-    # paginate query
+    query_prefix = _paginate_instances_query(context, session, query_prefix,
+                                             sort_key, sort_dir, limit,
+                                             marker)
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins,
+                                    columns=columns,
+                                    compact_metadata=compact_metadata)
+
+
+def _paginate_instances_query(context, session, query, sort_key, sort_dir,
+                              limit, marker):
+    """Sorts the instances by sort_key and id, and seeks past the marker.
+
+    (sort_key, id) is unique, so the page following the marker instance is
+    made of the first rows whose (sort_key, id) is past the one of the
+    marker. With the default created_at sort key, the indexes on
+    (deleted, created_at, id) and (project_id, deleted, created_at, id)
+    let the database seek to the first row of the page, instead of
+    scanning the rows of the previous pages.
+    """
+    sort_fn = {'desc': desc, 'asc': asc}[sort_dir]
+    compare = {'desc': operator.lt, 'asc': operator.gt}[sort_dir]
+    compare_or_equal = {'desc': operator.le, 'asc': operator.ge}[sort_dir]
+    sort_column = getattr(models.Instance, sort_key)
+    id_column = models.Instance.id
+
     if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
+        # NOTE: Only the sort key and the id of the marker are loaded.
+        marker_values = model_query(context, sort_column, id_column,
+                                    base_model=models.Instance,
+                                    session=session, project_only=True).\
+                            filter_by(uuid=marker).\
+                            first()
+        if not marker_values:
             raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+        marker_value, marker_id = marker_values
+        if marker_value is None:
+            query = query.filter(and_(sort_column == null(),
+                                      compare(id_column, marker_id)))
+        else:
+            # NOTE: The redundant bound on the sort key lets the database
+            # use it for an index range scan, which the OR alone prevents.
+            query = query.filter(and_(
+                compare_or_equal(sort_column, marker_value),
+                or_(compare(sort_column, marker_value),
+                    compare(id_column, marker_id))))
+
+    query = query.order_by(sort_fn(sort_column), sort_fn(id_column))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2165,7 +2363,7 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def _instance_get_all_query(context, project_only=False,
-                            joins=None, use_slave=False):
+                            joins=None, use_slave=False, columns=None):
     if joins is None:
         joins = ['info_cache', 'security_groups']
 
@@ -2175,18 +2373,27 @@ def _instance_get_all_query(context, project_only=False,
                         use_slave=use_slave)
     for join in joins:
         query = query.options(joinedload(join))
-    return query
+    return _instance_defer_columns(query, columns)
 
 
 @require_admin_context
 def instance_get_all_by_host(context, host,
                              columns_to_join=None,
-                             use_slave=False):
+                             use_slave=False, columns=None,
+                             compact_metadata=False):
+    joins = None
+    if columns is not None:
+        # NOTE: Only the relationships which were asked for are joined when
+        # a subset of the columns is loaded.
+        joins = [column for column in columns_to_join or []
+                 if column in ('info_cache', 'security_groups')]
     return _instances_fill_metadata(context,
       _instance_get_all_query(context,
-                              use_slave=use_slave).filter_by(host=host).all(),
+                              use_slave=use_slave, joins=joins,
+                              columns=columns).filter_by(host=host).all(),
                               manual_joins=columns_to_join,
-                              use_slave=use_slave)
+                              use_slave=use_slave, columns=columns,
+                              compact_metadata=compact_metadata)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -3124,6 +3331,9 @@ def quota_usage_update(context, project_id, user_id, resource, **kwargs):
     for key in ['in_use', 'reserved', 'until_refresh']:
         if key in kwargs:
             updates[key] = kwargs[key]
+    # NOTE: Bump the generation, so that the concurrent optimistic
+    # reservations based on the previous usage fail.
+    updates['generation'] = models.QuotaUsage.generation + 1
 
     result = model_query(context, models.QuotaUsage, read_deleted="no").\
                      filter_by(project_id=project_id).\
@@ -3161,14 +3371,23 @@ def _reservation_create(uuid, usage, project_id, user_id, resource,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
+def _get_project_quota_usage_rows(context, session, project_id, lock=True):
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+                    filter_by(project_id=project_id)
+    if lock:
+        query = query.with_lockmode('update')
+    return query.all()
+
+
 def _get_project_user_quota_usages(context, session, project_id,
                                    user_id):
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   with_lockmode('update').\
-                   all()
+    rows = _get_project_quota_usage_rows(context, session, project_id)
+    return _sum_project_user_quota_usages(rows, user_id)
+
+
+def _sum_project_user_quota_usages(rows, user_id):
     proj_result = dict()
     user_result = dict()
     # Get the total count of in_use,reserved
@@ -3283,29 +3502,7 @@ def _raise_overquota_exception(project_quotas, user_quotas, deltas, overs,
         usages = user_usages
     usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
                   for k, v in usages.items())
-    headroom = dict((res, user_quotas[res] -
-                         (usages[res]['in_use'] + usages[res]['reserved']))
-                    for res in user_quotas.keys())
-
-    # If quota_cores is unlimited [-1]:
-    # - set cores headroom based on instances headroom:
-    if user_quotas.get('cores') == -1:
-        if deltas['cores']:
-            hc = headroom['instances'] * deltas['cores']
-            headroom['cores'] = hc / deltas['instances']
-        else:
-            headroom['cores'] = headroom['instances']
-
-    # If quota_ram is unlimited [-1]:
-    # - set ram headroom based on instances headroom:
-    if user_quotas.get('ram') == -1:
-        if deltas['ram']:
-            hr = headroom['instances'] * deltas['ram']
-            headroom['ram'] = hr / deltas['instances']
-        else:
-            headroom['ram'] = headroom['instances']
-    raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
-                              usages=usages, headroom=headroom)
+    quota.raise_over_quota(user_quotas, deltas, overs, usages)
 
 
 def _calculate_overquota(project_quotas, user_quotas, deltas,
@@ -3337,6 +3534,107 @@ def _calculate_overquota(project_quotas, user_quotas, deltas,
     return overs
 
 
+def _refresh_and_check_quota_usages(elevated, session, resources,
+                                    project_quotas, user_quotas, deltas,
+                                    until_refresh, max_age, project_id,
+                                    user_id, project_usages, user_usages):
+    """Refreshes the quota usages if needed and checks the deltas.
+
+    :return: A tuple of the list of resources whose usage would go below 0
+             and of the list of resources that are over-quota for the
+             operation.
+    """
+    # Handle usage refresh
+    work = set(deltas.keys())
+    while work:
+        resource = work.pop()
+
+        # Do we need to refresh the usage?
+        created = _create_quota_usage_if_missing(user_usages, resource,
+                                                 until_refresh, project_id,
+                                                 user_id, session)
+        refresh = created or _is_quota_refresh_needed(
+                                    user_usages[resource], max_age)
+
+        # OK, refresh the usage
+        if refresh:
+            # Grab the sync routine
+            sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+
+            updates = sync(elevated, project_id, user_id, session)
+            for res, in_use in updates.items():
+                # Make sure we have a destination for the usage!
+                _create_quota_usage_if_missing(user_usages, res,
+                                               until_refresh, project_id,
+                                               user_id, session)
+                _refresh_quota_usages(user_usages[res], until_refresh,
+                                      in_use)
+
+                # Because more than one resource may be refreshed
+                # by the call to the sync routine, and we don't
+                # want to double-sync, we make sure all refreshed
+                # resources are dropped from the work set.
+                work.discard(res)
+
+                # NOTE(Vek): We make the assumption that the sync
+                #            routine actually refreshes the
+                #            resources that it is the sync routine
+                #            for.  We don't check, because this is
+                #            a best-effort mechanism.
+
+    # Check for deltas that would go negative
+    unders = [res for res, delta in deltas.items()
+              if delta < 0 and
+              delta + user_usages[res].in_use < 0]
+
+    # Now, let's check the quotas
+    # NOTE(Vek): We're only concerned about positive increments.
+    #            If a project has gone over quota, we want them to
+    #            be able to reduce their usage without any
+    #            problems.
+    for key, value in user_usages.items():
+        if key not in project_usages:
+            project_usages[key] = value
+
+    overs = _calculate_overquota(project_quotas, user_quotas, deltas,
+                                 project_usages, user_usages)
+    return unders, overs
+
+
+def _create_reservations(session, user_usages, deltas, expire, project_id,
+                         user_id):
+    """Creates the reservations and updates the reserved quantities.
+
+    :return: The list of the UUIDs of the reservations created.
+    """
+    reservations = []
+    for res, delta in deltas.items():
+        reservation = _reservation_create(
+                                         str(uuid.uuid4()),
+                                         user_usages[res],
+                                         project_id,
+                                         user_id,
+                                         res, delta, expire,
+                                         session=session)
+        reservations.append(reservation.uuid)
+
+        # Also update the reserved quantity
+        # NOTE(Vek): Again, we are only concerned here about
+        #            positive increments.  Here, though, we're
+        #            worried about the following scenario:
+        #
+        #            1) User initiates resize down.
+        #            2) User allocates a new instance.
+        #            3) Resize down fails or is reverted.
+        #            4) User is now over quota.
+        #
+        #            To prevent this, we only update the
+        #            reserved value if the delta is positive.
+        if delta > 0:
+            user_usages[res].reserved += delta
+    return reservations
+
+
 @require_context
 @_retry_on_deadlock
 def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
@@ -3355,60 +3653,10 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
         project_usages, user_usages = _get_project_user_quota_usages(
                 context, session, project_id, user_id)
 
-        # Handle usage refresh
-        work = set(deltas.keys())
-        while work:
-            resource = work.pop()
-
-            # Do we need to refresh the usage?
-            created = _create_quota_usage_if_missing(user_usages, resource,
-                                                     until_refresh, project_id,
-                                                     user_id, session)
-            refresh = created or _is_quota_refresh_needed(
-                                        user_usages[resource], max_age)
-
-            # OK, refresh the usage
-            if refresh:
-                # Grab the sync routine
-                sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
-
-                updates = sync(elevated, project_id, user_id, session)
-                for res, in_use in updates.items():
-                    # Make sure we have a destination for the usage!
-                    _create_quota_usage_if_missing(user_usages, res,
-                                                   until_refresh, project_id,
-                                                   user_id, session)
-                    _refresh_quota_usages(user_usages[res], until_refresh,
-                                          in_use)
-
-                    # Because more than one resource may be refreshed
-                    # by the call to the sync routine, and we don't
-                    # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
-
-                    # NOTE(Vek): We make the assumption that the sync
-                    #            routine actually refreshes the
-                    #            resources that it is the sync routine
-                    #            for.  We don't check, because this is
-                    #            a best-effort mechanism.
-
-        # Check for deltas that would go negative
-        unders = [res for res, delta in deltas.items()
-                  if delta < 0 and
-                  delta + user_usages[res].in_use < 0]
-
-        # Now, let's check the quotas
-        # NOTE(Vek): We're only concerned about positive increments.
-        #            If a project has gone over quota, we want them to
-        #            be able to reduce their usage without any
-        #            problems.
-        for key, value in user_usages.items():
-            if key not in project_usages:
-                project_usages[key] = value
-
-        overs = _calculate_overquota(project_quotas, user_quotas, deltas,
-                                     project_usages, user_usages)
+        unders, overs = _refresh_and_check_quota_usages(
+                elevated, session, resources, project_quotas, user_quotas,
+                deltas, until_refresh, max_age, project_id, user_id,
+                project_usages, user_usages)
 
         # NOTE(Vek): The quota check needs to be in the transaction,
         #            but the transaction doesn't fail just because
@@ -3419,31 +3667,8 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
 
         # Create the reservations
         if not overs:
-            reservations = []
-            for res, delta in deltas.items():
-                reservation = _reservation_create(
-                                                 str(uuid.uuid4()),
-                                                 user_usages[res],
-                                                 project_id,
-                                                 user_id,
-                                                 res, delta, expire,
-                                                 session=session)
-                reservations.append(reservation.uuid)
-
-                # Also update the reserved quantity
-                # NOTE(Vek): Again, we are only concerned here about
-                #            positive increments.  Here, though, we're
-                #            worried about the following scenario:
-                #
-                #            1) User initiates resize down.
-                #            2) User allocates a new instance.
-                #            3) Resize down fails or is reverted.
-                #            4) User is now over quota.
-                #
-                #            To prevent this, we only update the
-                #            reserved value if the delta is positive.
-                if delta > 0:
-                    user_usages[res].reserved += delta
+            reservations = _create_reservations(session, user_usages, deltas,
+                                                expire, project_id, user_id)
 
         # Apply updates to the usages table
         for usage_ref in user_usages.values():
@@ -3460,15 +3685,149 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
     return reservations
 
 
-def _quota_reservations_query(session, context, reservations):
+def _quota_usage_compare_and_swap(context, session, usage_id, generation,
+                                  values):
+    """Updates a quota usage only if its generation is still the given one.
+
+    Raises QuotaUsageConflict if the quota usage was updated since.
+    """
+    values = dict(values, generation=generation + 1)
+    result = model_query(context, models.QuotaUsage, session=session,
+                         read_deleted="no").\
+                     filter_by(id=usage_id).\
+                     filter_by(generation=generation).\
+                     update(values, synchronize_session=False)
+    if not result:
+        raise exception.QuotaUsageConflict(usage_ids=[usage_id])
+
+
+def _retry_on_usage_conflict(max_attempts, f, *args):
+    """Calls f until it does not raise QuotaUsageConflict.
+
+    The last QuotaUsageConflict is raised after max_attempts calls.
+    """
+    attempt = 1
+    while True:
+        try:
+            return f(*args)
+        except exception.QuotaUsageConflict as e:
+            if attempt >= max_attempts:
+                raise
+            LOG.debug("%(func_name)s attempt %(attempt)d failed: %(err)s",
+                      {'func_name': f.__name__, 'attempt': attempt, 'err': e})
+            attempt += 1
+
+
+def _quota_reserve_optimistic(context, resources, project_quotas, user_quotas,
+                              deltas, expire, until_refresh, max_age,
+                              project_id, user_id):
+    elevated = context.elevated()
+    session = get_session()
+    with session.begin():
+        rows = _get_project_quota_usage_rows(context, session, project_id,
+                                             lock=False)
+        # NOTE: The rows are not locked, so they are detached from the
+        # session, and their changes are written back below with
+        # compare-and-swap updates rather than flushed.
+        read_values = {}
+        for row in rows:
+            read_values[row.id] = (row.generation, row.in_use, row.reserved,
+                                   row.until_refresh)
+            session.expunge(row)
+        project_usages, user_usages = _sum_project_user_quota_usages(
+                rows, user_id)
+
+        unders, overs = _refresh_and_check_quota_usages(
+                elevated, session, resources, project_quotas, user_quotas,
+                deltas, until_refresh, max_age, project_id, user_id,
+                project_usages, user_usages)
+
+        checked = set()
+        if not overs:
+            reservations = _create_reservations(session, user_usages, deltas,
+                                                expire, project_id, user_id)
+            # The check of the project quota was based on the usages of the
+            # other users of the project, so their generations are bumped
+            # too, for the check to fail if they were updated since.
+            checked = set(res for res, delta in deltas.items()
+                          if delta > 0 and user_quotas[res] >= 0)
+
+        user_usage_ids = set(usage.id for usage in user_usages.values())
+        # NOTE: The rows are always updated in the same order, so that the
+        # concurrent reservations can't deadlock.
+        for row in sorted(rows, key=lambda row: row.id):
+            generation = read_values[row.id][0]
+            if row.id in user_usage_ids:
+                values = (row.in_use, row.reserved, row.until_refresh)
+                if (row.resource in deltas or
+                        values != read_values[row.id][1:]):
+                    _quota_usage_compare_and_swap(
+                        context, session, row.id, generation,
+                        {'in_use': row.in_use, 'reserved': row.reserved,
+                         'until_refresh': row.until_refresh})
+            elif row.resource in checked:
+                _quota_usage_compare_and_swap(context, session, row.id,
+                                              generation, {})
+
+    if unders:
+        LOG.warning(_("Change will make usage less than 0 for the following "
+                      "resources: %s"), unders)
+
+    if overs:
+        _raise_overquota_exception(project_quotas, user_quotas, deltas, overs,
+                                   project_usages, user_usages)
+
+    return reservations
+
+
+@require_context
+@_retry_on_deadlock
+def quota_reserve_optimistic(context, resources, project_quotas, user_quotas,
+                             deltas, expire, until_refresh, max_age,
+                             project_id=None, user_id=None, max_attempts=10):
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    try:
+        return _retry_on_usage_conflict(
+                max_attempts, _quota_reserve_optimistic, context, resources,
+                project_quotas, user_quotas, deltas, expire, until_refresh,
+                max_age, project_id, user_id)
+    except exception.QuotaUsageConflict:
+        LOG.warning(_LW("Quota usages of project %(project_id)s updated "
+                        "concurrently during %(attempts)d attempts, locking "
+                        "them to reserve resources"),
+                    {'project_id': project_id, 'attempts': max_attempts})
+    return quota_reserve(context, resources, project_quotas, user_quotas,
+                         deltas, expire, until_refresh, max_age,
+                         project_id=project_id, user_id=user_id)
+
+
+@require_context
+def quota_usage_count(context, resources, project_id, user_id=None):
+    elevated = context.elevated()
+    session = get_session()
+    usages = {}
+    with session.begin():
+        for sync in set(resource.sync for resource in resources.values()):
+            usages.update(QUOTA_SYNC_FUNCTIONS[sync](elevated, project_id,
+                                                     user_id, session))
+    return usages
+
+
+def _quota_reservations_query(session, context, reservations, lock=True):
     """Return the relevant reservations."""
 
     # Get the listed reservations
-    return model_query(context, models.Reservation,
-                       read_deleted="no",
-                       session=session).\
-                   filter(models.Reservation.uuid.in_(reservations)).\
-                   with_lockmode('update')
+    query = model_query(context, models.Reservation,
+                        read_deleted="no",
+                        session=session).\
+                    filter(models.Reservation.uuid.in_(reservations))
+    if lock:
+        query = query.with_lockmode('update')
+    return query
 
 
 @require_context
@@ -3504,6 +3863,70 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+def _reservation_release_optimistic(context, reservations, commit):
+    session = get_session()
+    with session.begin():
+        reservation_query = _quota_reservations_query(session, context,
+                                                      reservations,
+                                                      lock=False)
+        rows = reservation_query.all()
+        changes = {}
+        for reservation in rows:
+            reserved, in_use = changes.get(reservation.usage_id, (0, 0))
+            if reservation.delta >= 0:
+                reserved -= reservation.delta
+            if commit:
+                in_use += reservation.delta
+            changes[reservation.usage_id] = (reserved, in_use)
+
+        # NOTE: The reservations released concurrently are not counted, so
+        # that they can't be released twice.
+        if (reservation_query.soft_delete(synchronize_session=False) !=
+                len(rows)):
+            raise exception.QuotaUsageConflict(
+                usage_ids=sorted(changes))
+
+        # The usages are changed relatively to their current values, so
+        # there is no need to compare them, but their generations are
+        # bumped for the concurrent optimistic reservations to fail.
+        usage = models.QuotaUsage
+        for usage_id in sorted(changes):
+            reserved, in_use = changes[usage_id]
+            model_query(context, usage, session=session,
+                        read_deleted="no").\
+                    filter_by(id=usage_id).\
+                    update({'reserved': usage.reserved + reserved,
+                            'in_use': usage.in_use + in_use,
+                            'generation': usage.generation + 1},
+                           synchronize_session=False)
+
+
+@require_context
+@_retry_on_deadlock
+def reservation_commit_optimistic(context, reservations, project_id=None,
+                                  user_id=None, max_attempts=10):
+    try:
+        _retry_on_usage_conflict(max_attempts,
+                                 _reservation_release_optimistic,
+                                 context, reservations, True)
+    except exception.QuotaUsageConflict:
+        reservation_commit(context, reservations, project_id=project_id,
+                           user_id=user_id)
+
+
+@require_context
+@_retry_on_deadlock
+def reservation_rollback_optimistic(context, reservations, project_id=None,
+                                    user_id=None, max_attempts=10):
+    try:
+        _retry_on_usage_conflict(max_attempts,
+                                 _reservation_release_optimistic,
+                                 context, reservations, False)
+    except exception.QuotaUsageConflict:
+        reservation_rollback(context, reservations, project_id=project_id,
+                             user_id=user_id)
+
+
 @require_admin_context
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     session = get_session()
@@ -4036,11 +4459,12 @@ def security_group_destroy(context, security_group_id):
 def _security_group_count_by_project_and_user(context, project_id, user_id,
                                              session=None):
     nova.context.authorize_project_context(context, project_id)
-    return model_query(context, models.SecurityGroup, read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   filter_by(user_id=user_id).\
-                   count()
+    query = model_query(context, models.SecurityGroup, read_deleted="no",
+                        session=session).\
+                    filter_by(project_id=project_id)
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    return query.count()
 
 
 ###################
@@ -5279,6 +5703,28 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return dict(metadata)
 
 
+def aggregate_metadata_get_all_by_host(context):
+    query = model_query(context, models.AggregateHost.host,
+                        models.AggregateMetadata.key,
+                        models.AggregateMetadata.value,
+                        base_model=models.AggregateHost)
+    query = query.join(models.AggregateMetadata,
+                       models.AggregateMetadata.aggregate_id ==
+                       models.AggregateHost.aggregate_id)
+    query = query.join(models.Aggregate,
+                       models.Aggregate.id ==
+                       models.AggregateHost.aggregate_id)
+    query = query.filter(models.AggregateMetadata.deleted == 0)
+    query = query.filter(models.Aggregate.deleted == 0)
+
+    metadata = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+    for host, key, value in query.all():
+        metadata[host][key].add(value)
+    return dict((host, dict(host_metadata))
+                for host, host_metadata in metadata.iteritems())
+
+
 def aggregate_metadata_get_by_metadata_key(context, aggregate_id, key):
     query = model_query(context, models.Aggregate)
     query = query.join("_metadata")
@@ -6033,11 +6479,12 @@ def instance_group_get_all_by_project_id(context, project_id):
 
 def _instance_group_count_by_project_and_user(context, project_id,
                                               user_id, session=None):
-    return model_query(context, models.InstanceGroup, read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   filter_by(user_id=user_id).\
-                   count()
+    query = model_query(context, models.InstanceGroup, read_deleted="no",
+                        session=session).\
+                    filter_by(project_id=project_id)
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    return query.count()
 
 
 def _instance_group_model_get_query(context, model_class, group_id,
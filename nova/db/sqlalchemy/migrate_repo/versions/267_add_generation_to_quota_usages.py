@@ -0,0 +1,50 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+
+
+def upgrade(engine):
+    """Function adds generation field."""
+    meta = MetaData(bind=engine)
+
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    shadow_quota_usages = Table('shadow_quota_usages', meta, autoload=True)
+    generation = Column('generation', Integer, nullable=False,
+                        server_default='0', default=0)
+
+    if not hasattr(quota_usages.c, 'generation'):
+        quota_usages.create_column(generation)
+
+    if not hasattr(shadow_quota_usages.c, 'generation'):
+        shadow_quota_usages.create_column(generation.copy())
+
+
+def downgrade(engine):
+    """Function drops generation field."""
+    meta = MetaData(bind=engine)
+
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    shadow_quota_usages = Table('shadow_quota_usages', meta, autoload=True)
+
+    if hasattr(quota_usages.c, 'generation'):
+        quota_usages.c.generation.drop()
+
+    if hasattr(shadow_quota_usages.c, 'generation'):
+        shadow_quota_usages.c.generation.drop()
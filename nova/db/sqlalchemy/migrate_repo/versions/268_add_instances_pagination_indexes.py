@@ -0,0 +1,65 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+from nova.i18n import _LI
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Based on the pagination of instance_get_all_by_filters, which seeks on
+# (created_at, id) among the instances not deleted, of all the projects or
+# of one project.
+INDEXES = [
+    ('instances_deleted_created_at_id_idx',
+     ['deleted', 'created_at', 'id']),
+    ('instances_project_id_deleted_created_at_id_idx',
+     ['project_id', 'deleted', 'created_at', 'id']),
+]
+
+
+def _get_index(table, members):
+    for idx in table.indexes:
+        if idx.columns.keys() == members:
+            return idx
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    for name, members in INDEXES:
+        if _get_index(instances, members):
+            LOG.info(_LI('Skipped adding %s because an equivalent index '
+                         'already exists.'), name)
+            continue
+        index = Index(name, *[instances.c[member] for member in members])
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    for name, members in INDEXES:
+        index = _get_index(instances, members)
+        if index:
+            index.drop(migrate_engine)
+        else:
+            LOG.info(_LI('Skipped removing %s because index does not '
+                         'exist.'), name)
@@ -135,6 +135,10 @@ class ComputeNode(BASE, NovaBase):
     # nova.virt.hardware.VirtNUMAHostTopology.to_json()
     numa_topology = Column(Text)
 
+    # Incremented on each update of the compute node, used by the schedulers
+    # to claim resources with a compare-and-swap.
+    generation = Column(Integer, nullable=False, default=0)
+
 
 class Certificate(BASE, NovaBase):
     """Represents a x509 certificate."""
@@ -168,6 +172,10 @@ class Instance(BASE, NovaBase):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_deleted_created_at_id_idx',
+              'deleted', 'created_at', 'id'),
+        Index('instances_project_id_deleted_created_at_id_idx',
+              'project_id', 'deleted', 'created_at', 'id'),
     )
     injected_files = []
 
@@ -488,6 +496,12 @@ class QuotaUsage(BASE, NovaBase):
 
     until_refresh = Column(Integer)
 
+    # Incremented on each update of the usage, used by the optimistic
+    # reservations to update it with a compare-and-swap. The ORM checks and
+    # increments it when flushing the changes of a QuotaUsage.
+    generation = Column(Integer, nullable=False, default=0)
+    __mapper_args__ = {'version_id_col': generation}
+
 
 class Reservation(BASE, NovaBase):
     """Represents a resource reservation for quotas."""
@@ -855,6 +855,11 @@ class ComputeHostNotCreated(HostNotFound):
                 " before updating.")
 
 
+class ComputeNodeClaimConflict(NovaException):
+    msg_fmt = _("Compute node %(compute_id)s was updated concurrently, "
+                "its generation is not %(generation)s anymore.")
+
+
 class HostBinaryNotFound(NotFound):
     msg_fmt = _("Could not find binary %(binary)s on host %(host)s.")
 
@@ -902,6 +907,10 @@ class QuotaUsageNotFound(QuotaNotFound):
     msg_fmt = _("Quota usage for project %(project_id)s could not be found.")
 
 
+class QuotaUsageConflict(NovaException):
+    msg_fmt = _("Quota usages %(usage_ids)s were updated concurrently.")
+
+
 class ReservationNotFound(QuotaNotFound):
     msg_fmt = _("Quota reservation %(uuid)s could not be found.")
 
@@ -17,6 +17,10 @@
 Filter support
 """
 
+import time
+
+import six
+
 from nova.i18n import _
 from nova import loadables
 from nova.openstack.common import log as logging
@@ -58,28 +62,126 @@ class BaseFilter(object):
             return True
 
 
+class FilterStats(object):
+    """Execution time and rejection rate observed for each filter.
+
+    Used to run the cheap and selective filters first. Only the filters
+    deciding on each object independently, that is the ones not overriding
+    filter_all(), are reordered: the others keep their position, so that
+    they always see the same objects and the result of the filtering does
+    not depend on the order.
+    """
+
+    def __init__(self):
+        # Maps filter class names to [calls, objects in, objects out,
+        # seconds] lists.
+        self._stats = {}
+
+    def record(self, name, num_in, num_out, elapsed):
+        stats = self._stats.setdefault(name, [0, 0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += num_in
+        stats[2] += num_out
+        stats[3] += elapsed
+
+    def rank(self, filter_cls):
+        """Return the expected cost to reject an object with this filter.
+
+        Filters which were not run yet are ranked first, so that they get
+        measured.
+        """
+        stats = self._stats.get(filter_cls.__name__)
+        if not stats or not stats[1]:
+            return 0.0
+        rejection_rate = 1.0 - float(stats[2]) / stats[1]
+        if rejection_rate <= 0:
+            return float('inf')
+        return stats[3] / stats[1] / rejection_rate
+
+    @staticmethod
+    def reorderable(filter_cls):
+        return (six.get_unbound_function(filter_cls.filter_all) is
+                six.get_unbound_function(BaseFilter.filter_all))
+
+    def order(self, filter_classes):
+        """Return the filter classes sorted by rank, where it is safe."""
+        ordered = []
+        run = []
+        for filter_cls in filter_classes:
+            if self.reorderable(filter_cls):
+                run.append(filter_cls)
+                continue
+            ordered.extend(sorted(run, key=self.rank))
+            ordered.append(filter_cls)
+            run = []
+        ordered.extend(sorted(run, key=self.rank))
+        return ordered
+
+    def to_dict(self):
+        result = {}
+        for name, (calls, num_in, num_out, elapsed) in self._stats.items():
+            result[name] = {
+                'calls': calls,
+                'objects_in': num_in,
+                'objects_out': num_out,
+                'seconds': elapsed,
+                'rejection_rate': (1.0 - float(num_out) / num_in
+                                   if num_in else 0.0),
+            }
+        return result
+
+
 class BaseFilterHandler(loadables.BaseLoader):
     """Base class to handle loading filter classes.
 
     This class should be subclassed where one needs to use filters.
     """
 
+    def __init__(self, *args, **kwargs):
+        self.filter_stats = FilterStats()
+        super(BaseFilterHandler, self).__init__(*args, **kwargs)
+
+    def adaptive_order_enabled(self):
+        """Return True to order the filters by their observed stats.
+
+        Override this in a subclass to enable the adaptive order.
+        """
+        return False
+
+    def filter_finished(self, cls_name, num_in, num_out, elapsed):
+        """Called after each filter run, with the number of objects it got
+        and returned, and the seconds it took.
+        Override this in a subclass to instrument the filters.
+        """
+        pass
+
     def get_filtered_objects(self, filter_classes, objs,
             filter_properties, index=0):
         list_objs = list(objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
+        adaptive = self.adaptive_order_enabled()
+        if adaptive:
+            filter_classes = self.filter_stats.order(filter_classes)
         for filter_cls in filter_classes:
             cls_name = filter_cls.__name__
             filter = filter_cls()
 
             if filter.run_filter_for_index(index):
+                start = time.time()
                 objs = filter.filter_all(list_objs,
                                                filter_properties)
                 if objs is None:
                     LOG.debug("Filter %(cls_name)s says to stop filtering",
                               {'cls_name': cls_name})
                     return
+                num_in = len(list_objs)
                 list_objs = list(objs)
+                elapsed = time.time() - start
+                if adaptive:
+                    self.filter_stats.record(cls_name, num_in,
+                                             len(list_objs), elapsed)
+                self.filter_finished(cls_name, num_in, len(list_objs),
+                                     elapsed)
                 if not list_objs:
                     LOG.info(_("Filter %s returned 0 hosts"), cls_name)
                     break
@@ -58,6 +58,29 @@ def _expected_cols(expected_attrs):
                  if attr in _INSTANCE_OPTIONAL_JOINED_FIELDS]
 
 
+def _load_columns(load_fields):
+    """Return the columns to load for load_fields, None for all of them."""
+    if load_fields is None:
+        return None
+    return ['id', 'uuid'] + [field for field in load_fields
+                             if field not in INSTANCE_OPTIONAL_ATTRS]
+
+
+def _get_all_kwargs(expected_attrs, load_fields):
+    """Return the keyword arguments of the db API listing the instances.
+
+    The columns are only restricted if load_fields is given, and the
+    metadata are only fetched as key/value dicts if they are expected.
+    """
+    kwargs = {}
+    if load_fields is not None:
+        kwargs['columns'] = _load_columns(load_fields)
+    if expected_attrs and ('metadata' in expected_attrs or
+                           'system_metadata' in expected_attrs):
+        kwargs['compact_metadata'] = True
+    return kwargs
+
+
 class Instance(base.NovaPersistentObject, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Added info_cache
@@ -264,18 +287,24 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         return base_name
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        load_fields=None):
         """Method to help with migration to objects.
 
-        Converts a database entity to a formal object.
+        Converts a database entity to a formal object. If load_fields is
+        given, only these fields were loaded from the database, and the
+        other ones are lazy-loaded.
         """
         instance._context = context
         if expected_attrs is None:
             expected_attrs = []
+        columns = _load_columns(load_fields)
         # Most of the field names match right now, so be quick
         for field in instance.fields:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
+            elif columns is not None and field not in columns:
+                continue
             elif field == 'deleted':
                 instance.deleted = db_inst['deleted'] == db_inst['id']
             elif field == 'cleaned':
@@ -558,6 +587,19 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                 action='obj_load_attr',
                 reason='loading %s requires recursion' % attrname)
 
+    def _load_deferred_columns(self):
+        # NOTE: The fields left out by the query which loaded this
+        # instance are all loaded at once, rather than one query each.
+        instance = self.__class__.get_by_uuid(self._context,
+                                              uuid=self.uuid,
+                                              expected_attrs=[])
+        loaded = [field for field in self.fields
+                  if field not in INSTANCE_OPTIONAL_ATTRS and
+                  not self.obj_attr_is_set(field)]
+        for field in loaded:
+            self[field] = instance[field]
+        self.obj_reset_changes(loaded)
+
     def _load_fault(self):
         self.fault = objects.InstanceFault.get_latest_for_instance(
             self._context, self.uuid)
@@ -576,7 +618,14 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                 self._context, self.uuid)
 
     def obj_load_attr(self, attrname):
-        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+        # NOTE: The columns left out by load_fields are loaded for the
+        # instances read from the database, which have an id and a uuid.
+        # Which ones were left out is not serialized, so it can't be told
+        # apart from a column which was never set.
+        if (attrname not in INSTANCE_OPTIONAL_ATTRS and
+                (attrname not in self.fields or
+                 not self.obj_attr_is_set('id') or
+                 not self.obj_attr_is_set('uuid'))):
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='attribute %s not lazy-loadable' % attrname)
@@ -592,7 +641,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
 
         # NOTE(danms): We handle some fields differently here so that we
         # can be more efficient
-        if attrname == 'fault':
+        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+            self._load_deferred_columns()
+        elif attrname == 'fault':
             self._load_fault()
         elif attrname == 'numa_topology':
             self._load_numa_topology()
@@ -643,7 +694,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
             self.obj_reset_changes(['metadata'])
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        load_fields=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -660,7 +712,7 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     for db_inst in db_inst_list:
         inst_obj = objects.Instance._from_db_object(
                 context, objects.Instance(context), db_inst,
-                expected_attrs=expected_attrs)
+                expected_attrs=expected_attrs, load_fields=load_fields)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
@@ -681,7 +733,8 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.8: Instance <= version 1.14
     # Version 1.9: Instance <= version 1.15
     # Version 1.10: Instance <= version 1.16
-    VERSION = '1.10'
+    # Version 1.11: Added load_fields to get_by_filters and get_by_host
+    VERSION = '1.11'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -698,26 +751,43 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         '1.8': '1.14',
         '1.9': '1.15',
         '1.10': '1.16',
+        '1.11': '1.16',
         }
 
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None, use_slave=False):
+                       marker=None, expected_attrs=None, use_slave=False,
+                       load_fields=None):
+        """Get the instances matching the filters.
+
+        If load_fields is given, only these fields of the instances are
+        loaded, along with their id and uuid, and the other ones are
+        lazy-loaded when needed.
+        """
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
             columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            use_slave=use_slave,
+            **_get_all_kwargs(expected_attrs, load_fields))
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, load_fields=load_fields)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
+    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False,
+                    load_fields=None):
+        """Get the instances of a host.
+
+        If load_fields is given, only these fields of the instances are
+        loaded, along with their id and uuid, and the other ones are
+        lazy-loaded when needed.
+        """
         db_inst_list = db.instance_get_all_by_host(
             context, host, columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            use_slave=use_slave,
+            **_get_all_kwargs(expected_attrs, load_fields))
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, load_fields=load_fields)
 
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
@@ -14,8 +14,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import copy
-
 from oslo.serialization import jsonutils
 
 from nova import exception
@@ -58,20 +56,35 @@ class PciDeviceStats(object):
         super(PciDeviceStats, self).__init__()
         self.pools = jsonutils.loads(stats) if stats else []
         self.pools.sort(self.pool_cmp)
+        self._reindex()
+
+    def _reindex(self):
+        """Rebuild the pool indexes, after a pool was added or removed.
+
+        Pools are indexed by their properties, (vendor_id, product_id) and
+        the whitelist tags, and by (vendor_id, product_id) alone, so that
+        finding the pools of a device or of a request does not depend on
+        the number of pools. The pools matching each request spec are
+        memoized until the pools change.
+        """
+        self._pools_by_key = {}
+        self._pools_by_product = {}
+        self._pool_positions = {}
+        self._spec_pools = {}
+        for position, pool in enumerate(self.pools):
+            self._pools_by_key.setdefault(self._pool_key(pool), pool)
+            product = (pool.get('vendor_id'), pool.get('product_id'))
+            self._pools_by_product.setdefault(product, []).append(pool)
+            self._pool_positions[id(pool)] = position
 
-    def _equal_properties(self, dev, entry, matching_keys):
-        return all(dev.get(prop) == entry.get(prop)
-                   for prop in matching_keys)
+    @staticmethod
+    def _pool_key(pool):
+        return tuple(sorted((k, v) for k, v in pool.iteritems()
+                            if k not in ('count', 'devices')))
 
     def _find_pool(self, dev_pool):
         """Return the first pool that matches dev."""
-        for pool in self.pools:
-            pool_keys = pool.copy()
-            del pool_keys['count']
-            del pool_keys['devices']
-            if (len(pool_keys.keys()) == len(dev_pool.keys()) and
-                self._equal_properties(dev_pool, pool_keys, dev_pool.keys())):
-                return pool
+        return self._pools_by_key.get(self._pool_key(dev_pool))
 
     def _create_pool_keys_from_dev(self, dev):
         """create a stats pool dict that this dev is supposed to be part of
@@ -100,22 +113,23 @@ class PciDeviceStats(object):
                 dev_pool['devices'] = []
                 self.pools.append(dev_pool)
                 self.pools.sort(self.pool_cmp)
+                self._reindex()
                 pool = dev_pool
             pool['count'] += 1
             pool['devices'].append(dev)
 
-    @staticmethod
-    def _decrease_pool_count(pool_list, pool, count=1):
+    def _decrease_pool_count(self, pool, count=1):
         """Decrement pool's size by count.
 
-        If pool becomes empty, remove pool from pool_list.
+        If pool becomes empty, remove pool from the pools.
         """
         if pool['count'] > count:
             pool['count'] -= count
             count = 0
         else:
             count -= pool['count']
-            pool_list.remove(pool)
+            self.pools.remove(pool)
+            self._reindex()
         return count
 
     def remove_device(self, dev):
@@ -127,7 +141,7 @@ class PciDeviceStats(object):
                 raise exception.PciDevicePoolEmpty(
                     compute_node_id=dev.compute_node_id, address=dev.address)
             pool['devices'].remove(dev)
-            self._decrease_pool_count(self.pools, pool)
+            self._decrease_pool_count(pool)
 
     def get_free_devs(self):
         free_devs = []
@@ -142,7 +156,7 @@ class PciDeviceStats(object):
             spec = request.spec
             # For now, keep the same algorithm as during scheduling:
             # a spec may be able to match multiple pools.
-            pools = self._filter_pools_for_spec(self.pools, spec)
+            pools = self._filter_pools_for_spec(spec)
             # Failed to allocate the required number of devices
             # Return the devices already allocated back to their pools
             if sum([pool['count'] for pool in pools]) < count:
@@ -171,21 +185,55 @@ class PciDeviceStats(object):
                     break
         return alloc_devices
 
-    @staticmethod
-    def _filter_pools_for_spec(pools, request_specs):
-        return [pool for pool in pools
-                if utils.pci_device_prop_match(pool, request_specs)]
-
-    def _apply_request(self, pools, request):
+    def _filter_pools_for_spec(self, request_specs):
+        """Return the pools matching any of the specs, in the pools order."""
+        key = tuple(tuple(sorted(spec.iteritems())) for spec in request_specs)
+        pools = self._spec_pools.get(key)
+        if pools is None:
+            matching = {}
+            for spec in request_specs:
+                product = (spec.get('vendor_id'), spec.get('product_id'))
+                if None in product:
+                    candidates = self.pools
+                else:
+                    candidates = self._pools_by_product.get(product, [])
+                for pool in candidates:
+                    if utils.pci_device_prop_match(pool, [spec]):
+                        matching[id(pool)] = pool
+            pools = sorted(matching.values(),
+                           key=lambda pool: self._pool_positions[id(pool)])
+            self._spec_pools[key] = pools
+        return pools
+
+    def _apply_request(self, request, consumed=None):
+        """Take the devices of a request from the matching pools.
+
+        Return False, without taking any device, if the pools do not have
+        enough free devices. If consumed is given, the pools are left
+        untouched and the number of devices taken from each pool is
+        recorded in it instead, keyed by the id of the pool.
+        """
         count = request.count
-        matching_pools = self._filter_pools_for_spec(pools, request.spec)
-        if sum([pool['count'] for pool in matching_pools]) < count:
-            return False
+        matching_pools = self._filter_pools_for_spec(request.spec)
+        if consumed is None:
+            free = sum([pool['count'] for pool in matching_pools])
         else:
-            for pool in matching_pools:
-                count = self._decrease_pool_count(pools, pool, count)
-                if not count:
-                    break
+            free = sum([pool['count'] - consumed.get(id(pool), 0)
+                        for pool in matching_pools])
+        if free < count:
+            return False
+        # NOTE: iterate over a copy, pools emptied by the request are
+        # removed from the matching pools.
+        for pool in list(matching_pools):
+            if consumed is None:
+                count = self._decrease_pool_count(pool, count)
+            else:
+                num_alloc = min(pool['count'] - consumed.get(id(pool), 0),
+                                count)
+                consumed[id(pool)] = consumed.get(id(pool), 0) + num_alloc
+                count -= num_alloc
+            if not count:
+                break
         return True
 
     def support_requests(self, requests):
@@ -197,8 +245,8 @@ class PciDeviceStats(object):
         """
         # note (yjiang5): this function has high possibility to fail,
         # so no exception should be triggered for performance reason.
-        pools = copy.deepcopy(self.pools)
-        return all([self._apply_request(pools, r) for r in requests])
+        consumed = {}
+        return all([self._apply_request(r, consumed) for r in requests])
 
     def apply_requests(self, requests):
         """Apply PCI requests to the PCI stats.
@@ -206,7 +254,7 @@ class PciDeviceStats(object):
         This is used in multiple instance creation, when the scheduler has to
         maintain how the resources are consumed by the instances.
         """
-        if not all([self._apply_request(self.pools, r) for r in requests]):
+        if not all([self._apply_request(r) for r in requests]):
             raise exception.PciDeviceRequestFailed(requests=requests)
 
     @staticmethod
@@ -224,3 +272,4 @@ class PciDeviceStats(object):
     def clear(self):
         """Clear all the stats maintained."""
         self.pools = []
+        self._reindex()
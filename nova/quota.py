@@ -90,12 +90,51 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='Default driver to use for quota checks'),
+    cfg.IntOpt('quota_usage_update_attempts',
+               default=10,
+               help='Number of attempts of nova.quota.OptimisticDbQuotaDriver '
+                    'to update the quota usages updated concurrently, before '
+                    'locking them'),
+    cfg.IntOpt('quota_usage_cache_ttl',
+               default=2,
+               help='Number of seconds nova.quota.CountingQuotaDriver caches '
+                    'the usages counted for a project, 0 to count them for '
+                    'each request'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
 
 
+def raise_over_quota(quotas, deltas, overs, usages):
+    """Generates and raises an OverQuota exception.
+
+    :param quotas: dict of resource quotas (limits) for the user.
+    :param deltas: dict of resource keys to positive/negative quota
+                   changes for the resources in a given operation.
+    :param overs:  list of resources that are over-quota for the
+                   operation.
+    :param usages: dict of resource keys to dicts of the 'in_use' and
+                   'reserved' usages of the resources.
+    :raises:       nova.exception.OverQuota
+    """
+    headroom = dict((res, quotas[res] -
+                          (usages[res]['in_use'] + usages[res]['reserved']))
+                    for res in quotas)
+
+    # The headroom of the unlimited cores and ram is the one of the
+    # instances, as the compute API bounds the instances with it.
+    for res in ('cores', 'ram'):
+        if quotas.get(res) == DbQuotaDriver.UNLIMITED_VALUE:
+            if deltas.get(res) and deltas.get('instances'):
+                headroom[res] = (headroom['instances'] * deltas[res] /
+                                 deltas['instances'])
+            else:
+                headroom[res] = headroom.get('instances')
+    raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
+                              usages=usages, headroom=headroom)
+
+
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain
     quota information.  The default driver utilizes the local
@@ -541,6 +580,11 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
+        return self._quota_reserve(context, resources, quotas, user_quotas,
+                                   deltas, expire, project_id, user_id)
+
+    def _quota_reserve(self, context, resources, quotas, user_quotas, deltas,
+                       expire, project_id, user_id):
         return db.quota_reserve(context, resources, quotas, user_quotas,
                                 deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
@@ -566,6 +610,9 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
+        self._reservation_commit(context, reservations, project_id, user_id)
+
+    def _reservation_commit(self, context, reservations, project_id, user_id):
         db.reservation_commit(context, reservations, project_id=project_id,
                               user_id=user_id)
 
@@ -589,6 +636,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
+        self._reservation_rollback(context, reservations, project_id,
+                                   user_id)
+
+    def _reservation_rollback(self, context, reservations, project_id,
+                              user_id):
         db.reservation_rollback(context, reservations, project_id=project_id,
                                 user_id=user_id)
 
@@ -654,6 +706,216 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class OptimisticDbQuotaDriver(DbQuotaDriver):
+    """Database driver reserving resources without locking the quota usages.
+
+    DbQuotaDriver locks all the quota usages of the project with SELECT ...
+    FOR UPDATE, which serializes the reservations of a project. This driver
+    reads them without locking and updates them with compare-and-swap
+    updates on their generation, the reservations are attempted again when
+    the quota usages were updated concurrently.
+    """
+
+    def _quota_reserve(self, context, resources, quotas, user_quotas, deltas,
+                       expire, project_id, user_id):
+        return db.quota_reserve_optimistic(
+            context, resources, quotas, user_quotas, deltas, expire,
+            CONF.until_refresh, CONF.max_age, project_id=project_id,
+            user_id=user_id, max_attempts=CONF.quota_usage_update_attempts)
+
+    def _reservation_commit(self, context, reservations, project_id, user_id):
+        db.reservation_commit_optimistic(
+            context, reservations, project_id=project_id, user_id=user_id,
+            max_attempts=CONF.quota_usage_update_attempts)
+
+    def _reservation_rollback(self, context, reservations, project_id,
+                              user_id):
+        db.reservation_rollback_optimistic(
+            context, reservations, project_id=project_id, user_id=user_id,
+            max_attempts=CONF.quota_usage_update_attempts)
+
+
+class CountingQuotaDriver(DbQuotaDriver):
+    """Database driver counting the usages of the resources on demand.
+
+    The usages are counted from the database by the usage synchronization
+    functions of the resources, rather than tracked in the quota_usages
+    table, so no reservation is created, and there is nothing to commit,
+    roll back or expire. The usages of a project are cached for
+    quota_usage_cache_ttl seconds, and the resources reserved meanwhile are
+    added to the cached usages.
+
+    Since nothing is reserved in the database, concurrent requests handled
+    by different services may exceed the quota of a project by the
+    resources they request.
+    """
+
+    def __init__(self):
+        # Maps project IDs to the time their cached usages expire and to a
+        # dictionary of the usages of the project, keyed by None, and of
+        # its users, keyed by their ID.
+        self._usages = {}
+        self._pruned_at = 0
+
+    def _prune_usages(self, now):
+        if now - self._pruned_at < CONF.quota_usage_cache_ttl:
+            return
+        self._pruned_at = now
+        for project_id, (expires, usages) in self._usages.items():
+            if expires <= now:
+                del self._usages[project_id]
+
+    def _get_usages(self, context, resources, project_id, user_id=None):
+        now = timeutils.utcnow_ts()
+        expires, usages = self._usages.get(project_id, (None, None))
+        if expires is None or expires <= now:
+            self._prune_usages(now)
+            usages = {}
+            if CONF.quota_usage_cache_ttl > 0:
+                self._usages[project_id] = (now + CONF.quota_usage_cache_ttl,
+                                            usages)
+        if user_id not in usages:
+            resources = dict((name, resource)
+                             for name, resource in resources.items()
+                             if hasattr(resource, 'sync'))
+            usages[user_id] = db.quota_usage_count(context, resources,
+                                                   project_id,
+                                                   user_id=user_id)
+        return usages[user_id]
+
+    def _forget_usages(self, project_id):
+        self._usages.pop(project_id, None)
+
+    def _add_usages(self, project_id, user_id, deltas):
+        expires, usages = self._usages.get(project_id, (None, {}))
+        for key in (None, user_id):
+            if key in usages:
+                for res, delta in deltas.items():
+                    if delta > 0:
+                        usages[key][res] = usages[key].get(res, 0) + delta
+
+    def _with_usages(self, quotas, usages):
+        for res, quota in quotas.items():
+            quota.update(in_use=usages.get(res, 0), reserved=0)
+        return quotas
+
+    def get_user_quotas(self, context, resources, project_id, user_id,
+                        quota_class=None, defaults=True,
+                        usages=True, project_quotas=None,
+                        user_quotas=None):
+        """Given a list of resources, retrieve the quotas for the given
+        user and project.
+
+        See DbQuotaDriver.get_user_quotas(), the usages are counted.
+        """
+        quotas = super(CountingQuotaDriver, self).get_user_quotas(
+            context, resources, project_id, user_id, quota_class=quota_class,
+            defaults=defaults, usages=False, project_quotas=project_quotas,
+            user_quotas=user_quotas)
+        if usages:
+            quotas = self._with_usages(quotas, self._get_usages(
+                context, resources, project_id, user_id=user_id))
+        return quotas
+
+    def get_project_quotas(self, context, resources, project_id,
+                           quota_class=None, defaults=True,
+                           usages=True, remains=False, project_quotas=None):
+        """Given a list of resources, retrieve the quotas for the given
+        project.
+
+        See DbQuotaDriver.get_project_quotas(), the usages are counted.
+        """
+        quotas = super(CountingQuotaDriver, self).get_project_quotas(
+            context, resources, project_id, quota_class=quota_class,
+            defaults=defaults, usages=False, remains=remains,
+            project_quotas=project_quotas)
+        if usages:
+            quotas = self._with_usages(quotas, self._get_usages(
+                context, resources, project_id))
+        return quotas
+
+    def reserve(self, context, resources, deltas, expire=None,
+                project_id=None, user_id=None):
+        """Check quotas against the counted usages.
+
+        If any of the proposed values is over the defined quota, an
+        OverQuota exception will be raised with the sorted list of the
+        resources which are too high.  Otherwise, an empty list of
+        reservations is returned, as nothing is reserved.
+
+        See DbQuotaDriver.reserve() for the parameters, expire is ignored.
+        """
+        _valid_method_call_check_resources(deltas, 'reserve')
+
+        if project_id is None:
+            project_id = context.project_id
+        if user_id is None:
+            user_id = context.user_id
+
+        project_quotas = db.quota_get_all_by_project(context, project_id)
+        quotas = self._get_quotas(context, resources, deltas.keys(),
+                                  has_sync=True, project_id=project_id,
+                                  project_quotas=project_quotas)
+        user_quotas = self._get_quotas(context, resources, deltas.keys(),
+                                       has_sync=True, project_id=project_id,
+                                       user_id=user_id,
+                                       project_quotas=project_quotas)
+        project_usages = self._get_usages(context, resources, project_id)
+        user_usages = self._get_usages(context, resources, project_id,
+                                       user_id=user_id)
+
+        # NOTE: As DbQuotaDriver, only the positive deltas are checked, a
+        # project over quota must be able to reduce its usage.
+        overs = []
+        for res, delta in deltas.items():
+            if user_quotas[res] >= 0 and delta >= 0:
+                if quotas[res] < delta + project_usages.get(res, 0):
+                    overs.append(res)
+                elif user_quotas[res] < delta + user_usages.get(res, 0):
+                    overs.append(res)
+        if overs:
+            if quotas == user_quotas:
+                usages = project_usages
+            else:
+                usages = user_usages
+            usages = dict((res, dict(in_use=usages.get(res, 0), reserved=0))
+                          for res in user_quotas)
+            raise_over_quota(user_quotas, deltas, overs, usages)
+
+        self._add_usages(project_id, user_id, deltas)
+        return []
+
+    def commit(self, context, reservations, project_id=None, user_id=None):
+        """Nothing is reserved, so there is nothing to commit."""
+        pass
+
+    def rollback(self, context, reservations, project_id=None, user_id=None):
+        """Nothing is reserved, so there is nothing to roll back.
+
+        The resources added to the cached usages of the project by the
+        reservation are still counted until the cache expires.
+        """
+        pass
+
+    def usage_reset(self, context, resources):
+        """The usages are counted, forget the cached ones."""
+        self._forget_usages(context.project_id)
+
+    def destroy_all_by_project_and_user(self, context, project_id, user_id):
+        super(CountingQuotaDriver, self).destroy_all_by_project_and_user(
+            context, project_id, user_id)
+        self._forget_usages(project_id)
+
+    def destroy_all_by_project(self, context, project_id):
+        super(CountingQuotaDriver, self).destroy_all_by_project(context,
+                                                                project_id)
+        self._forget_usages(project_id)
+
+    def expire(self, context):
+        """Nothing is reserved, so there is nothing to expire."""
+        pass
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -29,6 +29,10 @@ class BaseBaremetalNodeState(host_manager.HostState):
     previously used and lock down access.
     """
 
+    # The stats of the node as last loaded, they are only loaded again when
+    # they changed.
+    _stats_json = None
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
         self.vcpus_total = compute['vcpus']
@@ -39,7 +43,9 @@ class BaseBaremetalNodeState(host_manager.HostState):
         self.free_disk_mb = compute['free_disk_gb'] * 1024
 
         stats = compute.get('stats', '{}')
-        self.stats = jsonutils.loads(stats)
+        if stats != self._stats_json:
+            self.stats = jsonutils.loads(stats)
+            self._stats_json = stats
 
     def consume_from_instance(self, instance):
         """Consume nodes entire resources regardless of instance request."""
@@ -0,0 +1,68 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Grouping of the scheduling requests received within a short window.
+"""
+
+import sys
+
+import eventlet
+from eventlet import event
+
+from nova.i18n import _LE
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class RequestBatcher(object):
+    """Groups the requests received within a window to handle them at once.
+
+    The first request of a batch opens a window of 'window' seconds, then
+    all the requests received meanwhile are given to the handler together.
+    The handler returns a (result, exc_info) tuple for each request, and
+    each request gets its own result, or raises its own exception.
+    """
+
+    def __init__(self, handler, window):
+        self.handler = handler
+        self.window = window
+        self._pending = []
+
+    def submit(self, *args):
+        """Add a request to the current batch and wait for its result."""
+        done = event.Event()
+        self._pending.append((args, done))
+        if len(self._pending) == 1:
+            eventlet.spawn_after(self.window, self._run_batch)
+        return done.wait()
+
+    def _run_batch(self):
+        batch, self._pending = self._pending, []
+        LOG.debug("Handling a batch of %d request(s)", len(batch))
+        try:
+            results = self.handler([args for args, done in batch])
+        except Exception:
+            LOG.exception(_LE("Failed to handle a batch of requests"))
+            exc_info = sys.exc_info()
+            for args, done in batch:
+                done.send_exception(*exc_info)
+            return
+        for (args, done), (result, exc_info) in zip(batch, results):
+            if exc_info is not None:
+                done.send_exception(*exc_info)
+            else:
+                done.send(result)
@@ -13,7 +13,76 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from oslo.config import cfg
+
+from nova.i18n import _LE
+from nova.openstack.common import log as logging
 from nova.scheduler import filter_scheduler
+from nova import utils
+
+caching_scheduler_opts = [
+    cfg.BoolOpt('caching_scheduler_background_refresh',
+                default=False,
+                help='Refresh the host states cached by the caching '
+                     'scheduler in a background green thread started by the '
+                     'periodic task, instead of in the periodic task '
+                     'itself.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(caching_scheduler_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class ClaimJournal(object):
+    """Resources consumed on the cached host states since they were loaded.
+
+    When a host state is refreshed from its compute node, the consumptions
+    which happened after the last update of the compute node are replayed
+    on top of the fresh data. The older ones are already accounted for by
+    the compute node and are forgotten.
+    """
+
+    def __init__(self):
+        # Maps host states to lists of (claimed_at, instance) tuples, where
+        # claimed_at is the updated timestamp of the host state set by the
+        # consumption of the instance.
+        self._claims = {}
+
+    def __len__(self):
+        return sum(len(claims) for claims in self._claims.itervalues())
+
+    def record(self, host_state, instance):
+        """Record that an instance consumed resources on a host state."""
+        self._claims.setdefault(host_state, []).append(
+            (host_state.updated, dict(instance)))
+
+    def replay(self, host_states):
+        """Replay the journal on the host states which were refreshed."""
+        host_states = set(host_states)
+        for host_state, claims in self._claims.items():
+            if host_state not in host_states:
+                # The host is gone.
+                del self._claims[host_state]
+                continue
+            if host_state.updated == claims[-1][0]:
+                # The compute node was not updated since the last claim, the
+                # refresh skipped this host state which is up to date.
+                continue
+
+            refreshed_at = host_state.updated
+            claims = [(claimed_at, instance)
+                      for claimed_at, instance in claims
+                      if refreshed_at is None or claimed_at > refreshed_at]
+            if not claims:
+                del self._claims[host_state]
+                continue
+            for claimed_at, instance in claims:
+                host_state.consume_from_instance(instance)
+            # Let the next refresh know this host state includes the claims.
+            host_state.updated = claims[-1][0]
+            self._claims[host_state] = claims
 
 
 class CachingScheduler(filter_scheduler.FilterScheduler):
@@ -40,6 +109,11 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
     To reduce races, cached info of the chosen host is updated using
     the existing host state call: consume_from_instance
 
+    The consumed resources are recorded in a journal, and replayed on top
+    of the data of the compute nodes loaded by the next refresh of the
+    cache, unless the compute node was updated since. The refresh can run
+    in a background green thread, see caching_scheduler_background_refresh.
+
     Please note, the way this works, each scheduler worker has its own
     copy of the cache. So if you run multiple schedulers, you will get
     more retries, because the data stored on any additional scheduler will
@@ -53,14 +127,34 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
     def __init__(self, *args, **kwargs):
         super(CachingScheduler, self).__init__(*args, **kwargs)
         self.all_host_states = None
+        self.journal = ClaimJournal()
+        self._refreshing = False
 
     def run_periodic_tasks(self, context):
         """Called from a periodic tasks in the manager."""
+        super(CachingScheduler, self).run_periodic_tasks(context)
         elevated = context.elevated()
         # NOTE(johngarbutt) Fetching the list of hosts before we get
         # a user request, so no user requests have to wait while we
         # fetch the list of hosts.
-        self.all_host_states = self._get_up_hosts(elevated)
+        if not CONF.caching_scheduler_background_refresh:
+            self._refresh_host_states(elevated)
+        elif not self._refreshing:
+            self._refreshing = True
+            utils.spawn_n(self._background_refresh, elevated)
+
+    def _background_refresh(self, context):
+        try:
+            self._refresh_host_states(context)
+        except Exception:
+            LOG.exception(_LE("Failed to refresh the cached host states"))
+        finally:
+            self._refreshing = False
+
+    def _refresh_host_states(self, context):
+        host_states = self._get_up_hosts(context)
+        self.journal.replay(host_states)
+        self.all_host_states = host_states
 
     def _get_all_host_states(self, context):
         """Called from the filter scheduler, in a template pattern."""
@@ -68,10 +162,16 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
             # NOTE(johngarbutt) We only get here when we a scheduler request
             # comes in before the first run of the periodic task.
             # Rather than raise an error, we fetch the list of hosts.
-            self.all_host_states = self._get_up_hosts(context)
+            self._refresh_host_states(context)
 
         return self.all_host_states
 
+    def _consume_from_instance(self, host_state, instance_properties):
+        """Called from the filter scheduler, in a template pattern."""
+        super(CachingScheduler, self)._consume_from_instance(
+            host_state, instance_properties)
+        self.journal.record(host_state, instance_properties)
+
     def _get_up_hosts(self, context):
         all_hosts_iterator = self.host_manager.get_all_host_states(context)
         return list(all_hosts_iterator)
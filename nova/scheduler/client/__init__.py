@@ -49,4 +49,4 @@ class SchedulerClient(object):
             context, request_spec, filter_properties)
 
     def update_resource_stats(self, context, name, stats):
-        self.reportclient.update_resource_stats(context, name, stats)
+        return self.reportclient.update_resource_stats(context, name, stats)
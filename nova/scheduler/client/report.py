@@ -36,6 +36,7 @@ class SchedulerReportClient(object):
         :type name: immutable (str or tuple)
         :param stats: updated stats to send to scheduler
         :type stats: dict
+        :returns: the updated compute node
         """
 
         if 'id' in stats:
@@ -45,9 +46,9 @@ class SchedulerReportClient(object):
         else:
             raise exception.ComputeHostNotCreated(name=str(name))
 
-        self.conductor_api.compute_node_update(context,
-                                               {'id': compute_node_id},
-                                               updates)
+        compute_node = self.conductor_api.compute_node_update(
+            context, {'id': compute_node_id}, updates)
 
         LOG.info(_LI('Compute_service record updated for '
                  '%s') % str(name))
+        return compute_node
@@ -20,6 +20,8 @@ Weighing Functions.
 """
 
 import random
+import sys
+import threading
 
 from oslo.config import cfg
 
@@ -30,8 +32,11 @@ from nova import objects
 from nova.openstack.common import log as logging
 from nova import rpc
 from nova.scheduler import driver
+from nova.scheduler import group_cache
 from nova.scheduler import scheduler_options
+from nova.scheduler import trace
 from nova.scheduler import utils as scheduler_utils
+from nova import weights
 
 
 CONF = cfg.CONF
@@ -47,7 +52,31 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_optimistic_claims',
+                default=False,
+                help='Claim the resources of each selected host in the '
+                     'database, with a compare-and-swap on the generation of '
+                     'its compute node. If the compute node was updated '
+                     'concurrently, another host is picked instead. This '
+                     'must be enabled when several scheduler workers or '
+                     'services are running.'),
+    cfg.IntOpt('scheduler_claim_max_attempts',
+               default=3,
+               help='Maximum number of hosts picked for an instance when '
+                    'their claims conflict with concurrent updates, if '
+                    'scheduler_optimistic_claims is enabled.'),
+    cfg.StrOpt('scheduler_batch_placement',
+               default='none',
+               help='How the instances of a request booting several '
+                    'instances are placed. With "none", the hosts are '
+                    'filtered and weighed again for each instance. With '
+                    '"pack" or "spread", they are filtered and weighed '
+                    'once for the request, then the instances fill the '
+                    'best hosts one after the other ("pack") or are given '
+                    'to the best hosts in turn ("spread"), checking only '
+                    'the filters run for each instance. '
+                    'scheduler_host_subset_size is then ignored.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -64,6 +93,17 @@ class FilterScheduler(driver.Scheduler):
             'ServerGroupAffinityFilter')
         self._supports_anti_affinity = scheduler_utils.validate_filter(
             'ServerGroupAntiAffinityFilter')
+        if CONF.scheduler_cache_group_hosts:
+            self.group_hosts = group_cache.GroupHostsCache()
+        else:
+            self.group_hosts = None
+        # Holds the host states shared by the requests of a batch.
+        self._batch = threading.local()
+
+    def run_periodic_tasks(self, context):
+        """Reconcile the cached hosts of the server group members."""
+        if self.group_hosts is not None:
+            self.group_hosts.reconcile(context.elevated())
 
     # NOTE(alaski): Remove this method when the scheduler rpc interface is
     # bumped to 4.x as it is no longer used.
@@ -139,8 +179,44 @@ class FilterScheduler(driver.Scheduler):
 
     def select_destinations(self, context, request_spec, filter_properties):
         """Selects a filtered set of hosts and nodes."""
-        self.notifier.info(context, 'scheduler.select_destinations.start',
-                           dict(request_spec=request_spec))
+        trace.start(context)
+        try:
+            return self._select_destinations(context, request_spec,
+                                             filter_properties)
+        finally:
+            trace.finish(context, self.notifier)
+
+    def select_destinations_batch(self, requests):
+        """Selects the hosts and nodes of several requests at once.
+
+        The host states are loaded once for all the requests, which are then
+        placed one after the other against them, each request seeing the
+        resources consumed by the previous ones.
+
+        :param requests: list of (context, request_spec, filter_properties)
+        :returns: a (destinations, exc_info) tuple for each request, with
+                  exc_info None if the request succeeded
+        """
+        elevated = requests[0][0].elevated()
+        self._batch.host_states = list(self._get_all_host_states(elevated))
+        results = []
+        try:
+            for context, request_spec, filter_properties in requests:
+                try:
+                    dests = self.select_destinations(context, request_spec,
+                                                     filter_properties)
+                    results.append((dests, None))
+                except Exception:
+                    results.append((None, sys.exc_info()))
+        finally:
+            self._batch.host_states = None
+        return results
+
+    def _select_destinations(self, context, request_spec, filter_properties):
+        with trace.step('rpc.notify'):
+            self.notifier.info(context,
+                               'scheduler.select_destinations.start',
+                               dict(request_spec=request_spec))
 
         num_instances = request_spec['num_instances']
         selected_hosts = self._schedule(context, request_spec,
@@ -155,6 +231,8 @@ class FilterScheduler(driver.Scheduler):
                       '%(num_instances)d instances requested to build.',
                       {'hosts': len(selected_hosts),
                        'num_instances': num_instances})
+            self._release_claims(context.elevated(), selected_hosts,
+                                 request_spec)
 
             reason = _('There are not enough hosts available.')
             raise exception.NoValidHost(reason=reason)
@@ -162,8 +240,9 @@ class FilterScheduler(driver.Scheduler):
         dests = [dict(host=host.obj.host, nodename=host.obj.nodename,
                       limits=host.obj.limits) for host in selected_hosts]
 
-        self.notifier.info(context, 'scheduler.select_destinations.end',
-                           dict(request_spec=request_spec))
+        with trace.step('rpc.notify'):
+            self.notifier.info(context, 'scheduler.select_destinations.end',
+                               dict(request_spec=request_spec))
         return dests
 
     def _provision_resource(self, context, weighed_host, request_spec,
@@ -244,7 +323,10 @@ class FilterScheduler(driver.Scheduler):
 
         filter_properties.setdefault('group_hosts', set())
         user_hosts = set(filter_properties['group_hosts'])
-        group_hosts = set(group.get_hosts(context))
+        if self.group_hosts is not None:
+            group_hosts = self.group_hosts.get_hosts(context, group)
+        else:
+            group_hosts = set(group.get_hosts(context))
         filter_properties['group_hosts'] = user_hosts | group_hosts
         filter_properties['group_policies'] = group.policies
 
@@ -259,8 +341,9 @@ class FilterScheduler(driver.Scheduler):
         instance_type = request_spec.get("instance_type", None)
         instance_uuids = request_spec.get("instance_uuids", None)
 
-        update_group_hosts = self._setup_instance_group(context,
-                filter_properties)
+        with trace.step('setup_instance_group'):
+            update_group_hosts = self._setup_instance_group(context,
+                    filter_properties)
 
         config_options = self._get_configuration_options()
 
@@ -280,55 +363,202 @@ class FilterScheduler(driver.Scheduler):
         # Note: remember, we are using an iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
-        hosts = self._get_all_host_states(elevated)
+        hosts = getattr(self._batch, 'host_states', None)
+        if hosts is None:
+            with trace.step('get_all_host_states'):
+                hosts = self._get_all_host_states(elevated)
 
         selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+        if CONF.scheduler_batch_placement != 'none' and num_instances > 1:
+            return self._schedule_batch(elevated, hosts, num_instances,
+                                        instance_properties, instance_uuids,
+                                        filter_properties, update_group_hosts)
+        if CONF.scheduler_optimistic_claims:
+            max_attempts = max(CONF.scheduler_claim_max_attempts, 1)
+            # The hosts are filtered again when a claim conflicts.
+            hosts = list(hosts)
+        else:
+            max_attempts = 1
+        scheduler_host_subset_size = max(CONF.scheduler_host_subset_size, 1)
+        # Only the hosts which consumed an instance need to be weighed again
+        # for the next instances.
+        weight_cache = weights.WeightCache() if num_instances > 1 else None
         for num in xrange(num_instances):
-            # Filter local hosts based on requirements ...
-            hosts = self.host_manager.get_filtered_hosts(hosts,
-                    filter_properties, index=num)
-            if not hosts:
+            candidates = hosts
+            chosen_host = None
+            for attempt in xrange(max_attempts):
+                # Filter local hosts based on requirements ...
+                with trace.step('get_filtered_hosts'):
+                    hosts = self.host_manager.get_filtered_hosts(candidates,
+                            filter_properties, index=num)
+                if not hosts:
+                    break
+
+                LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+                # Only the hosts a host is randomly chosen from are needed,
+                # sorting all of them is avoided.
+                with trace.step('get_weighed_hosts'):
+                    weighed_hosts = self.host_manager.get_weighed_hosts(
+                            hosts, filter_properties,
+                            limit=scheduler_host_subset_size,
+                            cache=weight_cache)
+
+                LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
+
+                chosen_host = random.choice(weighed_hosts)
+                if not CONF.scheduler_optimistic_claims:
+                    break
+                try:
+                    if self.host_manager.claim_from_instance(elevated,
+                            chosen_host.obj, instance_properties):
+                        break
+                except exception.ComputeHostNotFound:
+                    # The compute node was deleted concurrently.
+                    candidates = [host for host in candidates
+                                  if host is not chosen_host.obj]
+                if weight_cache is not None:
+                    weight_cache.invalidate(chosen_host.obj)
+                # Pick again, the host state of the conflicting claim has
+                # been refreshed.
+                chosen_host = None
+
+            if chosen_host is None:
                 # Can't get any more locally.
                 break
+            selected_hosts.append(chosen_host)
 
-            LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            self._consume_chosen_host(chosen_host.obj, instance_properties,
+                                      filter_properties, update_group_hosts,
+                                      instance_uuids and instance_uuids[num])
+            if weight_cache is not None:
+                weight_cache.invalidate(chosen_host.obj)
+        return selected_hosts
 
+    def _schedule_batch(self, context, hosts, num_instances,
+                        instance_properties, instance_uuids,
+                        filter_properties, update_group_hosts):
+        """Place identical instances in one pass over the weighed hosts.
+
+        The hosts are filtered and weighed once for the whole request. The
+        instances are then placed on the best hosts, filling each host
+        before moving to the next one with the 'pack' placement, or one
+        instance per host in turn with the 'spread' placement. Only the
+        filters which are run for each instance are run again, on a single
+        host, to check that it can take another instance.
+        """
+        with trace.step('get_filtered_hosts'):
+            hosts = self.host_manager.get_filtered_hosts(hosts,
+                    filter_properties, index=0)
+        if not hosts:
+            return []
+        with trace.step('get_weighed_hosts'):
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
                     filter_properties)
+        LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
 
-            LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
-
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
+        spread = CONF.scheduler_batch_placement == 'spread'
+        selected_hosts = []
+        candidates = weighed_hosts
+        while candidates and len(selected_hosts) < num_instances:
+            # The hosts which took an instance in this pass, and can be
+            # given another one in the next pass when spreading.
+            fitting = []
+            for weighed_host in candidates:
+                while len(selected_hosts) < num_instances:
+                    num = len(selected_hosts)
+                    if not self._place_instance(context, weighed_host.obj,
+                            instance_properties, filter_properties, num):
+                        break
+                    selected_hosts.append(weighed_host)
+                    self._consume_chosen_host(weighed_host.obj,
+                            instance_properties, filter_properties,
+                            update_group_hosts,
+                            instance_uuids and instance_uuids[num])
+                    if spread:
+                        fitting.append(weighed_host)
+                        break
+                if len(selected_hosts) == num_instances:
+                    break
+            candidates = fitting
+        return selected_hosts
 
-            chosen_host = random.choice(
-                weighed_hosts[0:scheduler_host_subset_size])
-            selected_hosts.append(chosen_host)
+    def _place_instance(self, context, host_state, instance_properties,
+                        filter_properties, num):
+        """Return True if the num-th instance of a batch fits on a host.
 
-            # Now consume the resources so the filter/weights
-            # will change for the next instance.
-            # NOTE (baoli) adding and deleting pci_requests is a temporary
-            # fix to avoid DB access in consume_from_instance() while getting
-            # pci_requests. The change can be removed once pci_requests is
-            # part of the instance object that is passed into the scheduler
-            # APIs
-            pci_requests = filter_properties.get('pci_requests')
-            if pci_requests:
-                instance_properties['pci_requests'] = pci_requests
-            chosen_host.obj.consume_from_instance(instance_properties)
-            if pci_requests:
-                del instance_properties['pci_requests']
-            if update_group_hosts is True:
-                filter_properties['group_hosts'].add(chosen_host.obj.host)
-        return selected_hosts
+        The host passed all the filters for the first instance, it is only
+        filtered again for the next ones, or after a conflicting claim.
+        """
+        if CONF.scheduler_optimistic_claims:
+            max_attempts = max(CONF.scheduler_claim_max_attempts, 1)
+        else:
+            max_attempts = 1
+        for attempt in xrange(max_attempts):
+            if num > 0 or attempt > 0:
+                with trace.step('get_filtered_hosts'):
+                    if not self.host_manager.get_filtered_hosts(
+                            [host_state], filter_properties, index=num):
+                        return False
+            if not CONF.scheduler_optimistic_claims:
+                return True
+            try:
+                if self.host_manager.claim_from_instance(context, host_state,
+                                                         instance_properties):
+                    return True
+            except exception.ComputeHostNotFound:
+                # The compute node was deleted concurrently.
+                return False
+        return False
+
+    def _consume_chosen_host(self, host_state, instance_properties,
+                             filter_properties, update_group_hosts,
+                             instance_uuid):
+        """Consume the resources of an instance on the chosen host."""
+        # NOTE (baoli) adding and deleting pci_requests is a temporary
+        # fix to avoid DB access in consume_from_instance() while getting
+        # pci_requests. The change can be removed once pci_requests is
+        # part of the instance object that is passed into the scheduler
+        # APIs
+        pci_requests = filter_properties.get('pci_requests')
+        if pci_requests:
+            instance_properties['pci_requests'] = pci_requests
+        self._consume_from_instance(host_state, instance_properties)
+        if pci_requests:
+            del instance_properties['pci_requests']
+        if update_group_hosts is True:
+            filter_properties['group_hosts'].add(host_state.host)
+            if self.group_hosts is not None and instance_uuid:
+                self.group_hosts.record(instance_uuid, host_state.host)
+
+    def _release_claims(self, context, weighed_hosts, request_spec):
+        """Give back the claims of the hosts selected for a request which
+        can't be scheduled as a whole.
+        """
+        if not CONF.scheduler_optimistic_claims or not weighed_hosts:
+            return
+        instance_properties = request_spec['instance_properties']
+        for weighed_host in weighed_hosts:
+            try:
+                self.host_manager.release_from_instance(context,
+                        weighed_host.obj, instance_properties)
+            except Exception as e:
+                # NOTE: The compute node will write its usage again on its
+                # next update, NoValidHost is raised anyway.
+                LOG.warning(_LW("Failed to release the claim on %(host)s: "
+                                "%(error)s"),
+                            {'host': weighed_host.obj, 'error': e})
 
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
+
+    def _consume_from_instance(self, host_state, instance_properties):
+        """Template method, so a subclass can track the consumed resources."""
+        host_state.consume_from_instance(instance_properties)
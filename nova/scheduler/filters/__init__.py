@@ -17,7 +17,31 @@
 Scheduler host filters
 """
 
+import time
+
+from oslo.config import cfg
+
 from nova import filters
+from nova.i18n import _
+from nova.openstack.common import log as logging
+from nova.scheduler import host_columns
+from nova.scheduler import trace
+
+filter_opts = [
+    cfg.BoolOpt('scheduler_adaptive_filter_order',
+                default=False,
+                help='Record the execution time and the rejection rate of '
+                     'each scheduler filter, and run the cheap filters '
+                     'which reject the most hosts first, instead of '
+                     'following the order of scheduler_default_filters. '
+                     'Filters deciding on all the hosts at once keep their '
+                     'position, so the filtered hosts are the same.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(filter_opts)
+
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -32,11 +56,75 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def host_passes_batch(self, columns, filter_properties):
+        """Return a boolean array telling which hosts pass the filter.
+
+        Optionally override this in a subclass, with a vectorized version
+        of host_passes() working on a host_columns.HostStateColumns. Return
+        None if the batch check can't be done, host_passes() is then used.
+        """
+        return None
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
+    def adaptive_order_enabled(self):
+        return CONF.scheduler_adaptive_filter_order
+
+    def filter_finished(self, cls_name, num_in, num_out, elapsed):
+        trace.record('filter.%s' % cls_name, elapsed, hosts_in=num_in,
+                     hosts_out=num_out)
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0):
+        if not host_columns.batch_engine_enabled():
+            return super(HostFilterHandler, self).get_filtered_objects(
+                    filter_classes, objs, filter_properties, index)
+
+        columns = host_columns.HostStateColumns(objs)
+        LOG.debug("Starting with %d host(s)", len(columns))
+        adaptive = self.adaptive_order_enabled()
+        if adaptive:
+            filter_classes = self.filter_stats.order(filter_classes)
+        num_hosts = len(columns)
+        for filter_cls in filter_classes:
+            cls_name = filter_cls.__name__
+            filter = filter_cls()
+
+            if not filter.run_filter_for_index(index):
+                continue
+            start = time.time()
+            passes = filter.host_passes_batch(columns, filter_properties)
+            if passes is not None:
+                columns.mask &= passes
+            else:
+                objs = filter.filter_all(columns.selected(),
+                                         filter_properties)
+                if objs is None:
+                    LOG.debug("Filter %(cls_name)s says to stop filtering",
+                              {'cls_name': cls_name})
+                    return
+                passed = set(id(obj) for obj in objs)
+                for i, host_state in enumerate(columns.host_states):
+                    if columns.mask[i] and id(host_state) not in passed:
+                        columns.mask[i] = False
+            num_in = num_hosts
+            num_hosts = int(columns.mask.sum())
+            elapsed = time.time() - start
+            if adaptive:
+                self.filter_stats.record(cls_name, num_in, num_hosts,
+                                         elapsed)
+            self.filter_finished(cls_name, num_in, num_hosts, elapsed)
+            if not num_hosts:
+                LOG.info(_("Filter %s returned 0 hosts"), cls_name)
+                break
+            LOG.debug("Filter %(cls_name)s returned "
+                      "%(obj_len)d host(s)",
+                      {'cls_name': cls_name, 'obj_len': num_hosts})
+        return columns.selected()
+
 
 def all_filters():
     """Return a list of filter classes found in this directory.
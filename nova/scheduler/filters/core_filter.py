@@ -80,6 +80,24 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def host_passes_batch(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return None
+
+        host_vcpus_total = columns['vcpus_total']
+        # Fail safe for hosts not reporting their VCPUs
+        broken = host_vcpus_total == 0
+        if (broken & columns.mask).any():
+            LOG.warning(_LW("VCPUs not set; assuming CPU collection broken"))
+
+        vcpus_total = host_vcpus_total * CONF.cpu_allocation_ratio
+        columns.set_limits('vcpu', vcpus_total, vcpus_total > 0)
+
+        free_vcpus = vcpus_total - columns['vcpus_used']
+        return broken | (free_vcpus >= instance_type['vcpus'])
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -64,6 +64,21 @@ class DiskFilter(filters.BaseHostFilter):
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
 
+    def host_passes_batch(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = (1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb']) +
+                         instance_type['swap'])
+        total_usable_disk_mb = columns['total_usable_disk_gb'] * 1024
+
+        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - columns['free_disk_mb']
+        passes = disk_mb_limit - used_disk_mb >= requested_disk
+
+        columns.set_limits('disk_gb', disk_mb_limit / 1024, passes)
+        return passes
+
 
 class AggregateDiskFilter(DiskFilter):
     """AggregateDiskFilter with per-aggregate disk allocation ratio flag.
@@ -88,3 +103,7 @@ class AggregateDiskFilter(DiskFilter):
             ratio = CONF.disk_allocation_ratio
 
         return ratio
+
+    def host_passes_batch(self, columns, filter_properties):
+        # The allocation ratio is looked up per host.
+        return None
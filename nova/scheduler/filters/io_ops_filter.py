@@ -54,6 +54,10 @@ class IoOpsFilter(filters.BaseHostFilter):
                          'max_io_ops': max_io_ops})
         return passes
 
+    def host_passes_batch(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        return columns['num_io_ops'] < CONF.max_io_ops_per_host
+
 
 class AggregateIoOpsFilter(IoOpsFilter):
     """AggregateIoOpsFilter with per-aggregate the max io operations.
@@ -77,3 +81,7 @@ class AggregateIoOpsFilter(IoOpsFilter):
             value = CONF.max_io_ops_per_host
 
         return value
+
+    def host_passes_batch(self, columns, filter_properties):
+        # The maximum is looked up per host.
+        return None
@@ -14,18 +14,38 @@
 #    under the License.
 
 
+import collections
 import operator
 
+from oslo.config import cfg
 from oslo.serialization import jsonutils
 import six
 
 from nova.scheduler import filters
 
+json_filter_opts = [
+    cfg.IntOpt('json_filter_query_cache_size',
+               default=256,
+               help='Number of compiled JsonFilter queries to cache. Set to '
+                    '0 to disable the cache.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(json_filter_opts)
+
 
 class JsonFilter(filters.BaseHostFilter):
     """Host Filter to allow simple JSON-based grammar for
     selecting hosts.
+
+    Queries are compiled once into a tree of functions evaluated for each
+    host, and the compiled queries are cached.
     """
+
+    # Compiled queries, keyed by filter class and query string, from the
+    # least to the most recently used. Shared by all the instances.
+    _compiled_queries = collections.OrderedDict()
+
     def _op_compare(self, args, op):
         """Returns True if the specified operator can successfully
         compare the first item in the args with all the rest. Will
@@ -88,43 +108,79 @@ class JsonFilter(filters.BaseHostFilter):
         'and': _and,
     }
 
-    def _parse_string(self, string, host_state):
+    def _compile_lookup(self, string):
         """Strings prefixed with $ are capability lookups in the
         form '$variable' where 'variable' is an attribute in the
         HostState class.  If $variable is a dictionary, you may
         use: $variable.dictkey
-        """
-        if not string:
-            return None
-        if not string.startswith("$"):
-            return string
 
+        Returns a function looking up the capability in a HostState.
+        """
         path = string[1:].split(".")
-        obj = getattr(host_state, path[0], None)
-        if obj is None:
-            return None
-        for item in path[1:]:
-            obj = obj.get(item, None)
+        attr = path[0]
+        keys = path[1:]
+
+        def lookup(host_state):
+            obj = getattr(host_state, attr, None)
             if obj is None:
                 return None
-        return obj
-
-    def _process_filter(self, query, host_state):
-        """Recursively parse the query structure."""
+            for item in keys:
+                obj = obj.get(item, None)
+                if obj is None:
+                    return None
+            return obj
+        return lookup
+
+    def _compile_filter(self, query):
+        """Recursively compile the query structure into a function of
+        a HostState.
+        """
         if not query:
-            return True
+            return lambda host_state: True
         cmd = query[0]
         method = self.commands[cmd]
-        cooked_args = []
+        # (lookup, value) pairs, where lookup is None for constant values.
+        args = []
         for arg in query[1:]:
             if isinstance(arg, list):
-                arg = self._process_filter(arg, host_state)
-            elif isinstance(arg, six.string_types):
-                arg = self._parse_string(arg, host_state)
-            if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
+                args.append((self._compile_filter(arg), None))
+            elif isinstance(arg, six.string_types) and arg.startswith("$"):
+                args.append((self._compile_lookup(arg), None))
+            elif arg or not isinstance(arg, six.string_types):
+                # Empty strings and nulls are ignored.
+                if arg is not None:
+                    args.append((None, arg))
+
+        if all(lookup is None for lookup, value in args):
+            result = method(self, [value for lookup, value in args])
+            return lambda host_state: result
+
+        def evaluate(host_state):
+            cooked_args = []
+            for lookup, value in args:
+                if lookup is not None:
+                    value = lookup(host_state)
+                    if value is None:
+                        continue
+                cooked_args.append(value)
+            return method(self, cooked_args)
+        return evaluate
+
+    def _get_compiled_query(self, query):
+        """Return the compiled query, from the cache if it is there."""
+        cache = JsonFilter._compiled_queries
+        key = (type(self), query)
+        # NOTE: Popped and re-inserted so that it is the most recently used.
+        compiled = cache.pop(key, None)
+        if compiled is None:
+            compiled = self._compile_filter(jsonutils.loads(query))
+        cache_size = CONF.json_filter_query_cache_size
+        if cache_size > 0:
+            while len(cache) >= cache_size:
+                # Evict the least recently used query.
+                cache.popitem(last=False)
+            cache[key] = compiled
+        return compiled
 
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can fulfill the requirements
@@ -140,7 +196,7 @@ class JsonFilter(filters.BaseHostFilter):
         # NOTE(comstud): Not checking capabilities or service for
         # enabled/disabled so that a provided json filter can decide
 
-        result = self._process_filter(jsonutils.loads(query), host_state)
+        result = self._get_compiled_query(query)(host_state)
         if isinstance(result, list):
             # If any succeeded, include the host
             result = any(result)
@@ -35,6 +35,9 @@ class MetricsFilter(filters.BaseHostFilter):
     these hosts.
     """
 
+    # The metrics of a host do not change within a request
+    run_filter_once_per_request = True
+
     def __init__(self):
         super(MetricsFilter, self).__init__()
         opts = utils.parse_options(CONF.metrics.weight_setting,
@@ -48,6 +48,10 @@ class NumInstancesFilter(filters.BaseHostFilter):
                          'max_instances': max_instances})
         return passes
 
+    def host_passes_batch(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        return columns['num_instances'] < CONF.max_instances_per_host
+
 
 class AggregateNumInstancesFilter(NumInstancesFilter):
     """AggregateNumInstancesFilter with per-aggregate the max num instances.
@@ -72,3 +76,7 @@ class AggregateNumInstancesFilter(NumInstancesFilter):
             value = CONF.max_instances_per_host
 
         return value
+
+    def host_passes_batch(self, columns, filter_properties):
+        # The maximum is looked up per host.
+        return None
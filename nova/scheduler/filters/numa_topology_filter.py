@@ -11,51 +11,149 @@
 #    under the License.
 
 from oslo.config import cfg
+import six
 
 from nova.scheduler import filters
 from nova.virt import hardware
 
+numa_topology_filter_opts = [
+    cfg.IntOpt('numa_topology_filter_cache_size',
+               default=4096,
+               help='Number of parsed host NUMA topologies cached by the '
+                    'NUMATopologyFilter, keyed by their serialized form. Set '
+                    'to 0 to disable the cache.'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(numa_topology_filter_opts)
 CONF.import_opt('cpu_allocation_ratio', 'nova.scheduler.filters.core_filter')
 CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
 
 
+class HostNUMACapacity(object):
+    """Usage and limits of the NUMA cells of a host topology.
+
+    Built once for each host topology and allocation ratios, it checks
+    whether an instance topology fits in the host without building any
+    intermediate topology.
+    """
+
+    def __init__(self, host_topology, ram_ratio, cpu_ratio):
+        # Maps cell ids to (cpu_usage, memory_usage, cpu_limit,
+        # memory_limit) tuples.
+        self.cells = {}
+        # Capacity left over all the cells, to reject the instances which
+        # can't fit without checking each cell.
+        self.free_cpus = 0
+        self.free_memory = 0
+        self.over_limits = False
+        limit_cells = []
+        for cell in host_topology.cells:
+            max_cell_memory = int(cell.memory * ram_ratio)
+            max_cell_cpu = len(cell.cpuset) * cpu_ratio
+            self.cells[cell.id] = (cell.cpu_usage, cell.memory_usage,
+                                   max_cell_cpu, max_cell_memory)
+            self.free_cpus += max_cell_cpu - cell.cpu_usage
+            self.free_memory += max_cell_memory - cell.memory_usage
+            if (max(0, cell.memory_usage) > max_cell_memory or
+                    max(0, cell.cpu_usage) > max_cell_cpu):
+                self.over_limits = True
+            limit_cells.append(
+                hardware.VirtNUMATopologyCellLimit(
+                    cell.id, cell.cpuset, cell.memory,
+                    max_cell_cpu, max_cell_memory))
+        self.limits = hardware.VirtNUMALimitTopology(
+                cells=limit_cells).to_json()
+
+    def fits(self, instance_cells, total_cpus, total_memory):
+        """Return True if the instance cells fit in the host cells.
+
+        :param instance_cells: maps cell ids to the (cpus, memory) the
+                               instance needs in each cell
+        """
+        if (self.over_limits or total_cpus > self.free_cpus or
+                total_memory > self.free_memory):
+            return False
+        for cell_id, (cpus, memory) in six.iteritems(instance_cells):
+            cell = self.cells.get(cell_id)
+            if cell is None:
+                return False
+            cpu_usage, memory_usage, cpu_limit, memory_limit = cell
+            if (max(0, memory_usage + memory) > memory_limit or
+                    max(0, cpu_usage + cpus) > cpu_limit):
+                return False
+        return True
+
+
+# Maps (host topology JSON, ram ratio, cpu ratio) to HostNUMACapacity.
+_capacity_cache = {}
+
+
+def _get_host_capacity(host_state, ram_ratio, cpu_ratio):
+    host_topology = host_state.numa_topology
+    if not isinstance(host_topology, six.string_types):
+        if not host_topology:
+            return None
+        return HostNUMACapacity(host_topology, ram_ratio, cpu_ratio)
+
+    key = (host_topology, ram_ratio, cpu_ratio)
+    capacity = _capacity_cache.get(key)
+    if capacity is None:
+        host_topology = hardware.VirtNUMAHostTopology.from_json(
+                host_topology)
+        if not host_topology:
+            return None
+        capacity = HostNUMACapacity(host_topology, ram_ratio, cpu_ratio)
+        cache_size = CONF.numa_topology_filter_cache_size
+        if cache_size > 0:
+            if len(_capacity_cache) >= cache_size:
+                _capacity_cache.popitem()
+            _capacity_cache[key] = capacity
+    return capacity
+
+
 class NUMATopologyFilter(filters.BaseHostFilter):
     """Filter on requested NUMA topology."""
 
-    def host_passes(self, host_state, filter_properties):
-        ram_ratio = CONF.ram_allocation_ratio
-        cpu_ratio = CONF.cpu_allocation_ratio
+    def __init__(self):
+        self._instance_cells = None
+
+    def _get_instance_cells(self, filter_properties):
+        """Return the needs of the requested instance topology, per cell.
+
+        The filter is created for each filtering pass of a request, so the
+        instance topology is only parsed once for all the hosts.
+        """
         request_spec = filter_properties.get('request_spec', {})
+        if (self._instance_cells is not None and
+                self._instance_cells[0] is request_spec):
+            return self._instance_cells[1]
+
         instance = request_spec.get('instance_properties', {})
         instance_topology = hardware.instance_topology_from_instance(instance)
-        host_topology, _fmt = hardware.host_topology_and_format_from_host(
-                host_state)
         if instance_topology:
-            if host_topology:
-                if not hardware.VirtNUMAHostTopology.can_fit_instances(
-                        host_topology, [instance_topology]):
-                    return False
-
-                limit_cells = []
-                usage_after_instance = (
-                        hardware.VirtNUMAHostTopology.usage_from_instances(
-                            host_topology, [instance_topology]))
-                for cell in usage_after_instance.cells:
-                    max_cell_memory = int(cell.memory * ram_ratio)
-                    max_cell_cpu = len(cell.cpuset) * cpu_ratio
-                    if (cell.memory_usage > max_cell_memory or
-                            cell.cpu_usage > max_cell_cpu):
-                        return False
-                    limit_cells.append(
-                        hardware.VirtNUMATopologyCellLimit(
-                            cell.id, cell.cpuset, cell.memory,
-                            max_cell_cpu, max_cell_memory))
-                host_state.limits['numa_topology'] = (
-                        hardware.VirtNUMALimitTopology(
-                            cells=limit_cells).to_json())
-                return True
-            else:
-                return False
+            cells = {}
+            for cell in instance_topology.cells:
+                cpus, memory = cells.get(cell.id, (0, 0))
+                cells[cell.id] = (cpus + len(cell.cpuset),
+                                  memory + cell.memory)
+            total_cpus = sum(cpus for cpus, memory in cells.values())
+            total_memory = sum(memory for cpus, memory in cells.values())
+            instance_cells = (cells, total_cpus, total_memory)
         else:
+            instance_cells = None
+        self._instance_cells = (request_spec, instance_cells)
+        return instance_cells
+
+    def host_passes(self, host_state, filter_properties):
+        ram_ratio = CONF.ram_allocation_ratio
+        cpu_ratio = CONF.cpu_allocation_ratio
+        instance_cells = self._get_instance_cells(filter_properties)
+        if not instance_cells:
             return True
+
+        capacity = _get_host_capacity(host_state, ram_ratio, cpu_ratio)
+        if capacity is None or not capacity.fits(*instance_cells):
+            return False
+        host_state.limits['numa_topology'] = capacity.limits
+        return True
@@ -72,6 +72,19 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return self.ram_allocation_ratio
 
+    def host_passes_batch(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        total_usable_ram_mb = columns['total_usable_ram_mb']
+
+        memory_mb_limit = total_usable_ram_mb * self.ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - columns['free_ram_mb']
+        passes = memory_mb_limit - used_ram_mb >= requested_ram
+
+        columns.set_limits('memory_mb', memory_mb_limit, passes)
+        return passes
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
@@ -50,8 +50,10 @@ import requests
 
 from nova import context
 from nova import db
+from nova.i18n import _LW
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -73,7 +75,20 @@ trusted_opts = [
                help='Attestation status cache valid period length'),
     cfg.BoolOpt('attestation_insecure_ssl',
                 default=False,
-                help='Disable SSL cert verification for Attestation service')
+                help='Disable SSL cert verification for Attestation service'),
+    cfg.IntOpt('attestation_refresh_ahead',
+               default=0,
+               help='Number of seconds before the attestation status cache '
+                    'valid period lapses at which the status is refreshed '
+                    'in the background, so that scheduling requests do not '
+                    'wait for the Attestation service. 0 disables the '
+                    'background refresh'),
+    cfg.BoolOpt('attestation_stale_while_revalidate',
+                default=False,
+                help='Keep using an expired attestation status for up to '
+                     'another valid period while it is refreshed in the '
+                     'background, instead of polling the Attestation '
+                     'service in the scheduling request'),
 ]
 
 CONF = cfg.CONF
@@ -168,6 +183,7 @@ class ComputeAttestationCache(object):
     def __init__(self):
         self.attestservice = AttestationService()
         self.compute_nodes = {}
+        self._refreshing = False
         admin = context.get_admin_context()
 
         # Fetch compute node list to initialize the compute_nodes,
@@ -178,26 +194,32 @@ class ComputeAttestationCache(object):
             host = compute['hypervisor_hostname']
             self._init_cache_entry(host)
 
-    def _cache_valid(self, host):
+    def _cache_valid(self, host, timeout=None):
+        if timeout is None:
+            timeout = CONF.trusted_computing.attestation_auth_timeout
         cachevalid = False
         if host in self.compute_nodes:
             node_stats = self.compute_nodes.get(host)
-            if not timeutils.is_older_than(
-                             node_stats['vtime'],
-                             CONF.trusted_computing.attestation_auth_timeout):
+            if not timeutils.is_older_than(node_stats['vtime'], timeout):
                 cachevalid = True
         return cachevalid
 
+    def _refresh_timeout(self):
+        """Age after which the trust level of a host is refreshed."""
+        return max(CONF.trusted_computing.attestation_auth_timeout -
+                   CONF.trusted_computing.attestation_refresh_ahead, 0)
+
+    def _hosts_to_refresh(self):
+        timeout = self._refresh_timeout()
+        return [host for host in self.compute_nodes
+                if not self._cache_valid(host, timeout)]
+
     def _init_cache_entry(self, host):
         self.compute_nodes[host] = {
             'trust_lvl': 'unknown',
             'vtime': timeutils.normalize_time(
                         timeutils.parse_isotime("1970-01-01T00:00:00Z"))}
 
-    def _invalidate_caches(self):
-        for host in self.compute_nodes:
-            self._init_cache_entry(host)
-
     def _update_cache_entry(self, state):
         entry = {}
 
@@ -223,26 +245,79 @@ class ComputeAttestationCache(object):
         self.compute_nodes[host] = entry
 
     def _update_cache(self):
-        self._invalidate_caches()
-        states = self.attestservice.do_attestation(self.compute_nodes.keys())
+        """Poll the OAT service for all the stale hosts at once."""
+        hosts = self._hosts_to_refresh()
+        for host in hosts:
+            self._init_cache_entry(host)
+        states = self.attestservice.do_attestation(hosts)
         if states is None:
             return
         for state in states:
             self._update_cache_entry(state)
 
+    def _refresh_cache(self):
+        # The current trust levels are kept until the OAT service answers.
+        try:
+            states = self.attestservice.do_attestation(
+                self._hosts_to_refresh())
+            if states is None:
+                LOG.warning(_LW("Failed to refresh the attestation status "
+                                "of the compute nodes"))
+                return
+            for state in states:
+                self._update_cache_entry(state)
+        finally:
+            self._refreshing = False
+
+    def _refresh_cache_in_background(self):
+        if not self._refreshing:
+            self._refreshing = True
+            utils.spawn_n(self._refresh_cache)
+
+    def _serve_stale(self, host):
+        """Return True if the expired trust level of a host can be used
+        while it is refreshed.
+        """
+        if not CONF.trusted_computing.attestation_stale_while_revalidate:
+            return False
+        return self._cache_valid(
+            host, 2 * CONF.trusted_computing.attestation_auth_timeout)
+
     def get_host_attestation(self, host):
         """Check host's trust level."""
         if host not in self.compute_nodes:
             self._init_cache_entry(host)
         if not self._cache_valid(host):
-            self._update_cache()
+            if self._serve_stale(host):
+                self._refresh_cache_in_background()
+            else:
+                self._update_cache()
+        elif (CONF.trusted_computing.attestation_refresh_ahead > 0 and
+                not self._cache_valid(host, self._refresh_timeout())):
+            self._refresh_cache_in_background()
         level = self.compute_nodes.get(host).get('trust_lvl')
         return level
 
 
+_shared_cache = None
+
+
+def _get_shared_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ComputeAttestationCache()
+    return _shared_cache
+
+
 class ComputeAttestation(object):
     def __init__(self):
-        self.caches = ComputeAttestationCache()
+        if (CONF.trusted_computing.attestation_refresh_ahead > 0 or
+                CONF.trusted_computing.attestation_stale_while_revalidate):
+            # NOTE: The filters are created for each request, the cache
+            # must outlive them to be refreshed in the background.
+            self.caches = _get_shared_cache()
+        else:
+            self.caches = ComputeAttestationCache()
 
     def is_trusted(self, host, trust):
         level = self.caches.get_host_attestation(host)
@@ -252,6 +327,9 @@ class ComputeAttestation(object):
 class TrustedFilter(filters.BaseHostFilter):
     """Trusted filter to support Trusted Compute Pools."""
 
+    # The trust level of a host does not change within a request
+    run_filter_once_per_request = True
+
     def __init__(self):
         self.compute_attestation = ComputeAttestation()
 
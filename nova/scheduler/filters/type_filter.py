@@ -34,6 +34,12 @@ class TypeAffinityFilter(filters.BaseHostFilter):
         """
 
         instance_type = filter_properties.get('instance_type')
+        if host_state.num_instances_by_type is not None:
+            instance_type_id = str(instance_type['id'])
+            return all(type_id == instance_type_id
+                       for type_id in host_state.num_instances_by_type)
+
+        # NOTE: The compute node does not report its instance types.
         context = filter_properties['context'].elevated()
         instances_other_type = db.instance_get_all_by_host_and_not_type(
                      context, host_state.host, instance_type['id'])
@@ -15,6 +15,7 @@
 """Bench of utility methods used by filters."""
 
 
+from nova import db
 from nova.i18n import _LI
 from nova.objects import aggregate
 from nova.openstack.common import log as logging
@@ -33,6 +34,19 @@ def aggregate_values_from_db(context, host, key_name):
     return aggregate_vals
 
 
+def aggregate_metadata_get_by_host(context, host_state, key=None):
+    """Returns a dict of all metadata for a specific host.
+
+    Uses the aggregate metadata prefetched for all hosts by the HostManager
+    when available, otherwise queries the database for this host only.
+    """
+    if host_state.aggregate_metadata is not None:
+        return host_state.aggregate_metadata.get_by_host(
+            context, host_state.host, key=key)
+    return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                             key=key)
+
+
 def validate_num_values(vals, default=None, cast_to=int, based_on=min):
     """Returns a corretly casted value based on a set of values.
 
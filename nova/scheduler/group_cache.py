@@ -0,0 +1,185 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Scheduler side cache of the hosts of the server group members.
+
+Without it, the hosts of all the members of a server group are loaded from
+the database for each request with a group hint. The cache is updated from
+the scheduling decisions, the cached hosts of the instances deleted or
+moved are dropped when their notifications are received, and the cache is
+reconciled with the database by the periodic tasks of the scheduler driver.
+The least recently used instances are evicted past
+scheduler_group_cache_size entries.
+
+The notifications are consumed from a queue shared by the listeners, so
+each of them is received by a single scheduler process. The cache must
+only be enabled when a single scheduler process runs, nova-scheduler
+ignores it with more than one worker.
+"""
+
+import collections
+
+from oslo.config import cfg
+from oslo import messaging
+
+from nova.compute import vm_states
+from nova import objects
+from nova.openstack.common import log as logging
+from nova import rpc
+
+group_cache_opts = [
+    cfg.BoolOpt('scheduler_cache_group_hosts',
+                default=False,
+                help='Cache the hosts of the server group members in the '
+                     'scheduler, instead of loading all the members of a '
+                     'group for each request with a group hint. The '
+                     'cached hosts of the instances deleted or moved are '
+                     'dropped when their notifications are received on '
+                     'scheduler_group_cache_topic. Each notification is '
+                     'only received by one scheduler, so it must only be '
+                     'enabled with a single scheduler service. It is '
+                     'ignored when scheduler_workers is more than 1.'),
+    cfg.StrOpt('scheduler_group_cache_topic',
+               default='scheduler_notifications',
+               help='Notification topic the scheduler listens on to drop '
+                    'the cached hosts of the server group members deleted '
+                    'or moved. It must be added to notification_topics.'),
+    cfg.IntOpt('scheduler_group_cache_size',
+               default=10000,
+               help='Maximum number of server group members whose host is '
+                    'cached by the scheduler. The least recently used '
+                    'members are evicted first.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(group_cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Notifications after which an instance may have left its host.
+INVALIDATING_EVENTS = frozenset([
+    'compute.instance.delete.end',
+    'compute.instance.soft_delete.end',
+    'compute.instance.finish_resize.end',
+    'compute.instance.resize.revert.end',
+    'compute.instance.live_migration.post.dest.end',
+    'compute.instance.rebuild.end',
+    'compute.instance.shelve_offload.end',
+    'compute.instance.unshelve.end',
+])
+
+
+class GroupHostsCache(object):
+    """Hosts of the server group members, keyed by instance uuid."""
+
+    def __init__(self):
+        # Maps instance uuids to their host, or to None for the deleted
+        # instances, from the least to the most recently used. Members not
+        # scheduled yet are not cached.
+        self._hosts = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def _load(self, context, instance_uuids):
+        filters = {'uuid': instance_uuids, 'deleted': False}
+        instances = objects.InstanceList.get_by_filters(context,
+                                                        filters=filters)
+        return dict((instance.uuid, instance) for instance in instances)
+
+    def _cache(self, instance_uuid, host):
+        # NOTE: Re-inserted so that it is the most recently used.
+        self._hosts.pop(instance_uuid, None)
+        self._hosts[instance_uuid] = host
+        while len(self._hosts) > CONF.scheduler_group_cache_size:
+            self._hosts.popitem(last=False)
+
+    def get_hosts(self, context, group):
+        """Return the set of hosts of the members of the group.
+
+        Only the members which are not cached are loaded from the database.
+        """
+        members = {}
+        missing = []
+        for uuid in group.members:
+            if uuid in self._hosts:
+                members[uuid] = self._hosts[uuid]
+            else:
+                missing.append(uuid)
+        if missing:
+            loaded = self._load(context, missing)
+            for uuid in missing:
+                if uuid not in loaded:
+                    members[uuid] = None
+                elif loaded[uuid].host:
+                    members[uuid] = loaded[uuid].host
+        # NOTE: The hosts are returned from members, as the group may be
+        # larger than the cache.
+        for uuid, host in members.iteritems():
+            self._cache(uuid, host)
+        return set(host for host in members.itervalues() if host)
+
+    def record(self, instance_uuid, host):
+        """Record the host an instance was scheduled to."""
+        self._cache(instance_uuid, host)
+
+    def invalidate(self, instance_uuid):
+        """Drop the cached host of an instance deleted or moved."""
+        self._hosts.pop(instance_uuid, None)
+
+    def reconcile(self, context):
+        """Reload the hosts of the cached instances from the database.
+
+        The hosts recorded for the instances which do not have a host in
+        the database yet, as they are still being built, are kept. The
+        instances which are no longer in the database, or which have no
+        host while they are not building anymore, are dropped.
+        """
+        uuids = self._hosts.keys()
+        if not uuids:
+            return
+        loaded = self._load(context, uuids)
+        for uuid in uuids:
+            instance = loaded.get(uuid)
+            if instance is None or (not instance.host and
+                                    instance.vm_state != vm_states.BUILDING):
+                # NOTE: The host of a failed build is cleared.
+                self._hosts.pop(uuid, None)
+            elif instance.host and uuid in self._hosts:
+                self._hosts[uuid] = instance.host
+        LOG.debug("Reconciled the hosts of %d server group members",
+                  len(uuids))
+
+
+class GroupHostsNotificationEndpoint(object):
+    """Drops the cached hosts of the instances deleted or moved."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def info(self, ctxt, publisher_id, event_type, payload, metadata):
+        if event_type in INVALIDATING_EVENTS:
+            instance_uuid = payload.get('instance_id')
+            if instance_uuid:
+                self.cache.invalidate(instance_uuid)
+
+
+def get_notification_listener(cache):
+    """Return a listener dropping the hosts of the cache when notified."""
+    targets = [messaging.Target(topic=CONF.scheduler_group_cache_topic)]
+    endpoints = [GroupHostsNotificationEndpoint(cache)]
+    return messaging.get_notification_listener(rpc.TRANSPORT, targets,
+                                               endpoints, executor='eventlet')
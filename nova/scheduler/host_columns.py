@@ -0,0 +1,138 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar views of host states, used by the batch filtering and weighing
+engine.
+
+Filters and weighers may implement a batch method working on a
+HostStateColumns instead of on a single HostState. Each numeric attribute
+of the host states is then gathered once into a NumPy array shared by all
+the filters (or weighers) run over the same hosts, and each check is a
+single vectorized operation over all the hosts.
+"""
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, the per host filtering and weighing is used when
+    # it is not installed.
+    numpy = None
+
+from oslo.config import cfg
+
+batch_engine_opts = [
+    cfg.BoolOpt('scheduler_use_batch_engine',
+                default=False,
+                help='Run the filters and weighers which provide a batch '
+                     'implementation over columnar arrays of the host '
+                     'states instead of host by host. Requires NumPy. '
+                     'Filters and weighers without a batch implementation '
+                     'are still run host by host.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(batch_engine_opts)
+
+
+def batch_engine_enabled():
+    """Return True if the batch engine is enabled and can be used."""
+    return CONF.scheduler_use_batch_engine and numpy is not None
+
+
+class HostStateColumns(object):
+    """Columnar view of a list of host states.
+
+    Columns are built lazily, the first time they are accessed, and cached
+    for the lifetime of the view. The view must not be used anymore once
+    the underlying host states have been updated.
+    """
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        # Hosts still passing the filters; maintained by the filter handler
+        # so that batch filters only record limits on candidate hosts.
+        self.mask = numpy.ones(len(self.host_states), dtype=bool)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def __getitem__(self, name):
+        """Return the float column for a HostState attribute.
+
+        Unset (None) values are stored as 0.
+        """
+        column = self._columns.get(name)
+        if column is None:
+            column = numpy.fromiter(
+                (getattr(host_state, name) or 0
+                 for host_state in self.host_states),
+                dtype=float, count=len(self.host_states))
+            self._columns[name] = column
+        return column
+
+    def metric(self, name):
+        """Return the column of a metric value, NaN where it is missing."""
+        key = ('metrics', name)
+        column = self._columns.get(key)
+        if column is None:
+            nan = float('nan')
+            column = numpy.fromiter(
+                (host_state.metrics[name].value
+                 if name in host_state.metrics else nan
+                 for host_state in self.host_states),
+                dtype=float, count=len(self.host_states))
+            self._columns[key] = column
+        return column
+
+    def set_limits(self, key, values, where):
+        """Record a limit on the candidate host states selected by 'where'.
+
+        :param key: key of the limit in HostState.limits
+        :param values: column holding the limit of each host
+        :param where: boolean column selecting the hosts to update
+        """
+        for i in numpy.flatnonzero(where & self.mask):
+            self.host_states[i].limits[key] = float(values[i])
+
+    def selected(self):
+        """Return the host states which are still candidates."""
+        return [self.host_states[i] for i in numpy.flatnonzero(self.mask)]
+
+
+def normalize(weights, minval=None, maxval=None, bounds=None):
+    """Vectorized equivalent of nova.weights.normalize().
+
+    As in BaseWeigher.weigh_objects(), minval and maxval are only initial
+    bounds, widened by the weights lying out of them. The (minval, maxval)
+    bounds given by BaseWeigher.weight_bounds() are authoritative instead,
+    the weights are clipped to them rather than scanned.
+    """
+    if not len(weights):
+        return weights
+    if bounds is not None:
+        minval, maxval = float(bounds[0]), float(bounds[1])
+        if minval == maxval:
+            return numpy.zeros(len(weights))
+        return ((numpy.clip(weights, minval, maxval) - minval) /
+                (maxval - minval))
+    maxval = weights.max() if maxval is None else max(maxval, weights.max())
+    minval = weights.min() if minval is None else min(minval, weights.min())
+    maxval = float(maxval)
+    minval = float(minval)
+    if minval == maxval:
+        return numpy.zeros(len(weights))
+    return (weights - minval) / (maxval - minval)
@@ -18,6 +18,7 @@ Manage hosts in the current zone.
 """
 
 import collections
+import datetime
 import UserDict
 
 from oslo.config import cfg
@@ -32,6 +33,7 @@ from nova.i18n import _, _LW
 from nova.openstack.common import log as logging
 from nova.pci import stats as pci_stats
 from nova.scheduler import filters
+from nova.scheduler import trace
 from nova.scheduler import weights
 from nova.virt import hardware
 
@@ -58,6 +60,32 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_host_state_incremental_refresh',
+                default=False,
+                help='If True, the host states are loaded once from the '
+                     'database and then only updated with the compute '
+                     'nodes that were created, updated or deleted since '
+                     'the last refresh, instead of loading every compute '
+                     'node for each scheduling request.'),
+    cfg.IntOpt('scheduler_host_state_max_staleness',
+               default=0,
+               help='Number of seconds during which the cached host states '
+                    'are used as-is, without querying the database for '
+                    'changes. Only used when '
+                    'scheduler_host_state_incremental_refresh is True. '
+                    'A value of 0 checks for changes on every request.'),
+    cfg.IntOpt('scheduler_host_state_full_resync_interval',
+               default=600,
+               help='Number of seconds after which the cached host states '
+                    'are fully reloaded from the database. Only used when '
+                    'scheduler_host_state_incremental_refresh is True.'),
+    cfg.IntOpt('scheduler_host_state_watermark_margin',
+               default=60,
+               help='Number of seconds by which the changes of the compute '
+                    'nodes are looked up before the previous refresh, to '
+                    'catch the rows committed late or written by hosts whose '
+                    'clock is behind the one of the database. Only used '
+                    'when scheduler_host_state_incremental_refresh is True.'),
     ]
 
 CONF = cfg.CONF
@@ -103,6 +131,28 @@ MetricItem = collections.namedtuple(
              'MetricItem', ['value', 'timestamp', 'source'])
 
 
+class AggregateMetadataMap(object):
+    """Lazily loaded map of hosts to the metadata of their aggregates.
+
+    The metadata of every aggregate is loaded with a single query the first
+    time it is needed, instead of once per host for each filter using it.
+    """
+
+    def __init__(self):
+        self._metadata = None
+
+    def get_by_host(self, context, host, key=None):
+        """Same as db.aggregate_metadata_get_by_host(), without a query."""
+        if self._metadata is None:
+            self._metadata = db.aggregate_metadata_get_all_by_host(context)
+        metadata = self._metadata.get(host, {})
+        if key is None:
+            return metadata
+        if key in metadata:
+            return {key: metadata[key]}
+        return {}
+
+
 class HostState(object):
     """Mutable and immutable information tracked for a host.
     This is an attempt to remove the ad-hoc data structures
@@ -142,6 +192,20 @@ class HostState(object):
         # Generic metrics from compute nodes
         self.metrics = {}
 
+        # Metadata of the aggregates the host is in, an AggregateMetadataMap
+        # shared by all the host states of a refresh.
+        self.aggregate_metadata = None
+
+        # Number of instances on the host per project id and per instance
+        # type id (as strings), from the stats of the compute node. The
+        # latter is None when the compute node does not report it.
+        self.num_instances_by_project = {}
+        self.num_instances_by_type = None
+
+        # Id and generation of the compute node, used to claim resources.
+        self.compute_node_id = None
+        self.generation = None
+
         self.updated = None
         if compute:
             self.update_from_compute_node(compute)
@@ -169,6 +233,27 @@ class HostState(object):
             else:
                 LOG.warn(_LW("Metric name unknown of %r"), item)
 
+    def _update_instance_counts_from_stats(self):
+        by_project = {}
+        by_type = {}
+        for key, value in self.stats.iteritems():
+            if key.startswith('num_proj_'):
+                counts, key = by_project, key[len('num_proj_'):]
+            elif key.startswith('num_type_'):
+                counts, key = by_type, key[len('num_type_'):]
+            else:
+                continue
+            value = int(value)
+            if value > 0 and key != 'None':
+                counts[key] = value
+        self.num_instances_by_project = by_project
+        if by_type or not self.num_instances:
+            self.num_instances_by_type = by_type
+        else:
+            # NOTE: The compute node does not count its instances per type
+            # yet, the filters have to look them up.
+            self.num_instances_by_type = None
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
         if (self.updated and compute['updated_at']
@@ -198,6 +283,8 @@ class HostState(object):
         self.vcpus_total = compute['vcpus']
         self.vcpus_used = compute['vcpus_used']
         self.updated = compute['updated_at']
+        self.compute_node_id = compute.get('id')
+        self.generation = compute.get('generation')
         self.numa_topology = compute['numa_topology']
         if 'pci_stats' in compute:
             self.pci_stats = pci_stats.PciDeviceStats(compute['pci_stats'])
@@ -225,6 +312,8 @@ class HostState(object):
 
         self.num_io_ops = int(self.stats.get('io_workload', 0))
 
+        self._update_instance_counts_from_stats()
+
         # update metrics
         self._update_metrics_from_compute_node(compute)
 
@@ -240,6 +329,17 @@ class HostState(object):
 
         # Track number of instances on host
         self.num_instances += 1
+        project_id = instance.get('project_id')
+        if project_id is not None:
+            project_id = str(project_id)
+            self.num_instances_by_project[project_id] = (
+                self.num_instances_by_project.get(project_id, 0) + 1)
+        instance_type_id = instance.get('instance_type_id')
+        if (self.num_instances_by_type is not None and
+                instance_type_id is not None):
+            instance_type_id = str(instance_type_id)
+            self.num_instances_by_type[instance_type_id] = (
+                self.num_instances_by_type.get(instance_type_id, 0) + 1)
 
         pci_requests = instance.get('pci_requests')
         if pci_requests and pci_requests.requests and self.pci_stats:
@@ -274,6 +374,14 @@ class HostManager(object):
 
     def __init__(self):
         self.host_state_map = {}
+        # Maps compute node ids to (state_key, service_id), used to apply
+        # incremental refreshes to host_state_map.
+        self._compute_node_index = {}
+        # Highest created/updated/deleted timestamp seen in the compute
+        # nodes loaded so far, and when the host states were last refreshed.
+        self._compute_node_watermark = None
+        self._last_full_refresh = None
+        self._last_refresh = None
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -378,43 +486,219 @@ class HostManager(object):
         return self.filter_handler.get_filtered_objects(filter_classes,
                 hosts, filter_properties, index)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
+    def get_filter_stats(self):
+        """Return the execution time and rejection rate of the filters.
+
+        The stats are only recorded when scheduler_adaptive_filter_order is
+        enabled.
+        """
+        return self.filter_handler.filter_stats.to_dict()
+
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None,
+                          cache=None):
+        """Weigh the hosts.
+
+        :param limit: only return the 'limit' best weighed hosts.
+        :param cache: a nova.weights.WeightCache holding the raw weights of
+                      the hosts which were already weighed.
+        """
         return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit, cache=cache)
+
+    def claim_from_instance(self, context, host_state, instance):
+        """Claim the resources of an instance on a compute node in the db.
+
+        The claim only succeeds if the compute node was not updated, by
+        another scheduler or by its compute service, since the host state
+        was last refreshed. Otherwise the host state is refreshed from the
+        db so that it can be filtered and weighed again.
+
+        :returns: True if the claim succeeded, False otherwise.
+
+        Raises ComputeHostNotFound if the compute node was deleted.
+        """
+        if host_state.compute_node_id is None or host_state.generation is None:
+            return True
+        try:
+            with trace.step('db.compute_node_claim'):
+                host_state.generation = db.compute_node_claim(context,
+                        host_state.compute_node_id, host_state.generation,
+                        instance['vcpus'], instance['memory_mb'],
+                        instance['root_gb'] + instance['ephemeral_gb'])
+            return True
+        except exception.ComputeNodeClaimConflict:
+            LOG.debug("Claim on %(host_state)s conflicted with a concurrent "
+                      "update, refreshing it", {'host_state': host_state})
+
+        with trace.step('db.compute_node_get'):
+            compute = db.compute_node_get(context,
+                                          host_state.compute_node_id)
+        # NOTE: The host state may have been consumed from more recently
+        # than the compute node was updated, the refresh must be forced.
+        host_state.updated = None
+        host_state.update_from_compute_node(compute)
+        return False
+
+    def release_from_instance(self, context, host_state, instance):
+        """Give back the resources claimed by claim_from_instance().
+
+        Called for the hosts claimed for the instances of a request which
+        can't be scheduled as a whole, so that their compute nodes don't
+        keep the usage of instances which will never be built on them.
+        """
+        if host_state.compute_node_id is None or host_state.generation is None:
+            return
+        with trace.step('db.compute_node_release'):
+            db.compute_node_release(context, host_state.compute_node_id,
+                    instance['vcpus'], instance['memory_mb'],
+                    instance['root_gb'] + instance['ephemeral_gb'])
 
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
+        if not CONF.scheduler_host_state_incremental_refresh:
+            self._refresh_all_host_states(context)
+        else:
+            now = timeutils.utcnow()
+            if (self._last_full_refresh is None or
+                    timeutils.is_older_than(
+                        self._last_full_refresh,
+                        CONF.scheduler_host_state_full_resync_interval)):
+                self._refresh_all_host_states(context)
+                self._last_full_refresh = now
+                self._last_refresh = now
+            elif (CONF.scheduler_host_state_max_staleness <= 0 or
+                    timeutils.is_older_than(
+                        self._last_refresh,
+                        CONF.scheduler_host_state_max_staleness)):
+                self._refresh_changed_host_states(context)
+                self._last_refresh = now
+
+        aggregate_metadata = AggregateMetadataMap()
+        for host_state in self.host_state_map.itervalues():
+            host_state.aggregate_metadata = aggregate_metadata
+
+        return self.host_state_map.itervalues()
+
+    def _get_watermark(self, context):
+        """Get the point in time the next incremental refresh starts from.
+
+        It is taken from the database clock before querying the compute
+        nodes, so that it doesn't depend on the clocks of the hosts writing
+        them, and moved back by a margin covering the transactions which
+        are committed after the query but stamped before it.
+        """
+        now = db.db_utcnow(context)
+        return now - datetime.timedelta(
+                seconds=CONF.scheduler_host_state_watermark_margin)
+
+    def _update_host_state(self, compute, service, reset=False):
+        host = service['host']
+        node = compute.get('hypervisor_hostname')
+        state_key = (host, node)
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            if reset:
+                # Forget what was consumed since the last refresh.
+                host_state.updated = None
+            host_state.update_from_compute_node(compute)
+        else:
+            host_state = self.host_state_cls(host, node, compute=compute)
+            self.host_state_map[state_key] = host_state
+        host_state.update_service(dict(service.iteritems()))
+        self._compute_node_index[compute['id']] = (
+                state_key, compute.get('service_id'), compute)
+        return state_key
+
+    def _remove_host_state(self, state_key):
+        host, node = state_key
+        LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                   "from scheduler") % {'host': host, 'node': node})
+        del self.host_state_map[state_key]
+
+    def _refresh_all_host_states(self, context):
+        """Load every compute node from the database."""
+
+        incremental = CONF.scheduler_host_state_incremental_refresh
+        watermark = None
+        if incremental:
+            watermark = self._get_watermark(context)
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        with trace.step('db.compute_node_get_all'):
+            compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
+        self._compute_node_index = {}
+        self._compute_node_watermark = watermark
         for compute in compute_nodes:
             service = compute['service']
             if not service:
                 LOG.warn(_LW("No service for compute ID %s"), compute['id'])
                 continue
-            host = service['host']
-            node = compute.get('hypervisor_hostname')
-            state_key = (host, node)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_from_compute_node(compute)
-            else:
-                host_state = self.host_state_cls(host, node, compute=compute)
-                self.host_state_map[state_key] = host_state
-            host_state.update_service(dict(service.iteritems()))
-            seen_nodes.add(state_key)
+            seen_nodes.add(self._update_host_state(compute, service,
+                                                   reset=incremental))
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
         for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+            self._remove_host_state(state_key)
 
-        return self.host_state_map.itervalues()
+    def _refresh_changed_host_states(self, context):
+        """Apply the compute nodes changed since the last refresh.
+
+        Services are small and their heartbeats are needed by the filters,
+        so they are always reloaded; only the compute nodes, which carry
+        the large stats, topology and PCI blobs, are fetched incrementally.
+        The host states of the unchanged compute nodes are reset from the
+        compute nodes they were last loaded from, as a full refresh does.
+        """
+        if self._compute_node_watermark is None:
+            # Nothing was loaded yet, there is nothing to be incremental on.
+            self._refresh_all_host_states(context)
+            return
+
+        watermark = self._get_watermark(context)
+        with trace.step('db.compute_node_get_all_changed_since'):
+            changed_nodes = db.compute_node_get_all_changed_since(
+                    context, self._compute_node_watermark)
+        with trace.step('db.service_get_all'):
+            services = dict((service['id'], service)
+                            for service in db.service_get_all(context)
+                            if service['binary'] == 'nova-compute')
+
+        for compute in changed_nodes:
+            service = services.get(compute.get('service_id'))
+            indexed = self._compute_node_index.pop(compute['id'], None)
+            if indexed:
+                state_key = indexed[0]
+                if (compute.get('deleted') or not service or
+                        state_key != (service['host'],
+                                      compute.get('hypervisor_hostname'))):
+                    if state_key in self.host_state_map:
+                        self._remove_host_state(state_key)
+            if compute.get('deleted'):
+                continue
+            if not service:
+                LOG.warn(_LW("No service for compute ID %s"), compute['id'])
+                continue
+            self._update_host_state(compute, service, reset=True)
+
+        for compute_id, (state_key, service_id, compute) in (
+                self._compute_node_index.items()):
+            service = services.get(service_id)
+            if not service:
+                del self._compute_node_index[compute_id]
+                if state_key in self.host_state_map:
+                    self._remove_host_state(state_key)
+                continue
+            host_state = self.host_state_map.get(state_key)
+            if host_state:
+                host_state.update_service(dict(service.iteritems()))
+                if host_state.updated != compute.get('updated_at'):
+                    # NOTE: The host state was consumed from since it was
+                    # loaded from its compute node.
+                    host_state.updated = None
+                    host_state.update_from_compute_node(compute)
+        self._compute_node_watermark = watermark
@@ -55,6 +55,22 @@ CONF.register_opts(host_manager_opts)
 
 LOG = logging.getLogger(__name__)
 
+# The supported instances of the nodes, loaded once for each distinct value
+# as the nodes of a fleet usually all report the same ones. They must not
+# be modified.
+_supported_instances = {}
+_SUPPORTED_INSTANCES_CACHE_SIZE = 256
+
+
+def _load_supported_instances(blob):
+    supported_instances = _supported_instances.get(blob)
+    if supported_instances is None:
+        if len(_supported_instances) >= _SUPPORTED_INSTANCES_CACHE_SIZE:
+            _supported_instances.clear()
+        supported_instances = jsonutils.loads(blob)
+        _supported_instances[blob] = supported_instances
+    return supported_instances
+
 
 class IronicNodeState(bbhm.BaseBaremetalNodeState):
     """Mutable and immutable information tracked for a host.
@@ -72,7 +88,7 @@ class IronicNodeState(bbhm.BaseBaremetalNodeState):
         self.hypervisor_hostname = compute.get('hypervisor_hostname')
         self.cpu_info = compute.get('cpu_info')
         if compute.get('supported_instances'):
-            self.supported_instances = jsonutils.loads(
+            self.supported_instances = _load_supported_instances(
                     compute.get('supported_instances'))
         self.updated = compute['updated_at']
 
@@ -34,6 +34,8 @@ from nova import objects
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
 from nova import quota
+from nova.scheduler import batching
+from nova.scheduler import group_cache
 from nova.scheduler import utils as scheduler_utils
 
 
@@ -50,6 +52,19 @@ scheduler_driver_opts = [
                     'Please note this is likely to interact with the value '
                     'of service_down_time, but exactly how they interact '
                     'will depend on your choice of scheduler driver.'),
+    cfg.IntOpt('scheduler_workers',
+               default=1,
+               help='Number of workers for the scheduler service. When more '
+                    'than one, scheduler_optimistic_claims must be enabled '
+                    'to prevent the workers from picking the same '
+                    'resources.'),
+    cfg.IntOpt('scheduler_batch_window_ms',
+               default=0,
+               help='Number of milliseconds the select_destinations '
+                    'requests are gathered for, to be placed together '
+                    'against host states loaded once for all of them. '
+                    'Only used with scheduler drivers supporting it, like '
+                    'the FilterScheduler. 0 disables the batching.'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(scheduler_driver_opts)
@@ -67,9 +82,29 @@ class SchedulerManager(manager.Manager):
             scheduler_driver = CONF.scheduler_driver
         self.driver = importutils.import_object(scheduler_driver)
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
+        self._group_cache_listener = None
+        if (CONF.scheduler_batch_window_ms > 0 and
+                hasattr(self.driver, 'select_destinations_batch')):
+            self._batcher = batching.RequestBatcher(
+                self.driver.select_destinations_batch,
+                CONF.scheduler_batch_window_ms / 1000.0)
+        else:
+            self._batcher = None
         super(SchedulerManager, self).__init__(service_name='scheduler',
                                                *args, **kwargs)
 
+    def post_start_hook(self):
+        group_hosts = getattr(self.driver, 'group_hosts', None)
+        if group_hosts is not None:
+            self._group_cache_listener = (
+                group_cache.get_notification_listener(group_hosts))
+            self._group_cache_listener.start()
+
+    def cleanup_host(self):
+        if self._group_cache_listener is not None:
+            self._group_cache_listener.stop()
+            self._group_cache_listener = None
+
     # NOTE(alaski): Remove this method when the scheduler rpc interface is
     # bumped to 4.x as it is no longer used.
     def run_instance(self, context, request_spec, admin_password,
@@ -171,6 +206,10 @@ class SchedulerManager(manager.Manager):
         The result should be a list of dicts with 'host', 'nodename' and
         'limits' as keys.
         """
-        dests = self.driver.select_destinations(context, request_spec,
-            filter_properties)
+        if self._batcher is not None:
+            dests = self._batcher.submit(context, request_spec,
+                                         filter_properties)
+        else:
+            dests = self.driver.select_destinations(context, request_spec,
+                filter_properties)
         return jsonutils.to_primitive(dests)
@@ -0,0 +1,132 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Per request tracing of the time spent in each step of the scheduler.
+
+A trace is started for a scheduling request when an admin request context
+asks for it (see RequestContext.scheduler_trace, set from the
+X-Nova-Scheduler-Trace header by the API) or when the request is sampled,
+following scheduler_trace_sample_rate. The steps run while the trace is
+active record their time in it, and the trace is then logged and sent as a
+'scheduler.trace' notification.
+"""
+
+import contextlib
+import random
+import threading
+import time
+
+from oslo.config import cfg
+from oslo.serialization import jsonutils
+
+from nova.i18n import _LI
+from nova.openstack.common import log as logging
+
+trace_opts = [
+    cfg.FloatOpt('scheduler_trace_sample_rate',
+                 default=0.0,
+                 help='Fraction of the scheduling requests for which the '
+                      'time spent in each step of the scheduler is traced, '
+                      'logged and notified, between 0.0 and 1.0. Requests '
+                      'made with a context asking for a trace are always '
+                      'traced.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(trace_opts)
+
+LOG = logging.getLogger(__name__)
+
+# NOTE: threading.local is a greenthread local once eventlet monkey patched
+# the threading module.
+_local = threading.local()
+
+
+class SchedulerTrace(object):
+    """Time spent in each step of a scheduling request."""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.start = time.time()
+        self.elapsed = None
+        # Maps step names to {'calls', 'seconds'} dicts, plus any extra
+        # counter recorded with the step.
+        self.steps = {}
+
+    def record(self, name, elapsed, **counters):
+        step = self.steps.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        step['calls'] += 1
+        step['seconds'] += elapsed
+        for key, value in counters.items():
+            step[key] = step.get(key, 0) + value
+
+    def finish(self):
+        self.elapsed = time.time() - self.start
+
+    def to_dict(self):
+        return {'request_id': self.request_id,
+                'seconds': self.elapsed,
+                'steps': self.steps}
+
+
+def start(context):
+    """Start a trace for the request if it is wanted, return it or None."""
+    if ((getattr(context, 'scheduler_trace', False) and context.is_admin) or
+            random.random() < CONF.scheduler_trace_sample_rate):
+        trace = SchedulerTrace(context.request_id)
+    else:
+        trace = None
+    _local.trace = trace
+    return trace
+
+
+def current():
+    """Return the trace of the request being scheduled, or None."""
+    return getattr(_local, 'trace', None)
+
+
+def finish(context, notifier):
+    """Stop the current trace, log and notify it."""
+    trace = current()
+    if trace is None:
+        return
+    _local.trace = None
+    trace.finish()
+    payload = trace.to_dict()
+    LOG.info(_LI("Scheduler trace: %s"), jsonutils.dumps(payload),
+             context=context)
+    notifier.info(context, 'scheduler.trace', payload)
+
+
+def record(name, elapsed, **counters):
+    """Record the time spent in a step, if the request is traced."""
+    trace = current()
+    if trace is not None:
+        trace.record(name, elapsed, **counters)
+
+
+@contextlib.contextmanager
+def step(name):
+    """Context manager recording the time spent in a step."""
+    trace = current()
+    if trace is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        trace.record(name, time.time() - start)
@@ -17,14 +17,20 @@
 Scheduler host weights
 """
 
+import time
+
 from oslo.config import cfg
 
+from nova.scheduler import host_columns
+from nova.scheduler import trace
 from nova import weights
 
 CONF = cfg.CONF
 
 
 class WeighedHost(weights.WeighedObject):
+    __slots__ = ()
+
     def to_dict(self):
         x = dict(weight=self.weight)
         x['host'] = self.obj.host
@@ -37,7 +43,16 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_objects_batch(self, columns, weight_properties):
+        """Return an array with the raw weight of each host.
+
+        Optionally override this in a subclass, with a vectorized version
+        of _weigh_object() working on a host_columns.HostStateColumns.
+        Return None if the batch weighing can't be done, weigh_objects()
+        is then used.
+        """
+        return None
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -46,6 +61,50 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def weigher_finished(self, cls_name, elapsed):
+        trace.record('weigher.%s' % cls_name, elapsed)
+
+    def get_weighed_objects(self, weigher_classes, obj_list,
+            weighing_properties, limit=None, cache=None):
+        if not obj_list or not host_columns.batch_engine_enabled():
+            return super(HostWeightHandler, self).get_weighed_objects(
+                    weigher_classes, obj_list, weighing_properties,
+                    limit=limit, cache=cache)
+
+        columns = host_columns.HostStateColumns(obj_list)
+        total = host_columns.numpy.zeros(len(columns))
+        weighed_objs = None
+        for weigher_cls in weigher_classes:
+            start = time.time()
+            weigher = weigher_cls()
+            bounds = weigher.weight_bounds(columns.host_states,
+                                           weighing_properties)
+            if bounds is not None:
+                weigher.minval, weigher.maxval = bounds
+            raw_weights = weigher.weigh_objects_batch(columns,
+                                                      weighing_properties)
+            if raw_weights is None:
+                if weighed_objs is None:
+                    weighed_objs = [self.object_class(obj, 0.0)
+                                    for obj in columns.host_states]
+                raw_weights = host_columns.numpy.array(
+                        weigher.weigh_objects(weighed_objs,
+                                              weighing_properties),
+                        dtype=float)
+            if bounds is not None:
+                normalized = host_columns.normalize(raw_weights,
+                                                    bounds=bounds)
+            else:
+                normalized = host_columns.normalize(raw_weights,
+                                                    minval=weigher.minval,
+                                                    maxval=weigher.maxval)
+            total += weigher.weight_multiplier() * normalized
+            self.weigher_finished(weigher_cls.__name__, time.time() - start)
+
+        weighed_objs = [self.object_class(obj, float(weight))
+                        for obj, weight in zip(columns.host_states, total)]
+        return weights.top_weighed_objects(weighed_objs, limit)
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
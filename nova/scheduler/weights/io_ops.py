@@ -49,3 +49,6 @@ class IoOpsWeigher(weights.BaseHostWeigher):
         to be the default.
         """
         return host_state.num_io_ops
+
+    def weigh_objects_batch(self, columns, weight_properties):
+        return columns['num_io_ops']
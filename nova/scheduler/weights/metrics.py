@@ -29,6 +29,7 @@ in the configuration file as the followings:
 from oslo.config import cfg
 
 from nova import exception
+from nova.scheduler import host_columns
 from nova.scheduler import utils
 from nova.scheduler import weights
 
@@ -102,3 +103,29 @@ class MetricsWeigher(weights.BaseHostWeigher):
                         return CONF.metrics.weight_of_unavailable
 
         return value
+
+    def weigh_objects_batch(self, columns, weight_properties):
+        numpy = host_columns.numpy
+        values = numpy.zeros(len(columns))
+        unavailable = numpy.zeros(len(columns), dtype=bool)
+
+        for (name, ratio) in self.setting:
+            metric = columns.metric(name)
+            missing = numpy.isnan(metric)
+            if missing.any():
+                if CONF.metrics.required:
+                    host_state = columns.host_states[
+                            numpy.flatnonzero(missing)[0]]
+                    raise exception.ComputeHostMetricNotFound(
+                            host=host_state.host,
+                            node=host_state.nodename,
+                            name=name)
+                # See _weigh_object() for the handling of unavailable
+                # metrics.
+                if ratio * self.weight_multiplier() != 0:
+                    unavailable |= missing
+                metric = numpy.where(missing, 0.0, metric)
+            values += metric * ratio
+
+        values[unavailable] = CONF.metrics.weight_of_unavailable
+        return values
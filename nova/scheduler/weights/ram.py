@@ -29,6 +29,13 @@ ram_weight_opts = [
                      default=1.0,
                      help='Multiplier used for weighing ram.  Negative '
                           'numbers mean to stack vs spread.'),
+        cfg.BoolOpt('ram_weight_capacity_bounds',
+                    default=False,
+                    help='Normalize the free ram of the hosts against the '
+                         'ram of the largest host, instead of against the '
+                         'range of the free ram of the hosts. This lowers '
+                         'the weight of the ram relative to the other '
+                         'weighers when no host is empty.'),
 ]
 
 CONF = cfg.CONF
@@ -45,3 +52,16 @@ class RAMWeigher(weights.BaseHostWeigher):
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
         return host_state.free_ram_mb
+
+    def weight_bounds(self, host_states, weight_properties):
+        """The free RAM can be weighed against the RAM of the largest host.
+
+        A negative free RAM, from an oversubscribed host, is weighed as 0.
+        """
+        if not CONF.ram_weight_capacity_bounds or not host_states:
+            return None
+        return 0, max(host_state.total_usable_ram_mb
+                      for host_state in host_states)
+
+    def weigh_objects_batch(self, columns, weight_properties):
+        return columns['free_ram_mb']
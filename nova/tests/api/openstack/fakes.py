@@ -423,6 +423,9 @@ def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
         if 'use_slave' in kwargs:
             kwargs.pop('use_slave')
 
+        if 'compact_metadata' in kwargs:
+            kwargs.pop('compact_metadata')
+
         for i in xrange(num_servers):
             uuid = get_fake_uuid(i)
             server = stub_instance(id=i + 1, uuid=uuid,
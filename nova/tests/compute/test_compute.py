@@ -6401,7 +6401,9 @@ class ComputeTestCase(BaseTestCase):
                                             marker=None,
                                             columns_to_join=[],
                                             use_slave=True,
-                                            limit=None)
+                                            limit=None,
+                                            columns=None,
+                                            compact_metadata=False)
             self.assertThat(conductor_instance_update.mock_calls,
                             testtools_matchers.HasLength(len(old_instances)))
             self.assertThat(node_is_available.mock_calls,
@@ -1422,6 +1422,22 @@ class TrackerPeriodicTestCase(BaseTrackerTestCase):
         self.tracker.update_available_resource(self.context)
         self.assertEqual(2, self.update_call_count)
 
+    def test_periodic_update_after_claim(self):
+        service = self._create_service(
+            compute=self._create_compute_node({'generation': 2}))
+        self.tracker._get_service = mock.Mock(return_value=service)
+
+        # verify update not called if the compute node wasn't changed since
+        # the last update
+        self.tracker.generation = 2
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, self.update_call_count)
+
+        # verify update is called if a scheduler claimed resources since
+        self.tracker.generation = 1
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+
     def test_update_available_resource_calls_locked_inner(self):
         @mock.patch.object(self.tracker, 'driver')
         @mock.patch.object(self.tracker,
@@ -190,6 +190,20 @@ class StatsTestCase(test.NoDBTestCase):
         self.assertEqual(0, self.stats.num_os_type("Linux"))
         self.assertEqual(0, self.stats["num_vm_" + vm_states.BUILDING])
 
+    def test_update_stats_for_instance_type_change(self):
+        instance = self._create_instance({"instance_type_id": 1})
+        self.stats.update_stats_for_instance(instance)
+        self.assertEqual(1, self.stats.num_instance_type(1))
+
+        instance["instance_type_id"] = 2
+        self.stats.update_stats_for_instance(instance)
+        self.assertEqual(0, self.stats.num_instance_type(1))
+        self.assertEqual(1, self.stats.num_instance_type(2))
+
+        instance["vm_state"] = vm_states.DELETED
+        self.stats.update_stats_for_instance(instance)
+        self.assertEqual(0, self.stats.num_instance_type(2))
+
     def test_io_workload(self):
         vms = [vm_states.ACTIVE, vm_states.BUILDING, vm_states.PAUSED]
         tasks = [task_states.RESIZE_MIGRATING, task_states.REBUILDING,
@@ -75,11 +75,12 @@ def _reservation_get(context, uuid):
     return result
 
 
-def _quota_reserve(context, project_id, user_id):
+def _quota_reserve(context, project_id, user_id, optimistic=False):
     """Create sample Quota, QuotaUsage and Reservation objects.
 
     There is no method db.quota_usage_create(), so we have to use
-    db.quota_reserve() for creating QuotaUsage objects.
+    db.quota_reserve() for creating QuotaUsage objects, or
+    db.quota_reserve_optimistic() if optimistic is True.
 
     Returns reservations uuids.
 
@@ -113,9 +114,13 @@ def _quota_reserve(context, project_id, user_id):
         setattr(sqlalchemy_api, sync_name, get_sync(resource, i))
         sqlalchemy_api.QUOTA_SYNC_FUNCTIONS[sync_name] = getattr(
             sqlalchemy_api, sync_name)
-    return db.quota_reserve(context, resources, quotas, user_quotas, deltas,
-                    timeutils.utcnow(), CONF.until_refresh,
-                    datetime.timedelta(days=1), project_id, user_id)
+    if optimistic:
+        reserve = db.quota_reserve_optimistic
+    else:
+        reserve = db.quota_reserve
+    return reserve(context, resources, quotas, user_quotas, deltas,
+                   timeutils.utcnow(), CONF.until_refresh,
+                   datetime.timedelta(days=1), project_id, user_id)
 
 
 class DbTestCase(test.TestCase):
@@ -251,6 +256,102 @@ class NotDbApiTestCase(DbTestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(stdlib_uuid.uuid4()))
 
+    def _paginate_instances(self, sort_dir, limit):
+        uuids = []
+        marker = None
+        while True:
+            result = db.instance_get_all_by_filters(self.context, {},
+                                                    'created_at', sort_dir,
+                                                    limit=limit,
+                                                    marker=marker)
+            if not result:
+                return uuids
+            self.assertTrue(len(result) <= limit)
+            uuids.extend(instance['uuid'] for instance in result)
+            marker = result[-1]['uuid']
+
+    def test_instance_get_all_by_filters_paginate_same_sort_key(self):
+        created_at = timeutils.utcnow().replace(microsecond=0)
+        instances = [self.create_instance_with_args(created_at=created_at)
+                     for i in range(5)]
+        instances.append(self.create_instance_with_args(
+            created_at=created_at + datetime.timedelta(seconds=1)))
+        uuids = [instance['uuid'] for instance in instances]
+
+        self.assertEqual(uuids, self._paginate_instances('asc', 2))
+        self.assertEqual(uuids[::-1], self._paginate_instances('desc', 2))
+
+    def test_instance_get_all_by_filters_columns(self):
+        self.create_instance_with_args(display_name='test1')
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                columns_to_join=[],
+                                                columns=['display_name'])
+        self.assertEqual(1, len(result))
+        self.assertEqual('test1', result[0]['display_name'])
+        self.assertIn('id', result[0])
+        self.assertIn('uuid', result[0])
+        self.assertNotIn('host', result[0])
+
+    def test_instance_get_all_by_host_columns(self):
+        ctxt = context.get_admin_context()
+        self.create_instance_with_args(vm_state='active')
+        result = db.instance_get_all_by_host(ctxt, 'host1',
+                                             columns=['vm_state'])
+        self.assertEqual(1, len(result))
+        self.assertEqual('active', result[0]['vm_state'])
+        self.assertNotIn('node', result[0])
+        self.assertEqual([], result[0]['metadata'])
+        # The default relationships are not joined.
+        self.assertNotIn('info_cache', result[0])
+        self.assertNotIn('security_groups', result[0])
+
+    def test_instance_get_all_by_host_columns_joins(self):
+        ctxt = context.get_admin_context()
+        self.create_instance_with_args()
+        result = db.instance_get_all_by_host(ctxt, 'host1',
+                                             columns_to_join=['info_cache'],
+                                             columns=['vm_state'])
+        self.assertEqual(1, len(result))
+        self.assertIn('info_cache', result[0])
+        self.assertNotIn('security_groups', result[0])
+
+    def test_instance_get_all_by_filters_compact_metadata(self):
+        instance = self.create_instance_with_args(
+            metadata={'foo': 'bar', 'gone': 'baz'},
+            system_metadata={'image_foo': 'bar'})
+        self.create_instance_with_args()
+        db.instance_metadata_delete(self.context, instance['uuid'], 'gone')
+        self.context.read_deleted = 'yes'
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                'created_at', 'asc',
+                                                compact_metadata=True)
+        self.assertEqual(2, len(result))
+        self.assertEqual({'foo': 'bar'}, result[0]['metadata'])
+        self.assertEqual({'image_foo': 'bar'},
+                         result[0]['system_metadata'])
+        self.assertEqual({}, result[1]['metadata'])
+        self.assertEqual({}, result[1]['system_metadata'])
+
+    def test_instance_get_all_by_host_compact_metadata(self):
+        ctxt = context.get_admin_context()
+        self.create_instance_with_args(metadata={'foo': 'bar'},
+                                       system_metadata={'image_foo': 'bar'})
+        result = db.instance_get_all_by_host(ctxt, 'host1',
+                                             columns_to_join=['metadata'],
+                                             compact_metadata=True)
+        self.assertEqual(1, len(result))
+        self.assertEqual({'foo': 'bar'}, result[0]['metadata'])
+        self.assertEqual({}, result[0]['system_metadata'])
+
+    def test_instance_get_all_by_filters_paginate_marker_other_project(self):
+        ctxt = context.RequestContext('user2', 'project2')
+        instance = self.create_instance_with_args(context=ctxt)
+
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, {}, 'created_at', 'desc',
+                          marker=instance['uuid'])
+
     def test_convert_objects_related_datetimes(self):
 
         t1 = timeutils.utcnow()
@@ -396,6 +497,33 @@ class AggregateDBApiTestCase(test.TestCase):
         self.assertEqual(r1['fake_key1'], set(['fake_value1']))
         self.assertNotIn('badkey', r1)
 
+    def test_aggregate_metadata_get_all_by_host(self):
+        ctxt = context.get_admin_context()
+        values2 = {'name': 'fake_aggregate12'}
+        values3 = {'name': 'fake_aggregate23'}
+        a2_hosts = ['foo1.openstack.org', 'foo2.openstack.org']
+        a2_metadata = {'good': 'value12', 'bad': 'badvalue12'}
+        a3_hosts = ['foo2.openstack.org', 'foo3.openstack.org']
+        a3_metadata = {'good': 'value23'}
+        _create_aggregate_with_hosts(context=ctxt, values=values2,
+                hosts=a2_hosts, metadata=a2_metadata)
+        a3 = _create_aggregate_with_hosts(context=ctxt, values=values3,
+                hosts=a3_hosts, metadata=a3_metadata)
+        _create_aggregate_with_hosts(context=ctxt,
+                values={'name': 'fake_aggregate34'},
+                hosts=['foo4.openstack.org'], metadata=None)
+        db.aggregate_metadata_delete(ctxt, a3['id'], 'good')
+
+        r1 = db.aggregate_metadata_get_all_by_host(ctxt)
+        self.assertEqual(set(['foo1.openstack.org', 'foo2.openstack.org']),
+                         set(r1.keys()))
+        self.assertEqual({'good': set(['value12']),
+                          'bad': set(['badvalue12'])},
+                         r1['foo2.openstack.org'])
+        for host in r1:
+            self.assertEqual(
+                db.aggregate_metadata_get_by_host(ctxt, host), r1[host])
+
     def test_aggregate_metadata_get_by_metadata_key(self):
         ctxt = context.get_admin_context()
         values = {'aggregate_id': 'fake_id',
@@ -1127,6 +1255,48 @@ class ReservationTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
                                             self.ctxt, 'project1', 'user1'))
 
+    def test_reservation_commit_optimistic(self):
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'resource1',
+                                   'user1')
+        db.reservation_commit_optimistic(self.ctxt, self.reservations,
+                                         'project1', 'user1')
+        self.assertRaises(exception.ReservationNotFound,
+            _reservation_get, self.ctxt, self.reservations[0])
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                'resource0': {'reserved': 0, 'in_use': 0},
+                'resource1': {'reserved': 0, 'in_use': 2},
+                'fixed_ips': {'reserved': 0, 'in_use': 4}}
+        self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
+                                            self.ctxt, 'project1', 'user1'))
+        self.assertEqual(usage['generation'] + 1,
+                         db.quota_usage_get(self.ctxt, 'project1',
+                                            'resource1',
+                                            'user1')['generation'])
+
+    def test_reservation_commit_optimistic_twice(self):
+        db.reservation_commit_optimistic(self.ctxt, self.reservations,
+                                         'project1', 'user1')
+        db.reservation_commit_optimistic(self.ctxt, self.reservations,
+                                         'project1', 'user1')
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                'resource0': {'reserved': 0, 'in_use': 0},
+                'resource1': {'reserved': 0, 'in_use': 2},
+                'fixed_ips': {'reserved': 0, 'in_use': 4}}
+        self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
+                                            self.ctxt, 'project1', 'user1'))
+
+    def test_reservation_rollback_optimistic(self):
+        db.reservation_rollback_optimistic(self.ctxt, self.reservations,
+                                           'project1', 'user1')
+        self.assertRaises(exception.ReservationNotFound,
+            _reservation_get, self.ctxt, self.reservations[0])
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                'resource0': {'reserved': 0, 'in_use': 0},
+                'resource1': {'reserved': 0, 'in_use': 1},
+                'fixed_ips': {'reserved': 0, 'in_use': 2}}
+        self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
+                                            self.ctxt, 'project1', 'user1'))
+
     def test_reservation_expire(self):
         db.reservation_expire(self.ctxt)
 
@@ -5539,6 +5709,90 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
             self.assertRaises(exception.ReservationNotFound,
                             _reservation_get, self.ctxt, r)
 
+    def test_quota_reserve_optimistic(self):
+        reservations = _quota_reserve(self.ctxt, 'p1', 'u1', optimistic=True)
+        self.assertEqual(3, len(reservations))
+        expected = {'project_id': 'p1',
+                    'user_id': 'u1',
+                    'resource0': {'in_use': 0, 'reserved': 0},
+                    'resource1': {'in_use': 1, 'reserved': 1},
+                    'fixed_ips': {'in_use': 2, 'reserved': 2}}
+        self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
+                         self.ctxt, 'p1', 'u1'))
+
+    def test_quota_reserve_optimistic_conflict(self):
+        # The usage read by the first attempt is updated concurrently.
+        sqlalchemy_api._quota_usage_create('p1', 'u1', 'resource1', 0, 0, 1)
+        get_rows = sqlalchemy_api._get_project_quota_usage_rows
+        attempts = []
+
+        def fake_get_rows(context, session, project_id, lock=True):
+            rows = get_rows(context, session, project_id, lock=lock)
+            attempts.append(lock)
+            if len(attempts) == 1:
+                for row in rows:
+                    row.generation -= 1
+            return rows
+
+        self.stubs.Set(sqlalchemy_api, '_get_project_quota_usage_rows',
+                       fake_get_rows)
+
+        reservations = _quota_reserve(self.ctxt, 'p1', 'u1', optimistic=True)
+
+        self.assertEqual([False, False], attempts)
+        self.assertEqual(3, len(reservations))
+        expected = {'project_id': 'p1',
+                    'user_id': 'u1',
+                    'resource0': {'in_use': 0, 'reserved': 0},
+                    'resource1': {'in_use': 1, 'reserved': 1},
+                    'fixed_ips': {'in_use': 2, 'reserved': 2}}
+        self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
+                         self.ctxt, 'p1', 'u1'))
+
+    def test_quota_reserve_optimistic_bumps_other_users_usages(self):
+        usage = sqlalchemy_api._quota_usage_create('p1', 'u2', 'resource1',
+                                                   0, 0, None)
+        _quota_reserve(self.ctxt, 'p1', 'u1', optimistic=True)
+        other_usage = db.quota_usage_get(self.ctxt, 'p1', 'resource1', 'u2')
+        self.assertEqual(usage.generation + 1, other_usage['generation'])
+
+    @mock.patch.object(sqlalchemy_api, '_quota_reserve_optimistic')
+    def test_quota_reserve_optimistic_locks_after_attempts(self,
+                                                           mock_reserve):
+        mock_reserve.__name__ = '_quota_reserve_optimistic'
+        mock_reserve.side_effect = exception.QuotaUsageConflict(
+            usage_ids=[1])
+        reservations = _quota_reserve(self.ctxt, 'p1', 'u1', optimistic=True)
+        self.assertEqual(10, mock_reserve.call_count)
+        self.assertEqual(3, len(reservations))
+
+    def test_quota_usage_update_increments_generation(self):
+        _quota_reserve(self.ctxt, 'p1', 'u1')
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'resource0', 'u1')
+        db.quota_usage_update(self.ctxt, 'p1', 'u1', 'resource0', in_use=42)
+        self.assertEqual(usage['generation'] + 1,
+                         db.quota_usage_get(self.ctxt, 'p1', 'resource0',
+                                            'u1')['generation'])
+
+    def test_quota_usage_count(self):
+        for user_id in ('u1', 'u2'):
+            db.instance_create(self.ctxt, {'project_id': 'p1',
+                                           'user_id': user_id,
+                                           'vcpus': 2, 'memory_mb': 512})
+            db.security_group_create(self.ctxt, {'project_id': 'p1',
+                                                 'user_id': user_id})
+        resources = dict((res.name, res) for res in quota.resources
+                         if res.name in ('instances', 'cores',
+                                         'security_groups'))
+
+        self.assertEqual({'instances': 1, 'cores': 2, 'ram': 512,
+                          'security_groups': 1},
+                         db.quota_usage_count(self.ctxt, resources, 'p1',
+                                              user_id='u1'))
+        self.assertEqual({'instances': 2, 'cores': 4, 'ram': 1024,
+                          'security_groups': 2},
+                         db.quota_usage_count(self.ctxt, resources, 'p1'))
+
     def test_quota_usage_get_nonexistent(self):
         self.assertRaises(exception.QuotaUsageNotFound, db.quota_usage_get,
             self.ctxt, 'p1', 'nonexitent_resource')
@@ -5817,7 +6071,8 @@ class S3ImageTestCase(test.TestCase):
 
 class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
-    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at']
+    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at',
+                     'generation']
 
     def setUp(self):
         super(ComputeNodeTestCase, self).setUp()
@@ -5935,6 +6190,35 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_changed_since(self):
+        long_ago = timeutils.utcnow() - datetime.timedelta(days=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, long_ago)
+        self.assertEqual([self.item['id']], [n['id'] for n in nodes])
+        self.assertNotIn('service', nodes[0])
+
+        in_future = timeutils.utcnow() + datetime.timedelta(days=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, in_future)
+        self.assertEqual([], nodes)
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        long_ago = timeutils.utcnow() - datetime.timedelta(days=1)
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, long_ago)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(self.item['id'], nodes[0]['id'])
+        self.assertTrue(nodes[0]['deleted'])
+
+    def test_db_utcnow(self):
+        now = db.db_utcnow(self.ctxt)
+        self.assertIsInstance(now, datetime.datetime)
+        # NOTE: The database clock has a precision of one second.
+        delta = abs(timeutils.utcnow() - now)
+        self.assertTrue(delta < datetime.timedelta(seconds=5))
+
+        nodes = db.compute_node_get_all_changed_since(
+                self.ctxt, now - datetime.timedelta(seconds=5))
+        self.assertEqual([self.item['id']], [n['id'] for n in nodes])
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -6018,6 +6302,52 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                          'free_ram_mb': '13'})
         self.assertNotEqual(first['updated_at'], second['updated_at'])
 
+    def test_compute_node_update_increments_generation(self):
+        self.assertEqual(0, self.item['generation'])
+        item_updated = db.compute_node_update(self.ctxt,
+                self.item['id'], {})
+        self.assertEqual(1, item_updated['generation'])
+
+    def test_compute_node_claim(self):
+        generation = db.compute_node_claim(self.ctxt, self.item['id'],
+                                           0, 1, 256, 10)
+        self.assertEqual(1, generation)
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(1, node['generation'])
+        self.assertEqual(1, node['vcpus_used'])
+        self.assertEqual(256, node['memory_mb_used'])
+        self.assertEqual(768, node['free_ram_mb'])
+        self.assertEqual(10, node['local_gb_used'])
+        self.assertEqual(2038, node['free_disk_gb'])
+        self.assertEqual(90, node['disk_available_least'])
+
+    def test_compute_node_claim_conflict(self):
+        db.compute_node_update(self.ctxt, self.item['id'], {})
+        self.assertRaises(exception.ComputeNodeClaimConflict,
+                          db.compute_node_claim, self.ctxt, self.item['id'],
+                          0, 1, 256, 10)
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(0, node['vcpus_used'])
+
+    def test_compute_node_claim_deleted(self):
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        self.assertRaises(exception.ComputeNodeClaimConflict,
+                          db.compute_node_claim, self.ctxt, self.item['id'],
+                          0, 1, 256, 10)
+
+    def test_compute_node_release(self):
+        db.compute_node_claim(self.ctxt, self.item['id'], 0, 1, 256, 10)
+        db.compute_node_update(self.ctxt, self.item['id'], {})
+        db.compute_node_release(self.ctxt, self.item['id'], 1, 256, 10)
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(3, node['generation'])
+        self.assertEqual(0, node['vcpus_used'])
+        self.assertEqual(0, node['memory_mb_used'])
+        self.assertEqual(1024, node['free_ram_mb'])
+        self.assertEqual(0, node['local_gb_used'])
+        self.assertEqual(2048, node['free_disk_gb'])
+        self.assertEqual(100, node['disk_available_least'])
+
 
 class ProviderFwRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
@@ -883,6 +883,58 @@ class TestNovaMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
                                  if [c.name for c in i.columns][:1] ==
                                     ['host']]))
 
+    def _check_266(self, engine, data):
+        self.assertColumnExists(engine, 'compute_nodes', 'generation')
+        self.assertColumnExists(
+            engine, 'shadow_compute_nodes', 'generation')
+
+        compute_nodes = oslodbutils.get_table(engine, 'compute_nodes')
+        shadow_compute_nodes = oslodbutils.get_table(
+            engine, 'shadow_compute_nodes')
+        self.assertIsInstance(compute_nodes.c.generation.type,
+                              sqlalchemy.types.Integer)
+        self.assertIsInstance(shadow_compute_nodes.c.generation.type,
+                              sqlalchemy.types.Integer)
+
+    def _post_downgrade_266(self, engine):
+        self.assertColumnNotExists(engine, 'compute_nodes', 'generation')
+        self.assertColumnNotExists(
+            engine, 'shadow_compute_nodes', 'generation')
+
+    def _check_267(self, engine, data):
+        self.assertColumnExists(engine, 'quota_usages', 'generation')
+        self.assertColumnExists(
+            engine, 'shadow_quota_usages', 'generation')
+
+        quota_usages = oslodbutils.get_table(engine, 'quota_usages')
+        shadow_quota_usages = oslodbutils.get_table(
+            engine, 'shadow_quota_usages')
+        self.assertIsInstance(quota_usages.c.generation.type,
+                              sqlalchemy.types.Integer)
+        self.assertIsInstance(shadow_quota_usages.c.generation.type,
+                              sqlalchemy.types.Integer)
+
+    def _post_downgrade_267(self, engine):
+        self.assertColumnNotExists(engine, 'quota_usages', 'generation')
+        self.assertColumnNotExists(
+            engine, 'shadow_quota_usages', 'generation')
+
+    def _check_268(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_deleted_created_at_id_idx',
+                                ['deleted', 'created_at', 'id'])
+        self.assertIndexMembers(
+            engine, 'instances',
+            'instances_project_id_deleted_created_at_id_idx',
+            ['project_id', 'deleted', 'created_at', 'id'])
+
+    def _post_downgrade_268(self, engine):
+        instances = oslodbutils.get_table(engine, 'instances')
+        index_names = [idx.name for idx in instances.indexes]
+        self.assertNotIn('instances_deleted_created_at_id_idx', index_names)
+        self.assertNotIn('instances_project_id_deleted_created_at_id_idx',
+                         index_names)
+
 
 class ProjectTestCase(test.NoDBTestCase):
 
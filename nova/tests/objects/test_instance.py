@@ -27,6 +27,7 @@ from nova import exception
 from nova.network import model as network_model
 from nova import notifications
 from nova import objects
+from nova.objects import base
 from nova.objects import instance
 from nova.objects import instance_info_cache
 from nova.objects import instance_numa_topology
@@ -932,6 +933,26 @@ class _TestInstanceObject(object):
                                          expected_attrs=['metadata'])
         self.assertNotIn('metadata', inst.obj_what_changed())
 
+    @mock.patch('nova.objects.Instance.get_by_uuid')
+    def test_load_deferred_columns(self, mock_get):
+        mock_get.return_value = fake_instance.fake_instance_obj(
+            self.context, host='bar', vm_state='active', task_state=None)
+        inst = instance.Instance._from_db_object(
+            self.context, instance.Instance(),
+            {'id': 1, 'uuid': 'fake-uuid', 'host': 'foo'},
+            expected_attrs=[], load_fields=['host'])
+        self.assertEqual('active', inst.vm_state)
+        self.assertIsNone(inst.task_state)
+        self.assertEqual('foo', inst.host)
+        mock_get.assert_called_once_with(self.context, uuid='fake-uuid',
+                                         expected_attrs=[])
+        self.assertNotIn('vm_state', inst.obj_what_changed())
+
+    def test_load_column_not_deferred(self):
+        inst = instance.Instance(context=self.context, uuid='fake-uuid')
+        self.assertRaises(exception.ObjectActionError,
+                          inst.obj_load_attr, 'host')
+
     @mock.patch('nova.db.instance_fault_get_by_instance_uuids')
     def test_load_fault(self, mock_get):
         fake_fault = test_instance_fault.fake_faults['fake-uuid'][0]
@@ -980,7 +1001,8 @@ class _TestInstanceListObject(object):
         db.instance_get_all_by_filters(self.context, {'foo': 'bar'}, 'uuid',
                                        'asc', limit=None, marker=None,
                                        columns_to_join=['metadata'],
-                                       use_slave=False).AndReturn(fakes)
+                                       use_slave=False,
+                                       compact_metadata=True).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
             self.context, {'foo': 'bar'}, 'uuid', 'asc',
@@ -1001,7 +1023,8 @@ class _TestInstanceListObject(object):
                                        {'deleted': True, 'cleaned': False},
                                        'uuid', 'asc', limit=None, marker=None,
                                        columns_to_join=['metadata'],
-                                       use_slave=False).AndReturn(
+                                       use_slave=False,
+                                       compact_metadata=True).AndReturn(
                                            [fakes[1]])
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -1029,6 +1052,69 @@ class _TestInstanceListObject(object):
         self.assertEqual(inst_list.obj_what_changed(), set())
         self.assertRemotes()
 
+    def test_get_by_host_load_fields(self):
+        fakes = [{'id': 1, 'uuid': 'fake-uuid', 'host': 'foo'}]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(self.context, 'foo',
+                                    columns_to_join=[],
+                                    use_slave=False,
+                                    columns=['id', 'uuid', 'host']
+                                    ).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(self.context, 'foo',
+                                                      expected_attrs=[],
+                                                      load_fields=['host'])
+        self.assertEqual(1, len(inst_list))
+        self.assertEqual('fake-uuid', inst_list[0].uuid)
+        self.assertEqual('foo', inst_list[0].host)
+        self.assertFalse(inst_list[0].obj_attr_is_set('vm_state'))
+        self.assertRemotes()
+
+    @mock.patch('nova.objects.Instance.get_by_uuid')
+    def test_get_by_host_load_fields_serialized(self, mock_get):
+        mock_get.return_value = fake_instance.fake_instance_obj(
+            self.context, locked=True)
+        fakes = [{'id': 1, 'uuid': 'fake-uuid', 'host': 'foo'}]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(self.context, 'foo',
+                                    columns_to_join=[],
+                                    use_slave=False,
+                                    columns=['id', 'uuid', 'host']
+                                    ).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(self.context, 'foo',
+                                                      expected_attrs=[],
+                                                      load_fields=['host'])
+
+        # As done by the conductor API returning the list to the compute.
+        serializer = base.NovaObjectSerializer()
+        inst_list = serializer.deserialize_entity(
+            self.context, serializer.serialize_entity(self.context,
+                                                      inst_list))
+
+        self.assertTrue(inst_list[0].locked)
+        mock_get.assert_called_once_with(self.context, uuid='fake-uuid',
+                                         expected_attrs=[])
+
+    def test_get_by_host_compact_metadata(self):
+        fakes = [self.fake_instance(1)]
+        fakes[0]['metadata'] = {'foo': 'bar'}
+        fakes[0]['system_metadata'] = {'image_foo': 'bar'}
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(self.context, 'foo',
+                                    columns_to_join=['metadata',
+                                                     'system_metadata'],
+                                    use_slave=False,
+                                    compact_metadata=True).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(
+            self.context, 'foo',
+            expected_attrs=['metadata', 'system_metadata'])
+        self.assertEqual({'foo': 'bar'}, inst_list[0].metadata)
+        self.assertEqual({'image_foo': 'bar'}, inst_list[0].system_metadata)
+        self.assertEqual(set(), inst_list[0].obj_what_changed())
+        self.assertRemotes()
+
     def test_get_by_host_and_node(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
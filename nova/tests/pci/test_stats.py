@@ -114,6 +114,38 @@ class PciDeviceStatsTestCase(test.NoDBTestCase):
         self.assertEqual(set([d['count'] for d in self.pci_stats]),
                          set([1, 2]))
 
+    def test_support_requests_sharing_pools(self):
+        requests = [objects.InstancePCIRequest(count=1,
+                        spec=[{'vendor_id': 'v1'}]),
+                    objects.InstancePCIRequest(count=1,
+                        spec=[{'vendor_id': 'v1', 'product_id': 'p1'}])]
+        self.assertTrue(self.pci_stats.support_requests(requests))
+
+        requests.append(objects.InstancePCIRequest(count=1,
+                            spec=[{'vendor_id': 'v1'}]))
+        self.assertFalse(self.pci_stats.support_requests(requests))
+        self.assertEqual(len(self.pci_stats.pools), 2)
+        self.assertEqual(set([d['count'] for d in self.pci_stats]),
+                         set([1, 2]))
+
+    def test_support_requests_several_specs(self):
+        requests = [objects.InstancePCIRequest(count=3,
+                        spec=[{'vendor_id': 'v1', 'product_id': 'p1'},
+                              {'vendor_id': 'v2', 'product_id': 'p2'}])]
+        self.assertTrue(self.pci_stats.support_requests(requests))
+
+        requests = [objects.InstancePCIRequest(count=1,
+                        spec=[{'vendor_id': 'v1', 'product_id': 'p2'}])]
+        self.assertFalse(self.pci_stats.support_requests(requests))
+
+    def test_remove_and_add_device(self):
+        self.pci_stats.remove_device(self.fake_dev_2)
+        self.assertFalse(self.pci_stats.support_requests(pci_requests))
+
+        self.pci_stats.add_device(self.fake_dev_2)
+        self.assertEqual(len(self.pci_stats.pools), 2)
+        self.assertTrue(self.pci_stats.support_requests(pci_requests))
+
     def test_apply_requests(self):
         self.pci_stats.apply_requests(pci_requests)
         self.assertEqual(len(self.pci_stats.pools), 1)
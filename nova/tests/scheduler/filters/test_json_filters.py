@@ -10,6 +10,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import mock
 from oslo.serialization import jsonutils
 
 from nova.scheduler.filters import json_filter
@@ -21,6 +24,8 @@ class TestJsonFilter(test.NoDBTestCase):
 
     def setUp(self):
         super(TestJsonFilter, self).setUp()
+        self.stubs.Set(json_filter.JsonFilter, '_compiled_queries',
+                       collections.OrderedDict())
         self.filt_cls = json_filter.JsonFilter()
         self.json_query = jsonutils.dumps(
                 ['and', ['>=', '$free_ram_mb', 1024],
@@ -287,3 +292,65 @@ class TestJsonFilter(test.NoDBTestCase):
             },
         }
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
+
+    def test_json_filter_nested_variables(self):
+        host = fakes.FakeHostState('host1', 'node1',
+                {'stats': {'foo': 'bar'}})
+
+        for raw, expected in [(['=', '$stats.foo', 'bar'], True),
+                              (['=', '$stats.foo', 'baz'], False),
+                              (['=', '$stats.missing', 'bar', 'bar'], True),
+                              (['not', ['=', '$stats.foo', 'bar']], False),
+                              (['=', '', 1, 1], True)]:
+            filter_properties = {
+                'scheduler_hints': {
+                    'query': jsonutils.dumps(raw),
+                },
+            }
+            self.assertEqual(expected,
+                    self.filt_cls.host_passes(host, filter_properties))
+
+    def test_json_filter_compiles_query_once(self):
+        filter_properties = {'scheduler_hints': {'query': self.json_query}}
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1024,
+                 'free_disk_mb': 200 * 1024})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': 1023,
+                 'free_disk_mb': 200 * 1024})
+
+        with mock.patch.object(jsonutils, 'loads',
+                               side_effect=jsonutils.loads) as mock_loads:
+            self.assertTrue(self.filt_cls.host_passes(host1,
+                                                      filter_properties))
+            self.assertFalse(json_filter.JsonFilter().host_passes(
+                host2, filter_properties))
+
+        self.assertEqual(1, mock_loads.call_count)
+
+    def test_json_filter_query_cache_evicts_least_recently_used(self):
+        self.flags(json_filter_query_cache_size=2)
+        host = fakes.FakeHostState('host1', 'node1', {})
+        queries = [jsonutils.dumps(['=', i, i]) for i in xrange(3)]
+
+        for query in (queries[0], queries[1], queries[0], queries[2]):
+            self.filt_cls.host_passes(
+                host, {'scheduler_hints': {'query': query}})
+
+        self.assertEqual(
+            [(json_filter.JsonFilter, queries[0]),
+             (json_filter.JsonFilter, queries[2])],
+            json_filter.JsonFilter._compiled_queries.keys())
+
+    def test_json_filter_query_cache_disabled(self):
+        self.flags(json_filter_query_cache_size=0)
+        host = fakes.FakeHostState('host1', 'node1', {})
+
+        filter_properties = {
+            'scheduler_hints': {
+                'query': jsonutils.dumps(['=', 1, 1]),
+            },
+        }
+        self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
+
+        self.assertEqual({}, json_filter.JsonFilter._compiled_queries)
@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 from oslo.serialization import jsonutils
 
@@ -26,6 +28,7 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
 
     def setUp(self):
         super(TestNUMATopologyFilter, self).setUp()
+        self.stubs.Set(numa_topology_filter, '_capacity_cache', {})
         self.filt_cls = numa_topology_filter.NUMATopologyFilter()
 
     def test_numa_topology_filter_pass(self):
@@ -148,3 +151,65 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
         self.assertEqual(limits_topology.cells[1].cpu_limit, 42)
         self.assertEqual(limits_topology.cells[0].memory_limit, 665)
         self.assertEqual(limits_topology.cells[1].memory_limit, 665)
+
+    def _get_filter_properties(self, cells):
+        instance_topology = hardware.VirtNUMAInstanceTopology(cells=cells)
+        instance = fake_instance.fake_instance_obj(mock.sentinel.ctx)
+        instance.numa_topology = (
+                objects.InstanceNUMATopology.obj_from_topology(
+                    instance_topology))
+        return {
+            'request_spec': {
+                'instance_properties': jsonutils.to_primitive(
+                    obj_base.obj_to_primitive(instance))}}
+
+    def test_numa_topology_filter_parses_topologies_once(self):
+        filter_properties = self._get_filter_properties(
+            [hardware.VirtNUMATopologyCell(0, set([1]), 512),
+             hardware.VirtNUMATopologyCell(1, set([3]), 512)])
+        host_topology = fakes.NUMA_TOPOLOGY.to_json()
+        host1 = fakes.FakeHostState('host1', 'node1',
+                                    {'numa_topology': host_topology})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                                    {'numa_topology': host_topology})
+
+        with contextlib.nested(
+            mock.patch.object(hardware.VirtNUMAHostTopology, 'from_json',
+                              wraps=hardware.VirtNUMAHostTopology.from_json),
+            mock.patch.object(hardware, 'instance_topology_from_instance',
+                              wraps=hardware.instance_topology_from_instance)
+        ) as (mock_host_from_json, mock_instance_topology):
+            self.assertTrue(self.filt_cls.host_passes(host1,
+                                                      filter_properties))
+            self.assertTrue(self.filt_cls.host_passes(host2,
+                                                      filter_properties))
+
+        self.assertEqual(1, mock_host_from_json.call_count)
+        self.assertEqual(1, mock_instance_topology.call_count)
+        self.assertEqual(host1.limits['numa_topology'],
+                         host2.limits['numa_topology'])
+
+    def test_numa_topology_filter_fail_other_cell_over_limit(self):
+        self.flags(cpu_allocation_ratio=1)
+        filter_properties = self._get_filter_properties(
+            [hardware.VirtNUMATopologyCell(0, set([1]), 512)])
+        host_topology = hardware.VirtNUMAHostTopology(
+            cells=[hardware.VirtNUMATopologyCellUsage(0, set([1, 2]), 1024),
+                   hardware.VirtNUMATopologyCellUsage(1, set([3, 4]), 1024,
+                                                      cpu_usage=3)])
+        host = fakes.FakeHostState('host1', 'node1',
+                                   {'numa_topology': host_topology})
+
+        self.assertFalse(self.filt_cls.host_passes(host, filter_properties))
+
+    def test_host_numa_capacity_fits(self):
+        capacity = numa_topology_filter.HostNUMACapacity(
+            fakes.NUMA_TOPOLOGY, 1.0, 1.0)
+
+        self.assertTrue(capacity.fits({0: (2, 512)}, 2, 512))
+        self.assertTrue(capacity.fits({0: (2, 512), 1: (2, 512)}, 4, 1024))
+        self.assertFalse(capacity.fits({0: (3, 512)}, 3, 512))
+        self.assertFalse(capacity.fits({0: (1, 1024)}, 1, 1024))
+        self.assertFalse(capacity.fits({2: (1, 1)}, 1, 1))
+        # Rejected on the totals, without looking at the cells.
+        self.assertFalse(capacity.fits({}, 5, 0))
@@ -201,3 +201,126 @@ class TestTrustedFilter(test.NoDBTestCase):
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
         self.assertFalse(self.filt_cls.host_passes(bad_host,
                                                    filter_properties))
+
+
+class FakeAttestationServer(object):
+    """Stub of the OAT service, attesting hosts at the current time."""
+
+    def __init__(self, levels):
+        self.levels = levels
+        self.polls = []
+
+    def request(self, cmd, subcmd, hosts):
+        self.polls.append(sorted(hosts))
+        states = [{"host_name": host,
+                   "trust_lvl": self.levels.get(host, "unknown"),
+                   "vtime": timeutils.isotime()}
+                  for host in hosts]
+        return requests.codes.OK, {"hosts": states}
+
+
+@mock.patch.object(trusted_filter.utils, 'spawn_n')
+@mock.patch.object(trusted_filter.AttestationService, '_request')
+class TestTrustedFilterRefresh(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestTrustedFilterRefresh, self).setUp()
+        self.stubs.Set(trusted_filter, '_shared_cache', None)
+        self.server = FakeAttestationServer({'node1': 'trusted',
+                                             'node2': 'trusted'})
+        timeutils.set_time_override(timeutils.utcnow())
+        self.addCleanup(timeutils.clear_time_override)
+        self.timeout = CONF.trusted_computing.attestation_auth_timeout
+        self.filter_properties = {
+            'context': mock.sentinel.ctx,
+            'instance_type': {'memory_mb': 1024,
+                              'extra_specs': {
+                                  'trust:trusted_host': 'trusted'}}}
+
+    def _create_filter(self):
+        fake_compute_nodes = [{'hypervisor_hostname': 'node1'},
+                              {'hypervisor_hostname': 'node2'}]
+        with mock.patch('nova.db.compute_node_get_all') as mocked:
+            mocked.return_value = fake_compute_nodes
+            return trusted_filter.TrustedFilter()
+
+    def _passes(self, filt_cls, nodename):
+        host = fakes.FakeHostState('host', nodename, {})
+        return filt_cls.host_passes(host, self.filter_properties)
+
+    def test_polls_stale_hosts_only(self, req_mock, spawn_mock):
+        req_mock.side_effect = self.server.request
+        filt_cls = self._create_filter()
+
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+        timeutils.advance_time_seconds(self.timeout // 2)
+        filt_cls.compute_attestation.caches._init_cache_entry('node2')
+        self.server.levels['node2'] = 'untrusted'
+        self.assertFalse(self._passes(filt_cls, 'node2'))
+
+        self.assertEqual([['node1', 'node2'], ['node2']], self.server.polls)
+        self.assertFalse(spawn_mock.called)
+
+    def test_refresh_ahead(self, req_mock, spawn_mock):
+        self.flags(attestation_refresh_ahead=20, group='trusted_computing')
+        req_mock.side_effect = self.server.request
+        filt_cls = self._create_filter()
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+
+        timeutils.advance_time_seconds(self.timeout - 10)
+        self.server.levels['node1'] = 'untrusted'
+        # The cached level is used while it is refreshed.
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+        self.assertTrue(self._passes(filt_cls, 'node2'))
+        self.assertEqual(1, len(self.server.polls))
+
+        caches = filt_cls.compute_attestation.caches
+        spawn_mock.assert_called_once_with(caches._refresh_cache)
+        caches._refresh_cache()
+
+        self.assertEqual(['node1', 'node2'], self.server.polls[-1])
+        self.assertFalse(self._passes(filt_cls, 'node1'))
+        self.assertFalse(caches._refreshing)
+
+    def test_stale_while_revalidate(self, req_mock, spawn_mock):
+        self.flags(attestation_stale_while_revalidate=True,
+                   group='trusted_computing')
+        req_mock.side_effect = self.server.request
+        filt_cls = self._create_filter()
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+
+        timeutils.advance_time_seconds(self.timeout + 10)
+        self.server.levels['node1'] = 'untrusted'
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+        self.assertEqual(1, len(self.server.polls))
+        self.assertTrue(spawn_mock.called)
+
+        # Too old to be used, the OAT service is polled in the request.
+        timeutils.advance_time_seconds(self.timeout)
+        self.assertFalse(self._passes(filt_cls, 'node1'))
+        self.assertEqual(2, len(self.server.polls))
+
+    def test_failed_refresh_keeps_levels(self, req_mock, spawn_mock):
+        self.flags(attestation_stale_while_revalidate=True,
+                   group='trusted_computing')
+        req_mock.side_effect = self.server.request
+        filt_cls = self._create_filter()
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+
+        timeutils.advance_time_seconds(self.timeout + 10)
+        req_mock.side_effect = None
+        req_mock.return_value = IOError, None
+        caches = filt_cls.compute_attestation.caches
+        caches._refresh_cache()
+
+        self.assertTrue(self._passes(filt_cls, 'node1'))
+        self.assertEqual('trusted', caches.compute_nodes['node1']['trust_lvl'])
+
+    def test_cache_shared_by_filters(self, req_mock, spawn_mock):
+        self.flags(attestation_refresh_ahead=20, group='trusted_computing')
+        req_mock.side_effect = self.server.request
+
+        self.assertTrue(self._passes(self._create_filter(), 'node1'))
+        self.assertTrue(self._passes(self._create_filter(), 'node1'))
+
+        self.assertEqual(1, len(self.server.polls))
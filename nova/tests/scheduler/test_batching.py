@@ -0,0 +1,75 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the batching of the scheduling requests.
+"""
+
+import sys
+
+import eventlet
+
+from nova import exception
+from nova.scheduler import batching
+from nova import test
+
+
+class RequestBatcherTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(RequestBatcherTestCase, self).setUp()
+        self.batches = []
+        self.batcher = batching.RequestBatcher(self._handler, 0.01)
+
+    def _handler(self, requests):
+        self.batches.append(requests)
+        results = []
+        for (value,) in requests:
+            if value < 0:
+                try:
+                    raise exception.NoValidHost(reason='')
+                except exception.NoValidHost:
+                    results.append((None, sys.exc_info()))
+            else:
+                results.append((value * 2, None))
+        return results
+
+    def test_concurrent_requests_batched(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(self.batcher.submit, [1, 2, 3]))
+
+        self.assertEqual([2, 4, 6], results)
+        self.assertEqual([[(1,), (2,), (3,)]], self.batches)
+
+    def test_request_exception(self):
+        threads = [eventlet.spawn(self.batcher.submit, value)
+                   for value in (1, -1)]
+
+        self.assertEqual(2, threads[0].wait())
+        self.assertRaises(exception.NoValidHost, threads[1].wait)
+        self.assertEqual(1, len(self.batches))
+
+    def test_handler_failure(self):
+        def failing_handler(requests):
+            raise test.TestingException()
+
+        self.batcher.handler = failing_handler
+
+        self.assertRaises(test.TestingException, self.batcher.submit, 1)
+
+    def test_successive_batches(self):
+        self.assertEqual(2, self.batcher.submit(1))
+        self.assertEqual(4, self.batcher.submit(2))
+
+        self.assertEqual(2, len(self.batches))
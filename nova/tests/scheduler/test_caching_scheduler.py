@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
 import mock
 from oslo.utils import timeutils
 
@@ -113,6 +115,7 @@ class CachingSchedulerTestCase(test_scheduler.SchedulerTestCase):
             "ephemeral_gb": 1,
             "vcpus": 1,
             "uuid": 'aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa',
+            "numa_topology": None,
         }
         request_spec = {
             "instance_type": flavor,
@@ -133,6 +136,105 @@ class CachingSchedulerTestCase(test_scheduler.SchedulerTestCase):
         }
         return host_state
 
+    @mock.patch.object(caching_scheduler.CachingScheduler,
+                       "_get_up_hosts")
+    @mock.patch.object(caching_scheduler.utils, "spawn_n")
+    def test_run_periodic_tasks_background_refresh(self, mock_spawn,
+                                                   mock_up_hosts):
+        self.flags(caching_scheduler_background_refresh=True)
+        context = mock.Mock()
+
+        self.driver.run_periodic_tasks(context)
+        # A refresh is already running, no other one is started.
+        self.driver.run_periodic_tasks(context)
+
+        mock_spawn.assert_called_once_with(self.driver._background_refresh,
+                                           context.elevated.return_value)
+        self.assertFalse(mock_up_hosts.called)
+
+        mock_up_hosts.return_value = []
+        self.driver._background_refresh(context.elevated.return_value)
+
+        self.assertEqual([], self.driver.all_host_states)
+        self.assertFalse(self.driver._refreshing)
+
+    @mock.patch.object(caching_scheduler.CachingScheduler,
+                       "_get_up_hosts")
+    def test_background_refresh_failure(self, mock_up_hosts):
+        mock_up_hosts.side_effect = exception.NovaException
+        self.driver._refreshing = True
+
+        self.driver._background_refresh(self.context)
+
+        self.assertIsNone(self.driver.all_host_states)
+        self.assertFalse(self.driver._refreshing)
+
+    def test_consume_records_claim(self):
+        host_state = self._get_fake_host_state()
+        request_spec = self._get_fake_request_spec()
+
+        self.driver._consume_from_instance(
+            host_state, request_spec['instance_properties'])
+
+        self.assertEqual(49488, host_state.free_ram_mb)
+        self.assertEqual(1, len(self.driver.journal))
+
+    def test_journal_not_replayed_on_host_state_not_refreshed(self):
+        host_state = self._get_fake_host_state()
+        journal = caching_scheduler.ClaimJournal()
+        instance = self._get_fake_request_spec()['instance_properties']
+        host_state.consume_from_instance(instance)
+        journal.record(host_state, instance)
+
+        journal.replay([host_state])
+
+        self.assertEqual(49488, host_state.free_ram_mb)
+        self.assertEqual(1, len(journal))
+
+    def test_journal_replayed_after_refresh(self):
+        host_state = self._get_fake_host_state()
+        journal = caching_scheduler.ClaimJournal()
+        instance = self._get_fake_request_spec()['instance_properties']
+        host_state.updated = timeutils.utcnow()
+        host_state.consume_from_instance(instance)
+        claimed_at = host_state.updated
+        journal.record(host_state, instance)
+
+        # Refreshed from a compute node which does not include the claim.
+        host_state.free_ram_mb = 50000
+        host_state.updated = None
+        journal.replay([host_state])
+
+        self.assertEqual(49488, host_state.free_ram_mb)
+        self.assertEqual(claimed_at, host_state.updated)
+        self.assertEqual(1, len(journal))
+
+    def test_journal_pruned_after_compute_update(self):
+        host_state = self._get_fake_host_state()
+        journal = caching_scheduler.ClaimJournal()
+        instance = self._get_fake_request_spec()['instance_properties']
+        host_state.consume_from_instance(instance)
+        journal.record(host_state, instance)
+
+        # Refreshed from a compute node updated after the claim.
+        host_state.free_ram_mb = 49488
+        host_state.updated = host_state.updated + datetime.timedelta(
+            seconds=1)
+        journal.replay([host_state])
+
+        self.assertEqual(49488, host_state.free_ram_mb)
+        self.assertEqual(0, len(journal))
+
+    def test_journal_pruned_for_removed_hosts(self):
+        host_state = self._get_fake_host_state()
+        journal = caching_scheduler.ClaimJournal()
+        instance = self._get_fake_request_spec()['instance_properties']
+        journal.record(host_state, instance)
+
+        journal.replay([])
+
+        self.assertEqual(0, len(journal))
+
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
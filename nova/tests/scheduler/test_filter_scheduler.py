@@ -159,7 +159,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, cache=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -449,6 +450,89 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self._group_details_in_filter_properties(group, 'get_by_name',
                                                  group.name, 'anti-affinity')
 
+    def _schedule_batch(self, placement, capacities, num_instances,
+                        group_hosts=None):
+        self.flags(scheduler_batch_placement=placement)
+        sched = fakes.FakeFilterScheduler()
+        host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                       for i in xrange(len(capacities))]
+        placed = dict((host.host, 0) for host in host_states)
+        filtered = []
+
+        def fake_filtered_hosts(hosts, filter_properties, index):
+            hosts = list(hosts)
+            filtered.append((len(hosts), index))
+            return [host for host in hosts
+                    if placed[host.host] < capacities[int(host.host[4:])]]
+
+        def fake_weighed_hosts(hosts, filter_properties):
+            return [weights.WeighedHost(host, 1.0) for host in hosts]
+
+        def fake_consume(host_state, instance_properties):
+            placed[host_state.host] += 1
+
+        filter_properties = {}
+        if group_hosts is not None:
+            filter_properties['group_hosts'] = group_hosts
+        with contextlib.nested(
+            mock.patch.object(sched.host_manager, 'get_filtered_hosts',
+                              side_effect=fake_filtered_hosts),
+            mock.patch.object(sched.host_manager, 'get_weighed_hosts',
+                              side_effect=fake_weighed_hosts),
+            mock.patch.object(sched, '_consume_from_instance',
+                              side_effect=fake_consume),
+        ):
+            selected = sched._schedule_batch(self.context, host_states,
+                    num_instances, {}, None, filter_properties,
+                    group_hosts is not None)
+        return [weighed.obj.host for weighed in selected], filtered
+
+    def test_schedule_batch_pack(self):
+        hosts, filtered = self._schedule_batch('pack', [2, 0, 3, 5], 6)
+
+        self.assertEqual(['host0', 'host0', 'host2', 'host2', 'host2',
+                          'host3'], hosts)
+        # The hosts are filtered once, then one at a time.
+        self.assertEqual((4, 0), filtered[0])
+        self.assertEqual([1], list(set([n for n, index in filtered[1:]])))
+
+    def test_schedule_batch_spread(self):
+        hosts, filtered = self._schedule_batch('spread', [1, 0, 3, 5], 6)
+
+        self.assertEqual(['host0', 'host2', 'host3', 'host2', 'host3',
+                          'host2'], hosts)
+
+    def test_schedule_batch_not_enough_hosts(self):
+        hosts, filtered = self._schedule_batch('pack', [1, 2], 5)
+
+        self.assertEqual(['host0', 'host1', 'host1'], hosts)
+
+    def test_schedule_batch_group_hosts(self):
+        group_hosts = set()
+        hosts, filtered = self._schedule_batch('pack', [2, 2], 2,
+                                               group_hosts=group_hosts)
+
+        self.assertEqual(set(['host0']), group_hosts)
+
+    def test_group_hosts_from_cache(self):
+        self.flags(scheduler_cache_group_hosts=True)
+        sched = fakes.FakeFilterScheduler()
+        sched._supports_anti_affinity = True
+        group = self._create_server_group()
+        sched.group_hosts.record(group.members[0], 'hostC')
+        filter_properties = {'scheduler_hints': {'group': group.uuid}}
+
+        with contextlib.nested(
+            mock.patch.object(objects.InstanceGroup, 'get_by_uuid',
+                              return_value=group),
+            mock.patch.object(objects.InstanceGroup, 'get_hosts'),
+        ) as (get_group, get_hosts):
+            self.assertTrue(sched._setup_instance_group(self.context,
+                                                        filter_properties))
+
+        self.assertFalse(get_hosts.called)
+        self.assertEqual(set(['hostC']), filter_properties['group_hosts'])
+
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
@@ -536,7 +620,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, cache=None):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -566,6 +651,85 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEqual(50, hosts[0].weight)
 
+    def _schedule_with_claims(self, claim_results):
+        self.flags(scheduler_optimistic_claims=True,
+                   scheduler_claim_max_attempts=2,
+                   scheduler_host_subset_size=1)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                fake_get_filtered_hosts)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 512,
+                               'memory_mb': 512,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux',
+                               'uuid': 'fake-uuid'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={})
+        self.mox.ReplayAll()
+        with mock.patch.object(sched.host_manager, 'claim_from_instance',
+                               side_effect=claim_results) as mock_claim:
+            hosts = sched._schedule(self.context, request_spec,
+                                    filter_properties={})
+        return hosts, mock_claim
+
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_claim_conflict_picks_again(self, mock_get_extra):
+        hosts, mock_claim = self._schedule_with_claims([False, True])
+
+        self.assertEqual(1, len(hosts))
+        self.assertEqual(2, mock_claim.call_count)
+        self.assertIs(hosts[0].obj, mock_claim.call_args[0][1])
+
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_claim_conflict_max_attempts(self, mock_get_extra):
+        hosts, mock_claim = self._schedule_with_claims([False, False])
+
+        self.assertEqual([], hosts)
+        self.assertEqual(2, mock_claim.call_count)
+
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_claim_compute_node_deleted(self, mock_get_extra):
+        hosts, mock_claim = self._schedule_with_claims(
+            [exception.ComputeHostNotFound(host='node1'), True])
+
+        self.assertEqual(1, len(hosts))
+        deleted_host = mock_claim.call_args_list[0][0][1]
+        self.assertIsNot(deleted_host, hosts[0].obj)
+
+    def test_select_destinations_no_valid_host_releases_claims(self):
+        self.flags(scheduler_optimistic_claims=True)
+        sched = fakes.FakeFilterScheduler()
+        host_state = fakes.FakeHostState('host1', 'node1', {})
+        instance_properties = {'vcpus': 1, 'memory_mb': 512, 'root_gb': 10,
+                               'ephemeral_gb': 0}
+        request_spec = {'instance_properties': instance_properties,
+                        'num_instances': 2}
+
+        with contextlib.nested(
+            mock.patch.object(sched, '_schedule',
+                              return_value=[weights.WeighedHost(host_state,
+                                                                1.0)]),
+            mock.patch.object(sched.host_manager, 'release_from_instance'),
+        ) as (mock_schedule, mock_release):
+            self.assertRaises(exception.NoValidHost,
+                              sched.select_destinations, self.context,
+                              request_spec, {})
+
+        mock_release.assert_called_once_with(mock.ANY, host_state,
+                                             instance_properties)
+
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
@@ -581,7 +745,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, cache=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -631,6 +796,55 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                  dict(request_spec=request_spec))]
             self.assertEqual(expected, mock_info.call_args_list)
 
+    def test_select_destinations_batch(self):
+        sched = fakes.FakeFilterScheduler()
+        host_states = [fakes.FakeHostState('host1', 'node1', {}),
+                       fakes.FakeHostState('host2', 'node2', {})]
+        filtered = []
+
+        def fake_filtered_hosts(hosts, filter_properties, index=0):
+            hosts = list(hosts)
+            filtered.append(hosts)
+            if filter_properties.get('fail'):
+                return []
+            return hosts
+
+        def fake_weighed_hosts(hosts, filter_properties, limit=None,
+                               cache=None):
+            return [weights.WeighedHost(host, 1.0) for host in hosts][:limit]
+
+        request_spec = {'instance_type': {},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 1,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'num_instances': 1}
+        requests = [(self.context, dict(request_spec), {}),
+                    (self.context, dict(request_spec), {'fail': True}),
+                    (self.context, dict(request_spec), {})]
+
+        with contextlib.nested(
+            mock.patch.object(sched, '_get_all_host_states',
+                              return_value=iter(host_states)),
+            mock.patch.object(sched.host_manager, 'get_filtered_hosts',
+                              side_effect=fake_filtered_hosts),
+            mock.patch.object(sched.host_manager, 'get_weighed_hosts',
+                              side_effect=fake_weighed_hosts),
+            mock.patch.object(sched, '_consume_from_instance'),
+        ) as (mock_get_hosts, mock_filtered, mock_weighed, mock_consume):
+            results = sched.select_destinations_batch(requests)
+
+        self.assertEqual(1, mock_get_hosts.call_count)
+        self.assertEqual([host_states] * 3, filtered)
+        self.assertEqual('host1', results[0][0][0]['host'])
+        self.assertIsNone(results[0][1])
+        self.assertIsNone(results[1][0])
+        self.assertEqual(exception.NoValidHost, results[1][1][0])
+        self.assertEqual(1, len(results[2][0]))
+        self.assertIsNone(getattr(sched._batch, 'host_states', None))
+
     def test_select_destinations_no_valid_host(self):
 
         def _return_no_host(*args, **kwargs):
@@ -33,6 +33,27 @@ class Filter2(filters.BaseFilter):
     pass
 
 
+class EvenFilter(filters.BaseFilter):
+    def _filter_one(self, obj, filter_properties):
+        return obj % 2 == 0
+
+
+class SmallFilter(filters.BaseFilter):
+    def _filter_one(self, obj, filter_properties):
+        return obj < 8
+
+
+class AllObjectsFilter(filters.BaseFilter):
+    def filter_all(self, filter_obj_list, filter_properties):
+        filter_obj_list = list(filter_obj_list)
+        return filter_obj_list[:len(filter_obj_list) // 2]
+
+
+class AdaptiveFilterHandler(filters.BaseFilterHandler):
+    def adaptive_order_enabled(self):
+        return True
+
+
 class FiltersTestCase(test.NoDBTestCase):
     def test_filter_all(self):
         filter_obj_list = ['obj1', 'obj2', 'obj3']
@@ -204,3 +225,63 @@ class FiltersTestCase(test.NoDBTestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertIsNone(result)
+
+    def test_filter_stats_order(self):
+        stats = filters.FilterStats()
+        stats.record('Filter1', 10, 10, 0.1)
+        stats.record('Filter2', 10, 5, 1.0)
+        stats.record('EvenFilter', 10, 1, 0.1)
+
+        self.assertEqual(
+            [SmallFilter, EvenFilter, Filter2, Filter1],
+            stats.order([Filter1, Filter2, EvenFilter, SmallFilter]))
+
+    def test_filter_stats_order_keeps_filter_all_position(self):
+        stats = filters.FilterStats()
+        stats.record('Filter1', 10, 10, 0.1)
+        stats.record('EvenFilter', 10, 1, 0.1)
+        stats.record('SmallFilter', 10, 1, 0.1)
+
+        self.assertEqual(
+            [EvenFilter, Filter1, AllObjectsFilter, SmallFilter],
+            stats.order([Filter1, EvenFilter, AllObjectsFilter,
+                         SmallFilter]))
+
+    def test_filter_stats_to_dict(self):
+        stats = filters.FilterStats()
+        stats.record('Filter1', 10, 5, 0.5)
+        stats.record('Filter1', 10, 5, 0.5)
+
+        self.assertEqual({'Filter1': {'calls': 2,
+                                      'objects_in': 20,
+                                      'objects_out': 10,
+                                      'seconds': 1.0,
+                                      'rejection_rate': 0.5}},
+                         stats.to_dict())
+
+    def test_get_filtered_objects_adaptive_order(self):
+        def _fake_base_loader_init(*args, **kwargs):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       _fake_base_loader_init)
+
+        filter_handler = AdaptiveFilterHandler(filters.BaseFilter)
+        filter_classes = [Filter1, SmallFilter, AllObjectsFilter,
+                          EvenFilter]
+        filter_objs = range(20)
+
+        first = filter_handler.get_filtered_objects(filter_classes,
+                                                    filter_objs, {})
+        second = filter_handler.get_filtered_objects(filter_classes,
+                                                     filter_objs, {})
+
+        self.assertEqual([0, 2], first)
+        self.assertEqual(first, second)
+        stats = filter_handler.filter_stats.to_dict()
+        self.assertEqual(2, stats['Filter1']['calls'])
+        self.assertEqual(0.0, stats['Filter1']['rejection_rate'])
+        # Filter1 does not reject anything, SmallFilter ran first the
+        # second time.
+        self.assertEqual(40, stats['SmallFilter']['objects_in'])
+        self.assertEqual(28, stats['Filter1']['objects_in'])
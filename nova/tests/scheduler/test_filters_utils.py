@@ -15,6 +15,7 @@
 import mock
 
 from nova.scheduler.filters import utils
+from nova.scheduler import host_manager
 from nova import test
 
 
@@ -42,3 +43,42 @@ class UtilsTestCase(test.NoDBTestCase):
 
         self.assertTrue(context.elevated.called)
         self.assertEqual(set([1, 3]), values)
+
+    @mock.patch("nova.db.aggregate_metadata_get_all_by_host")
+    @mock.patch("nova.db.aggregate_metadata_get_by_host")
+    def test_aggregate_metadata_get_by_host_prefetched(self, get_by_host,
+                                                       get_all_by_host):
+        get_all_by_host.return_value = {
+            'h1': {'k1': set(['v1']), 'k2': set(['v2', 'v3'])}}
+        context = mock.sentinel.context
+        host_state = mock.Mock(host='h1',
+                               aggregate_metadata=(
+                                   host_manager.AggregateMetadataMap()))
+
+        self.assertEqual({'k1': set(['v1']), 'k2': set(['v2', 'v3'])},
+                         utils.aggregate_metadata_get_by_host(context,
+                                                              host_state))
+        self.assertEqual({'k2': set(['v2', 'v3'])},
+                         utils.aggregate_metadata_get_by_host(context,
+                                                              host_state,
+                                                              key='k2'))
+        self.assertEqual({}, utils.aggregate_metadata_get_by_host(
+            context, host_state, key='k3'))
+        host_state.host = 'h2'
+        self.assertEqual({}, utils.aggregate_metadata_get_by_host(
+            context, host_state))
+
+        get_all_by_host.assert_called_once_with(context)
+        self.assertFalse(get_by_host.called)
+
+    @mock.patch("nova.db.aggregate_metadata_get_by_host")
+    def test_aggregate_metadata_get_by_host_not_prefetched(self, get_by_host):
+        get_by_host.return_value = {'k1': set(['v1'])}
+        context = mock.sentinel.context
+        host_state = mock.Mock(host='h1', aggregate_metadata=None)
+
+        self.assertEqual({'k1': set(['v1'])},
+                         utils.aggregate_metadata_get_by_host(context,
+                                                              host_state,
+                                                              key='k1'))
+        get_by_host.assert_called_once_with(context, 'h1', key='k1')
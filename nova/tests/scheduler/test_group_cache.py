@@ -0,0 +1,154 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the cache of the hosts of the server group members.
+"""
+
+import mock
+
+from nova.compute import vm_states
+from nova import context
+from nova import objects
+from nova.scheduler import group_cache
+from nova import test
+from nova.tests import fake_instance
+
+
+class GroupHostsCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(GroupHostsCacheTestCase, self).setUp()
+        self.context = context.RequestContext('fake', 'fake')
+        self.cache = group_cache.GroupHostsCache()
+        self.group = objects.InstanceGroup()
+        self.group.uuid = 'fake-group'
+        self.group.members = ['uuid1', 'uuid2', 'uuid3', 'uuid4']
+
+    def _instances(self, hosts):
+        return [fake_instance.fake_instance_obj(self.context, uuid=uuid,
+                                                host=host)
+                for uuid, host in hosts]
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_get_hosts(self, mock_get):
+        # uuid3 is not scheduled yet, uuid4 was deleted.
+        mock_get.return_value = self._instances(
+            [('uuid1', 'host1'), ('uuid2', 'host2'), ('uuid3', None)])
+
+        hosts = self.cache.get_hosts(self.context, self.group)
+
+        self.assertEqual(set(['host1', 'host2']), hosts)
+        mock_get.assert_called_once_with(
+            self.context,
+            filters={'uuid': ['uuid1', 'uuid2', 'uuid3', 'uuid4'],
+                     'deleted': False})
+        self.assertEqual(3, len(self.cache))
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_get_hosts_loads_missing_members_only(self, mock_get):
+        mock_get.return_value = self._instances(
+            [('uuid1', 'host1'), ('uuid2', 'host2'), ('uuid3', None)])
+        self.cache.get_hosts(self.context, self.group)
+        self.cache.record('uuid3', 'host3')
+        self.group.members.append('uuid5')
+        mock_get.return_value = self._instances([('uuid5', 'host5')])
+
+        hosts = self.cache.get_hosts(self.context, self.group)
+
+        self.assertEqual(set(['host1', 'host2', 'host3', 'host5']), hosts)
+        self.assertEqual({'uuid': ['uuid5'], 'deleted': False},
+                         mock_get.call_args[1]['filters'])
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_get_hosts_all_cached(self, mock_get):
+        for i, uuid in enumerate(self.group.members):
+            self.cache.record(uuid, 'host%d' % i)
+
+        self.assertEqual(set(['host0', 'host1', 'host2', 'host3']),
+                         self.cache.get_hosts(self.context, self.group))
+        self.assertFalse(mock_get.called)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_invalidate(self, mock_get):
+        for i, uuid in enumerate(self.group.members):
+            self.cache.record(uuid, 'host%d' % i)
+        self.cache.invalidate('uuid2')
+        mock_get.return_value = self._instances([('uuid2', 'host5')])
+
+        self.assertEqual(set(['host0', 'host5', 'host2', 'host3']),
+                         self.cache.get_hosts(self.context, self.group))
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_reconcile(self, mock_get):
+        self.cache.record('uuid1', 'host1')
+        self.cache.record('uuid2', 'host2')
+        self.cache.record('uuid3', 'host3')
+        self.cache.record('uuid4', 'host4')
+        # uuid1 moved, uuid2 was deleted, uuid3 is still being built and
+        # the build of uuid4 failed.
+        instances = self._instances([('uuid1', 'host5'), ('uuid3', None),
+                                     ('uuid4', None)])
+        instances[1].vm_state = vm_states.BUILDING
+        instances[2].vm_state = vm_states.ERROR
+        mock_get.return_value = instances
+
+        self.cache.reconcile(self.context)
+
+        self.assertEqual(set(['uuid1', 'uuid2', 'uuid3', 'uuid4']),
+                         set(mock_get.call_args[1]['filters']['uuid']))
+        self.assertEqual({'uuid1': 'host5', 'uuid3': 'host3'},
+                         dict(self.cache._hosts))
+
+    def test_record_evicts_least_recently_used(self):
+        self.flags(scheduler_group_cache_size=3)
+        self.cache.record('uuid1', 'host1')
+        self.cache.record('uuid2', 'host2')
+        self.cache.record('uuid3', 'host3')
+        self.cache.record('uuid1', 'host1')
+        self.cache.record('uuid4', 'host4')
+
+        self.assertEqual(['uuid3', 'uuid1', 'uuid4'],
+                         self.cache._hosts.keys())
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_get_hosts_group_larger_than_cache(self, mock_get):
+        self.flags(scheduler_group_cache_size=2)
+        self.cache.record('uuid5', 'host5')
+        mock_get.return_value = self._instances(
+            [('uuid1', 'host1'), ('uuid2', 'host2'), ('uuid3', 'host3'),
+             ('uuid4', 'host4')])
+
+        hosts = self.cache.get_hosts(self.context, self.group)
+
+        self.assertEqual(set(['host1', 'host2', 'host3', 'host4']), hosts)
+        self.assertEqual(2, len(self.cache))
+        self.assertNotIn('uuid5', self.cache._hosts)
+
+
+class GroupHostsNotificationEndpointTestCase(test.NoDBTestCase):
+
+    def test_info(self):
+        cache = group_cache.GroupHostsCache()
+        cache.record('uuid1', 'host1')
+        cache.record('uuid2', 'host2')
+        endpoint = group_cache.GroupHostsNotificationEndpoint(cache)
+
+        endpoint.info({}, 'compute.host1', 'compute.instance.delete.end',
+                      {'instance_id': 'uuid1'}, {})
+        endpoint.info({}, 'compute.host2', 'compute.instance.reboot.end',
+                      {'instance_id': 'uuid2'}, {})
+
+        self.assertEqual(1, len(cache))
+        self.assertNotIn('uuid1', cache._hosts)
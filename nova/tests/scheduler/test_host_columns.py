@@ -0,0 +1,220 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the batch filtering and weighing engine.
+"""
+
+from oslo.config import cfg
+import testtools
+
+from nova import exception
+from nova.scheduler import filters
+from nova.scheduler import host_columns
+from nova.scheduler import host_manager
+from nova.scheduler import weights
+from nova import test
+from nova.tests.scheduler import fakes
+
+CONF = cfg.CONF
+CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
+CONF.import_opt('cpu_allocation_ratio', 'nova.scheduler.filters.core_filter')
+CONF.import_opt('disk_allocation_ratio',
+                'nova.scheduler.filters.disk_filter')
+CONF.import_opt('max_io_ops_per_host', 'nova.scheduler.filters.io_ops_filter')
+CONF.import_opt('max_instances_per_host',
+                'nova.scheduler.filters.num_instances_filter')
+CONF.import_opt('weight_setting', 'nova.scheduler.weights.metrics',
+                group='metrics')
+
+
+class PerHostOnlyFilter(filters.BaseHostFilter):
+    def host_passes(self, host_state, filter_properties):
+        return host_state.host != 'host2'
+
+
+def _fake_host_states():
+    host_states = []
+    for i in xrange(8):
+        metrics = {}
+        if i != 5:
+            metrics['foo'] = host_manager.MetricItem(value=i * 10,
+                                                     timestamp=None,
+                                                     source='fake')
+        host_states.append(fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                {'free_ram_mb': 512 * (i - 2),
+                 'total_usable_ram_mb': 2048,
+                 'free_disk_mb': 10240 * i,
+                 'total_usable_disk_gb': 40,
+                 'vcpus_total': 0 if i == 3 else 4,
+                 'vcpus_used': i,
+                 'num_io_ops': i,
+                 'num_instances': 10 * i,
+                 'metrics': metrics}))
+    return host_states
+
+
+@testtools.skipIf(host_columns.numpy is None, "NumPy is not installed")
+class HostStateColumnsTestCase(test.NoDBTestCase):
+
+    def test_columns(self):
+        host_states = _fake_host_states()
+        columns = host_columns.HostStateColumns(host_states)
+
+        self.assertEqual(8, len(columns))
+        self.assertEqual([h.free_ram_mb for h in host_states],
+                         list(columns['free_ram_mb']))
+        self.assertIs(columns['free_ram_mb'], columns['free_ram_mb'])
+        metric = columns.metric('foo')
+        self.assertEqual(40.0, metric[4])
+        self.assertTrue(host_columns.numpy.isnan(metric[5]))
+
+    def test_set_limits_candidates_only(self):
+        host_states = _fake_host_states()
+        columns = host_columns.HostStateColumns(host_states)
+        columns.mask[0] = False
+
+        columns.set_limits('memory_mb', columns['total_usable_ram_mb'],
+                           columns['free_ram_mb'] >= 0)
+
+        self.assertEqual({}, host_states[0].limits)
+        self.assertEqual({}, host_states[1].limits)
+        self.assertEqual({'memory_mb': 2048.0}, host_states[2].limits)
+
+    def test_normalize(self):
+        numpy = host_columns.numpy
+        self.assertEqual([0.0, 0.5, 1.0], list(
+            host_columns.normalize(numpy.array([1.0, 2.0, 3.0]))))
+        self.assertEqual([0.0, 0.0], list(
+            host_columns.normalize(numpy.array([2.0, 2.0]))))
+        self.assertEqual([0.5, 1.0], list(
+            host_columns.normalize(numpy.array([2.0, 4.0]), minval=0)))
+        self.assertEqual([0.0, 0.5, 1.0], list(
+            host_columns.normalize(numpy.array([-2.0, 0.0, 2.0]), minval=0)))
+        self.assertEqual([0.0, 0.25, 1.0], list(
+            host_columns.normalize(numpy.array([-2.0, 1.0, 6.0]),
+                                   bounds=(0, 4))))
+
+
+@testtools.skipIf(host_columns.numpy is None, "NumPy is not installed")
+class BatchFilteringTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(BatchFilteringTestCase, self).setUp()
+        self.filter_handler = filters.HostFilterHandler()
+        self.filter_properties = {'instance_type': {'memory_mb': 512,
+                                                    'vcpus': 1,
+                                                    'root_gb': 10,
+                                                    'ephemeral_gb': 0,
+                                                    'swap': 0}}
+        self.flags(ram_allocation_ratio=1.5, cpu_allocation_ratio=1.0,
+                   disk_allocation_ratio=1.0, max_io_ops_per_host=6,
+                   max_instances_per_host=50)
+
+    def _filter(self, filter_names, batch):
+        self.flags(scheduler_use_batch_engine=batch)
+        filter_classes = self.filter_handler.get_matching_classes(
+            ['nova.scheduler.filters.%s' % name for name in filter_names])
+        host_states = _fake_host_states()
+        result = self.filter_handler.get_filtered_objects(
+            filter_classes, host_states, self.filter_properties)
+        return ([(h.host, h.limits) for h in result],
+                [h.limits for h in host_states])
+
+    def _assert_same_as_per_host(self, filter_names):
+        self.assertEqual(self._filter(filter_names, False),
+                         self._filter(filter_names, True))
+
+    def test_ram_filter(self):
+        self._assert_same_as_per_host(['ram_filter.RamFilter'])
+
+    def test_core_filter(self):
+        self._assert_same_as_per_host(['core_filter.CoreFilter'])
+
+    def test_disk_filter(self):
+        self._assert_same_as_per_host(['disk_filter.DiskFilter'])
+
+    def test_io_ops_filter(self):
+        self._assert_same_as_per_host(['io_ops_filter.IoOpsFilter'])
+
+    def test_num_instances_filter(self):
+        self._assert_same_as_per_host(
+            ['num_instances_filter.NumInstancesFilter'])
+
+    def test_mixed_with_per_host_filter(self):
+        filter_classes = [
+            PerHostOnlyFilter,
+            self.filter_handler.get_matching_classes(
+                ['nova.scheduler.filters.ram_filter.RamFilter'])[0],
+            self.filter_handler.get_matching_classes(
+                ['nova.scheduler.filters.core_filter.CoreFilter'])[0],
+        ]
+        results = []
+        for batch in (False, True):
+            self.flags(scheduler_use_batch_engine=batch)
+            host_states = _fake_host_states()
+            result = self.filter_handler.get_filtered_objects(
+                filter_classes, host_states, self.filter_properties)
+            results.append(([h.host for h in result],
+                            [h.limits for h in host_states]))
+        self.assertEqual(results[0], results[1])
+        self.assertNotIn('host2', results[1][0])
+
+
+@testtools.skipIf(host_columns.numpy is None, "NumPy is not installed")
+class BatchWeighingTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(BatchWeighingTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.weight_classes = self.weight_handler.get_matching_classes(
+            ['nova.scheduler.weights.ram.RAMWeigher',
+             'nova.scheduler.weights.io_ops.IoOpsWeigher',
+             'nova.scheduler.weights.metrics.MetricsWeigher'])
+
+    def _weigh(self, batch):
+        self.flags(scheduler_use_batch_engine=batch)
+        weighed = self.weight_handler.get_weighed_objects(
+            self.weight_classes, _fake_host_states(), {})
+        return [(w.obj.host, round(w.weight, 6)) for w in weighed]
+
+    def test_same_as_per_host(self):
+        self.flags(weight_setting=['foo=1.0'], required=False,
+                   group='metrics')
+        self.assertEqual(self._weigh(False), self._weigh(True))
+
+    def test_weight_bounds(self):
+        self.flags(ram_weight_capacity_bounds=True)
+        self.weight_classes = self.weight_handler.get_matching_classes(
+            ['nova.scheduler.weights.ram.RAMWeigher'])
+        host_states = _fake_host_states()
+        for host_state in host_states:
+            host_state.total_usable_ram_mb = 5120
+
+        self.flags(scheduler_use_batch_engine=True)
+        weighed = self.weight_handler.get_weighed_objects(
+            self.weight_classes, host_states, {})
+
+        # host7 has 2560MB free out of the 5120MB of the largest host, and
+        # the negative free RAM of host0 and host1 is clamped to 0.
+        self.assertEqual(('host7', 0.5), (weighed[0].obj.host,
+                                          weighed[0].weight))
+        self.assertEqual([0.0, 0.0], [w.weight for w in weighed[-2:]])
+        self.assertEqual(self._weigh(False), self._weigh(True))
+
+    def test_required_metric_missing(self):
+        self.flags(weight_setting=['foo=1.0'], required=True,
+                   group='metrics')
+        self.assertRaises(exception.ComputeHostMetricNotFound,
+                          self._weigh, True)
@@ -15,6 +15,7 @@
 Tests For Scheduler Host Filters.
 """
 
+import mock
 from oslo.config import cfg
 
 from nova import context
@@ -103,6 +104,26 @@ class HostFiltersTestCase(test.NoDBTestCase):
                            params={'host': 'fake_host', 'instance_type_id': 2})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    @mock.patch('nova.db.instance_get_all_by_host_and_not_type')
+    def test_type_filter_with_instance_counts(self, mock_get_instances):
+        filt_cls = self.class_map['TypeAffinityFilter']()
+
+        filter_properties = {'context': self.context,
+                             'instance_type': {'id': 1}}
+        filter2_properties = {'context': self.context,
+                             'instance_type': {'id': 2}}
+
+        host = fakes.FakeHostState('fake_host', 'fake_node',
+                {'num_instances_by_type': {}})
+        # True since empty
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        host.num_instances_by_type = {'1': 2}
+        # True since same type
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        # False since different type
+        self.assertFalse(filt_cls.host_passes(host, filter2_properties))
+        self.assertFalse(mock_get_instances.called)
+
     def test_aggregate_type_filter(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateTypeAffinityFilter']()
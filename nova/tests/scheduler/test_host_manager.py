@@ -16,6 +16,8 @@
 Tests For HostManager
 """
 
+import datetime
+
 import mock
 from oslo.serialization import jsonutils
 from oslo.utils import timeutils
@@ -354,6 +356,86 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         host_states_map = self.host_manager.host_state_map
         self.assertEqual(len(host_states_map), 4)
 
+    def test_get_all_host_states_aggregate_metadata(self):
+        context = 'fake_context'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        first = set(host_state.aggregate_metadata for host_state in
+                    self.host_manager.host_state_map.values())
+        self.assertEqual(1, len(first))
+        self.assertIsInstance(list(first)[0],
+                              host_manager.AggregateMetadataMap)
+
+        # A fresh map is used for each refresh
+        self.host_manager.get_all_host_states(context)
+        second = set(host_state.aggregate_metadata for host_state in
+                     self.host_manager.host_state_map.values())
+        self.assertEqual(1, len(second))
+        self.assertNotIn(second.pop(), first)
+
+    def _claim_host_state(self):
+        compute = dict(fakes.COMPUTE_NODES[0], generation=3)
+        host_state = host_manager.HostState('host1', 'node1', compute=compute)
+        instance = {'vcpus': 1, 'memory_mb': 256, 'root_gb': 10,
+                    'ephemeral_gb': 5}
+        return host_state, instance
+
+    @mock.patch.object(db, 'compute_node_claim', return_value=4)
+    def test_claim_from_instance(self, mock_claim):
+        host_state, instance = self._claim_host_state()
+
+        self.assertTrue(self.host_manager.claim_from_instance(
+            'fake_context', host_state, instance))
+        mock_claim.assert_called_once_with('fake_context', 1, 3, 1, 256, 15)
+        self.assertEqual(4, host_state.generation)
+
+    @mock.patch.object(db, 'compute_node_get')
+    @mock.patch.object(db, 'compute_node_claim',
+                       side_effect=exception.ComputeNodeClaimConflict(
+                           compute_id=1, generation=3))
+    def test_claim_from_instance_conflict(self, mock_claim, mock_get):
+        host_state, instance = self._claim_host_state()
+        host_state.consume_from_instance(dict(instance, vm_state=None))
+        mock_get.return_value = dict(fakes.COMPUTE_NODES[0], generation=5,
+                                     free_ram_mb=128)
+
+        self.assertFalse(self.host_manager.claim_from_instance(
+            'fake_context', host_state, instance))
+        mock_get.assert_called_once_with('fake_context', 1)
+        self.assertEqual(5, host_state.generation)
+        self.assertEqual(128, host_state.free_ram_mb)
+
+    @mock.patch.object(db, 'compute_node_release')
+    def test_release_from_instance(self, mock_release):
+        host_state, instance = self._claim_host_state()
+
+        self.host_manager.release_from_instance('fake_context', host_state,
+                                                instance)
+        mock_release.assert_called_once_with('fake_context', 1, 1, 256, 15)
+
+    @mock.patch.object(db, 'compute_node_release')
+    def test_release_from_instance_without_generation(self, mock_release):
+        host_state = host_manager.HostState('host1', 'node1',
+                                            compute=fakes.COMPUTE_NODES[0])
+
+        self.host_manager.release_from_instance('fake_context', host_state,
+                                                {})
+        self.assertFalse(mock_release.called)
+
+    @mock.patch.object(db, 'compute_node_claim')
+    def test_claim_from_instance_without_generation(self, mock_claim):
+        host_state = host_manager.HostState('host1', 'node1',
+                                            compute=fakes.COMPUTE_NODES[0])
+
+        self.assertTrue(self.host_manager.claim_from_instance(
+            'fake_context', host_state, {}))
+        self.assertFalse(mock_claim.called)
+
     def test_get_all_host_states_after_delete_one(self):
         context = 'fake_context'
 
@@ -387,6 +469,190 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerIncrementalRefreshTestCase(test.NoDBTestCase):
+    """Test case for the incremental refresh of the HostManager."""
+
+    def setUp(self):
+        super(HostManagerIncrementalRefreshTestCase, self).setUp()
+        self.flags(scheduler_host_state_incremental_refresh=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.then = timeutils.utcnow()
+        timeutils.set_time_override(self.then)
+        self.addCleanup(timeutils.clear_time_override)
+        self.db_utcnow = mock.patch.object(
+                db, 'db_utcnow',
+                side_effect=lambda context: timeutils.utcnow()).start()
+        self.addCleanup(mock.patch.stopall)
+        self.margin = datetime.timedelta(seconds=60)
+        self.services = [dict(id=i, host='host%s' % i, disabled=False,
+                              binary='nova-compute') for i in xrange(1, 4)]
+        self.nodes = [self._fake_node(i) for i in xrange(1, 4)]
+
+    def _fake_node(self, i, **kwargs):
+        node = dict(id=i, service_id=i, local_gb=1024, memory_mb=1024,
+                    vcpus=1, disk_available_least=None, free_ram_mb=512,
+                    vcpus_used=1, free_disk_gb=512, local_gb_used=0,
+                    created_at=self.then, updated_at=self.then,
+                    deleted_at=None, deleted=0,
+                    hypervisor_hostname='node%s' % i, host_ip='127.0.0.1',
+                    hypervisor_version=0, numa_topology=None)
+        node.update(kwargs)
+        return node
+
+    def _full_nodes(self):
+        nodes = []
+        for node in self.nodes:
+            node = dict(node)
+            node['service'] = self.services[node['id'] - 1]
+            nodes.append(node)
+        return nodes
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_changed_nodes_only(self, get_all, get_changed, get_services):
+        get_all.return_value = self._full_nodes()
+        later = self.then + datetime.timedelta(seconds=10)
+        get_changed.return_value = [self._fake_node(2, updated_at=later,
+                                                    free_ram_mb=128)]
+        get_services.return_value = self.services
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(10)
+        self.host_manager.get_all_host_states(self.context)
+
+        get_all.assert_called_once_with(self.context)
+        get_changed.assert_called_once_with(self.context,
+                                            self.then - self.margin)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(3, len(host_states_map))
+        self.assertEqual(128, host_states_map[('host2', 'node2')].free_ram_mb)
+        self.assertEqual(512, host_states_map[('host1', 'node1')].free_ram_mb)
+        self.assertEqual(later - self.margin,
+                         self.host_manager._compute_node_watermark)
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_watermark_from_db_clock(self, get_all, get_changed,
+                                     get_services):
+        self.flags(scheduler_host_state_watermark_margin=5)
+        # The compute nodes are written by hosts whose clock is ahead.
+        ahead = self.then + datetime.timedelta(minutes=10)
+        self.nodes = [self._fake_node(i, updated_at=ahead)
+                      for i in xrange(1, 4)]
+        get_all.return_value = self._full_nodes()
+        get_changed.return_value = []
+        get_services.return_value = self.services
+        db_now = self.then - datetime.timedelta(seconds=3)
+        self.db_utcnow.side_effect = None
+        self.db_utcnow.return_value = db_now
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        get_changed.assert_called_once_with(
+                self.context, db_now - datetime.timedelta(seconds=5))
+        self.db_utcnow.assert_called_with(self.context)
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_consumed_host_states_reset(self, get_all, get_changed,
+                                        get_services):
+        get_all.return_value = self._full_nodes()
+        later = self.then + datetime.timedelta(seconds=10)
+        get_changed.return_value = [self._fake_node(2, updated_at=self.then,
+                                                    free_ram_mb=128)]
+        get_services.return_value = self.services
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=64, vcpus=1,
+                        numa_topology=None, pci_requests=None)
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.set_time_override(later)
+        host_states_map = self.host_manager.host_state_map
+        for host_state in host_states_map.itervalues():
+            host_state.consume_from_instance(instance)
+        self.host_manager.get_all_host_states(self.context)
+
+        # Unchanged, reset from the compute node loaded by the full refresh.
+        host_state = host_states_map[('host1', 'node1')]
+        self.assertEqual(512, host_state.free_ram_mb)
+        self.assertEqual(1, host_state.vcpus_used)
+        self.assertEqual(self.then, host_state.updated)
+        # Changed, but before the consumption.
+        self.assertEqual(128, host_states_map[('host2', 'node2')].free_ram_mb)
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_deleted_node_and_service(self, get_all, get_changed,
+                                      get_services):
+        get_all.return_value = self._full_nodes()
+        later = self.then + datetime.timedelta(seconds=10)
+        get_changed.return_value = [self._fake_node(1, deleted_at=later,
+                                                    deleted=1)]
+        # host3's service is gone as well
+        get_services.return_value = self.services[:2]
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual([('host2', 'node2')],
+                         self.host_manager.host_state_map.keys())
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_services_refreshed(self, get_all, get_changed, get_services):
+        get_all.return_value = self._full_nodes()
+        get_changed.return_value = []
+        services = [dict(service) for service in self.services]
+        services[0]['disabled'] = True
+        get_services.return_value = services
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        self.assertTrue(host_state.service['disabled'])
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_max_staleness(self, get_all, get_changed, get_services):
+        self.flags(scheduler_host_state_max_staleness=30)
+        get_all.return_value = self._full_nodes()
+        get_changed.return_value = []
+        get_services.return_value = self.services
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(10)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertFalse(get_changed.called)
+
+        timeutils.advance_time_seconds(31)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(1, get_changed.call_count)
+        self.assertEqual(1, get_all.call_count)
+
+    @mock.patch.object(db, 'service_get_all')
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_full_resync(self, get_all, get_changed, get_services):
+        self.flags(scheduler_host_state_full_resync_interval=60)
+        get_all.return_value = self._full_nodes()
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(2, get_all.call_count)
+        self.assertFalse(get_changed.called)
+        self.assertFalse(get_services.called)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -457,6 +723,49 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertIsNone(host.pci_stats)
         self.assertEqual(hyper_ver_int, host.hypervisor_version)
 
+    def _host_state_with_stats(self, stats):
+        compute = dict(stats=jsonutils.dumps(stats), memory_mb=0,
+                       free_disk_gb=0, local_gb=0, local_gb_used=0,
+                       free_ram_mb=0, vcpus=0, vcpus_used=0,
+                       updated_at=None, host_ip='127.0.0.1',
+                       numa_topology=None)
+        host = host_manager.HostState("fakehost", "fakenode")
+        host.update_from_compute_node(compute)
+        return host
+
+    def test_instance_counts_from_compute_node(self):
+        host = self._host_state_with_stats({
+            'num_instances': '4',
+            'num_proj_12345': '3',
+            'num_proj_23456': '1',
+            'num_proj_34567': '0',
+            'num_type_1': '3',
+            'num_type_2': '1',
+            'num_type_3': '0',
+            'num_type_None': '1',
+        })
+
+        self.assertEqual({'12345': 3, '23456': 1},
+                         host.num_instances_by_project)
+        self.assertEqual({'1': 3, '2': 1}, host.num_instances_by_type)
+
+        host.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                        memory_mb=0, vcpus=0,
+                                        project_id='34567',
+                                        instance_type_id=3))
+
+        self.assertEqual(1, host.num_instances_by_project['34567'])
+        self.assertEqual({'1': 3, '2': 1, '3': 1},
+                         host.num_instances_by_type)
+
+    def test_instance_counts_from_compute_node_without_types(self):
+        host = self._host_state_with_stats({'num_instances': '1',
+                                            'num_proj_12345': '1'})
+        self.assertIsNone(host.num_instances_by_type)
+
+        host = self._host_state_with_stats({})
+        self.assertEqual({}, host.num_instances_by_type)
+
     def test_stat_consumption_from_compute_node_rescue_unshelving(self):
         stats = {
             'num_instances': '5',
@@ -168,6 +168,26 @@ class IronicHostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(1, host.hypervisor_version)
         self.assertEqual('fake_host', host.hypervisor_hostname)
 
+    def test_update_from_compute_node_loads_changes_only(self):
+        host = ironic_host_manager.IronicNodeState("fakehost", "fakenode")
+        other = ironic_host_manager.IronicNodeState("fakehost", "othernode")
+        host.update_from_compute_node(self.compute_node)
+        stats = host.stats
+
+        with mock.patch.object(jsonutils, 'loads') as mock_loads:
+            host.update_from_compute_node(dict(self.compute_node,
+                                               free_ram_mb=512))
+            other.update_from_compute_node(self.compute_node)
+
+        self.assertIs(stats, host.stats)
+        self.assertEqual(512, host.free_ram_mb)
+        # Only the stats of the other node were loaded, its supported
+        # instances are the ones of the first node.
+        mock_loads.assert_called_once_with(self.compute_node['stats'])
+        self.assertIs(host.supported_instances, other.supported_instances)
+        self.assertEqual([["i386", "baremetal", "baremetal"]],
+                         host.supported_instances)
+
     def test_consume_identical_instance_from_compute(self):
         host = ironic_host_manager.IronicNodeState("fakehost", "fakenode")
         host.update_from_compute_node(self.compute_node)
@@ -0,0 +1,119 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler request tracing.
+"""
+
+import mock
+
+from nova import context
+from nova.scheduler import filters
+from nova.scheduler import trace
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+class PassFilter(filters.BaseHostFilter):
+    def host_passes(self, host_state, filter_properties):
+        return host_state.host != 'host2'
+
+
+class SchedulerTraceTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(SchedulerTraceTestCase, self).setUp()
+        self.context = context.RequestContext('fake', 'fake', is_admin=True,
+                                              scheduler_trace=True)
+        self.addCleanup(setattr, trace._local, 'trace', None)
+
+    def test_start_asked_by_context(self):
+        result = trace.start(self.context)
+
+        self.assertIsNotNone(result)
+        self.assertIs(result, trace.current())
+        self.assertEqual(self.context.request_id, result.request_id)
+
+    def test_start_not_asked(self):
+        self.context.scheduler_trace = False
+
+        self.assertIsNone(trace.start(self.context))
+        self.assertIsNone(trace.current())
+
+    def test_start_ignored_for_non_admin(self):
+        self.context.is_admin = False
+
+        self.assertIsNone(trace.start(self.context))
+
+    def test_start_sampled(self):
+        self.context.scheduler_trace = False
+        self.flags(scheduler_trace_sample_rate=1.0)
+
+        self.assertIsNotNone(trace.start(self.context))
+
+    def test_step(self):
+        result = trace.start(self.context)
+
+        with trace.step('foo'):
+            pass
+        with trace.step('foo'):
+            pass
+        trace.record('bar', 1.0, hosts_in=3)
+        trace.record('bar', 1.0, hosts_in=2)
+
+        self.assertEqual(2, result.steps['foo']['calls'])
+        self.assertEqual({'calls': 2, 'seconds': 2.0, 'hosts_in': 5},
+                         result.steps['bar'])
+
+    def test_step_not_traced(self):
+        with trace.step('foo'):
+            pass
+        trace.record('bar', 1.0)
+
+        self.assertIsNone(trace.current())
+
+    def test_finish(self):
+        notifier = mock.Mock()
+        trace.start(self.context)
+        trace.record('foo', 1.0)
+
+        trace.finish(self.context, notifier)
+
+        self.assertIsNone(trace.current())
+        event_type, payload = notifier.info.call_args[0][1:]
+        self.assertEqual('scheduler.trace', event_type)
+        self.assertEqual(self.context.request_id, payload['request_id'])
+        self.assertEqual({'foo': {'calls': 1, 'seconds': 1.0}},
+                         payload['steps'])
+        self.assertIsNotNone(payload['seconds'])
+
+    def test_finish_not_traced(self):
+        notifier = mock.Mock()
+
+        trace.finish(self.context, notifier)
+
+        self.assertFalse(notifier.info.called)
+
+    def test_filters_traced(self):
+        result = trace.start(self.context)
+        host_states = [fakes.FakeHostState('host%d' % i, 'node', {})
+                       for i in xrange(4)]
+
+        filters.HostFilterHandler().get_filtered_objects(
+            [PassFilter], host_states, {})
+
+        step = result.steps['filter.PassFilter']
+        self.assertEqual(1, step['calls'])
+        self.assertEqual(4, step['hosts_in'])
+        self.assertEqual(3, step['hosts_out'])
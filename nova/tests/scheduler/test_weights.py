@@ -131,6 +131,36 @@ class RamWeigherTestCase(test.NoDBTestCase):
         self.assertEqual(weighed_host.weight, 0)
         self.assertEqual(weighed_host.obj.host, "negative")
 
+    def _big_and_small_hosts(self):
+        return [
+            fakes.FakeHostState('big', 'big', {'total_usable_ram_mb': 16384,
+                                               'free_ram_mb': 8192}),
+            fakes.FakeHostState('small', 'small',
+                                {'total_usable_ram_mb': 4096,
+                                 'free_ram_mb': 4096}),
+        ]
+
+    def test_ram_filter_free_ram_range(self):
+        weights = self.weight_handler.get_weighed_objects(
+            self.weight_classes, self._big_and_small_hosts(), {})
+
+        self.assertEqual([('big', 1.0), ('small', 0.5)],
+                         [(w.obj.host, w.weight) for w in weights])
+
+    def test_ram_filter_capacity_bounds(self):
+        self.flags(ram_weight_capacity_bounds=True)
+        hostinfo_list = self._big_and_small_hosts()
+        hostinfo_list.append(fakes.FakeHostState(
+            'negative', 'negative', {'total_usable_ram_mb': 8192,
+                                     'free_ram_mb': -512}))
+
+        # The free RAM is normalized against the RAM of the big host.
+        weights = self.weight_handler.get_weighed_objects(self.weight_classes,
+                                                          hostinfo_list, {})
+
+        self.assertEqual([('big', 0.5), ('small', 0.25), ('negative', 0.0)],
+                         [(w.obj.host, w.weight) for w in weights])
+
 
 class MetricsWeigherTestCase(test.NoDBTestCase):
     def setUp(self):
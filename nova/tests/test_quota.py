@@ -16,6 +16,7 @@
 
 import datetime
 
+import mock
 from oslo.config import cfg
 from oslo.utils import timeutils
 
@@ -2212,6 +2213,156 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(calls, exemplar)
 
 
+class RaiseOverQuotaTestCase(test.NoDBTestCase):
+    def test_headroom(self):
+        quotas = dict(instances=10, cores=-1, ram=-1, key_pairs=5)
+        usages = dict(instances=dict(in_use=4, reserved=2),
+                      cores=dict(in_use=12, reserved=4),
+                      ram=dict(in_use=8192, reserved=0),
+                      key_pairs=dict(in_use=5, reserved=0))
+        deltas = dict(instances=5, cores=10, ram=0)
+
+        exc = self.assertRaises(exception.OverQuota, quota.raise_over_quota,
+                                quotas, deltas, ['instances'], usages)
+
+        # The unlimited cores are bounded by the instances, and so is the
+        # unlimited ram which is not requested.
+        self.assertEqual(dict(instances=4, cores=8, ram=4, key_pairs=0),
+                         exc.kwargs['headroom'])
+        self.assertEqual(['instances'], exc.kwargs['overs'])
+        self.assertEqual(usages, exc.kwargs['usages'])
+
+
+class OptimisticDbQuotaDriverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(OptimisticDbQuotaDriverTestCase, self).setUp()
+        self.flags(until_refresh=5, max_age=60, quota_usage_update_attempts=3)
+        self.driver = quota.OptimisticDbQuotaDriver()
+        self.context = FakeContext('test_project', 'test_class')
+
+    @mock.patch.object(db, 'quota_reserve')
+    @mock.patch.object(db, 'quota_reserve_optimistic')
+    def test_reserve(self, mock_reserve, mock_locked_reserve):
+        mock_reserve.return_value = ['resv-1']
+        self.stubs.Set(self.driver, '_get_quotas',
+                       lambda *args, **kwargs: dict(instances=10))
+        self.stubs.Set(db, 'quota_get_all_by_project',
+                       lambda context, project_id: {})
+        expire = timeutils.utcnow() + datetime.timedelta(seconds=120)
+
+        result = self.driver.reserve(self.context, quota.QUOTAS._resources,
+                                     dict(instances=2), expire=expire)
+
+        self.assertEqual(['resv-1'], result)
+        mock_reserve.assert_called_once_with(
+            self.context, quota.QUOTAS._resources, dict(instances=10),
+            dict(instances=10), dict(instances=2), expire, 5, 60,
+            project_id='test_project', user_id='fake_user', max_attempts=3)
+        self.assertFalse(mock_locked_reserve.called)
+
+    @mock.patch.object(db, 'reservation_commit_optimistic')
+    def test_commit(self, mock_commit):
+        self.driver.commit(self.context, ['resv-1'])
+        mock_commit.assert_called_once_with(
+            self.context, ['resv-1'], project_id='test_project',
+            user_id='fake_user', max_attempts=3)
+
+    @mock.patch.object(db, 'reservation_rollback_optimistic')
+    def test_rollback(self, mock_rollback):
+        self.driver.rollback(self.context, ['resv-1'])
+        mock_rollback.assert_called_once_with(
+            self.context, ['resv-1'], project_id='test_project',
+            user_id='fake_user', max_attempts=3)
+
+
+class CountingQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(CountingQuotaDriverTestCase, self).setUp()
+        self.flags(quota_instances=3,
+                   quota_cores=10,
+                   quota_ram=10 * 1024,
+                   quota_usage_cache_ttl=2)
+        self.driver = quota.CountingQuotaDriver()
+        self.context = context.RequestContext('fake_user', 'test_project')
+        self.resources = quota.QUOTAS._resources
+        self.useFixture(test.TimeOverride())
+        for user_id in ('fake_user', 'other_user'):
+            db.instance_create(self.context, {'project_id': 'test_project',
+                                              'user_id': user_id,
+                                              'vcpus': 2,
+                                              'memory_mb': 1024})
+
+    def test_reserve(self):
+        reservations = self.driver.reserve(self.context, self.resources,
+                                           dict(instances=1, cores=2,
+                                                ram=1024))
+        self.assertEqual([], reservations)
+
+    def test_reserve_over_quota(self):
+        exc = self.assertRaises(exception.OverQuota, self.driver.reserve,
+                                self.context, self.resources,
+                                dict(instances=2, cores=4, ram=2048))
+        self.assertEqual(['instances'], exc.kwargs['overs'])
+        self.assertEqual(1, exc.kwargs['headroom']['instances'])
+        self.assertEqual(6, exc.kwargs['headroom']['cores'])
+        self.assertEqual(dict(in_use=2, reserved=0),
+                         exc.kwargs['usages']['instances'])
+
+    def test_reserve_adds_to_cached_usages(self):
+        with mock.patch.object(db, 'quota_usage_count',
+                               wraps=db.quota_usage_count) as mock_count:
+            self.driver.reserve(self.context, self.resources,
+                                dict(instances=1))
+            self.assertRaises(exception.OverQuota, self.driver.reserve,
+                              self.context, self.resources,
+                              dict(instances=1))
+        # The usages of the project and of the user are counted once.
+        self.assertEqual(2, mock_count.call_count)
+
+    def test_reserve_cached_usages_expire(self):
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        timeutils.advance_time_seconds(2)
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+
+    def test_reserve_without_cache(self):
+        self.flags(quota_usage_cache_ttl=0)
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.assertEqual({}, self.driver._usages)
+
+    def test_get_project_quotas(self):
+        quotas = self.driver.get_project_quotas(self.context, self.resources,
+                                                'test_project')
+        self.assertEqual(dict(limit=3, in_use=2, reserved=0),
+                         quotas['instances'])
+        self.assertEqual(dict(limit=10, in_use=4, reserved=0),
+                         quotas['cores'])
+
+    def test_get_user_quotas(self):
+        quotas = self.driver.get_user_quotas(self.context, self.resources,
+                                             'test_project', 'fake_user')
+        self.assertEqual(dict(limit=3, in_use=1, reserved=0),
+                         quotas['instances'])
+        self.assertEqual(dict(limit=10 * 1024, in_use=1024, reserved=0),
+                         quotas['ram'])
+
+    def test_usage_reset(self):
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.driver.usage_reset(self.context, ['instances'])
+        self.assertNotIn('test_project', self.driver._usages)
+
+    @mock.patch.object(db, 'reservation_expire')
+    @mock.patch.object(db, 'reservation_rollback')
+    @mock.patch.object(db, 'reservation_commit')
+    def test_nothing_reserved(self, mock_commit, mock_rollback, mock_expire):
+        self.driver.commit(self.context, [])
+        self.driver.rollback(self.context, [])
+        self.driver.expire(self.context)
+        self.assertFalse(mock_commit.called)
+        self.assertFalse(mock_rollback.called)
+        self.assertFalse(mock_expire.called)
+
+
 class FakeSession(object):
     def begin(self):
         return self
@@ -16,6 +16,7 @@
 Tests For weights.
 """
 
+from nova import loadables
 from nova import test
 from nova import weights
 
@@ -51,3 +52,122 @@ class TestWeigher(test.NoDBTestCase):
         for seq, result, minval, maxval in map_:
             ret = weights.normalize(seq, minval=minval, maxval=maxval)
             self.assertEqual(tuple(ret), result)
+
+
+class FakeObject(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class CountingWeigher(weights.BaseWeigher):
+    calls = 0
+
+    def _weigh_object(self, obj, weight_properties):
+        CountingWeigher.calls += 1
+        return obj.value
+
+
+class TestWeightHandler(test.NoDBTestCase):
+    def setUp(self):
+        super(TestWeightHandler, self).setUp()
+
+        def _fake_base_loader_init(*args, **kwargs):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       _fake_base_loader_init)
+        self.handler = weights.BaseWeightHandler(weights.BaseWeigher)
+        self.objs = [FakeObject(value) for value in (3, 1, 4, 1, 5, 9, 2)]
+        CountingWeigher.calls = 0
+
+    def _weigh(self, limit=None, cache=None):
+        return [(w.obj.value, w.weight) for w in
+                self.handler.get_weighed_objects([CountingWeigher],
+                                                 self.objs, {}, limit=limit,
+                                                 cache=cache)]
+
+    def test_top_weighed_objects(self):
+        weighed = [weights.WeighedObject(obj, obj.value)
+                   for obj in self.objs]
+        self.assertEqual(
+            weights.top_weighed_objects(weighed)[:3],
+            weights.top_weighed_objects(weighed, limit=3))
+        self.assertEqual([9, 5, 4], [w.weight for w in
+                         weights.top_weighed_objects(weighed, limit=3)])
+        # Equal weights keep their order, as with sorted()
+        weighed = [weights.WeighedObject(obj, 1.0) for obj in self.objs]
+        top = weights.top_weighed_objects(weighed, limit=2)
+        self.assertEqual([self.objs[0], self.objs[1]], [w.obj for w in top])
+
+    def test_limit(self):
+        self.assertEqual(self._weigh()[:2], self._weigh(limit=2))
+        self.assertEqual(self._weigh(), self._weigh(limit=100))
+
+    def test_cache(self):
+        cache = weights.WeightCache()
+        expected = self._weigh()
+        CountingWeigher.calls = 0
+
+        self.assertEqual(expected, self._weigh(cache=cache))
+        self.assertEqual(len(self.objs), CountingWeigher.calls)
+        self.assertEqual(expected, self._weigh(cache=cache))
+        self.assertEqual(len(self.objs), CountingWeigher.calls)
+
+        # Only the invalidated object is weighed again, and the weights are
+        # normalized with the updated bounds.
+        self.objs[0].value = 20
+        cache.invalidate(self.objs[0])
+        self.assertEqual(self._weigh(), self._weigh(cache=cache))
+        self.assertEqual(2 * len(self.objs) + 1, CountingWeigher.calls)
+
+    def test_cache_not_used_by_weigh_objects_override(self):
+        class AllObjectsWeigher(CountingWeigher):
+            def weigh_objects(self, weighed_obj_list, weight_properties):
+                return [1.0] * len(weighed_obj_list)
+
+        self.assertTrue(weights.WeightCache.is_cacheable(CountingWeigher()))
+        self.assertFalse(
+            weights.WeightCache.is_cacheable(AllObjectsWeigher()))
+
+    def test_weight_bounds(self):
+        class BoundedWeigher(CountingWeigher):
+            def weight_bounds(self, obj_list, weight_properties):
+                return 0, 10
+
+        weighed = self.handler.get_weighed_objects([BoundedWeigher],
+                                                   self.objs, {})
+
+        self.assertEqual([(9, 0.9), (5, 0.5), (4, 0.4)],
+                         [(w.obj.value, w.weight) for w in weighed[:3]])
+
+    def test_weight_bounds_clamped(self):
+        class BoundedWeigher(CountingWeigher):
+            def weight_bounds(self, obj_list, weight_properties):
+                return 2, 6
+
+        weighed = self.handler.get_weighed_objects([BoundedWeigher],
+                                                   self.objs, {})
+
+        # 9 is clamped to 6, and 1 to 2.
+        self.assertEqual([1.0, 0.75, 0.5, 0.25, 0.0, 0.0, 0.0],
+                         [w.weight for w in weighed])
+
+    def test_weigh_objects_override(self):
+        class AllObjectsWeigher(CountingWeigher):
+            def weigh_objects(self, weighed_obj_list, weight_properties):
+                return [-w.obj.value for w in weighed_obj_list]
+
+        weighed = self.handler.get_weighed_objects(
+            [CountingWeigher, AllObjectsWeigher], self.objs, {}, limit=2)
+
+        # Both weighers cancel each other out, the order is kept.
+        self.assertEqual([(3, 1.0), (1, 1.0)],
+                         [(w.obj.value, w.weight) for w in weighed])
+
+    def test_weighed_object_slots(self):
+        weighed = self.handler.get_weighed_objects([CountingWeigher],
+                                                   self.objs, {})
+
+        self.assertIsInstance(weighed[0], weights.WeighedObject)
+        self.assertFalse(hasattr(weighed[0], '__dict__'))
+        self.assertEqual(1.0, weighed[0].weight)
@@ -453,6 +453,29 @@ class IronicDriverTestCase(test.NoDBTestCase):
         expected_uuids = [n['uuid'] for n in node_dicts]
         self.assertEqual(sorted(expected_uuids), sorted(available_nodes))
 
+    @mock.patch.object(FAKE_CLIENT.node, 'list')
+    def test_get_available_nodes_cache_ttl(self, mock_list):
+        self.flags(node_cache_ttl=60, group='ironic')
+        node = ironic_utils.get_test_node()
+        mock_list.return_value = [node]
+
+        self.assertEqual([node.uuid], self.driver.get_available_nodes())
+        self.assertEqual([node.uuid], self.driver.get_available_nodes())
+        self.assertEqual(1, mock_list.call_count)
+
+        # The cache expired.
+        self.driver.node_cache_time -= 60
+        self.driver.get_available_nodes()
+        self.assertEqual(2, mock_list.call_count)
+
+    @mock.patch.object(FAKE_CLIENT.node, 'list')
+    def test_get_available_nodes_no_cache_ttl(self, mock_list):
+        mock_list.return_value = [ironic_utils.get_test_node()]
+
+        self.driver.get_available_nodes()
+        self.driver.get_available_nodes()
+        self.assertEqual(2, mock_list.call_count)
+
     @mock.patch.object(FAKE_CLIENT.node, 'get')
     @mock.patch.object(FAKE_CLIENT.node, 'list')
     @mock.patch.object(ironic_driver.IronicDriver, '_node_resource')
@@ -469,6 +492,7 @@ class IronicDriverTestCase(test.NoDBTestCase):
         self.assertEqual(fake_resource, result)
         mock_nr.assert_called_once_with(node)
         mock_get.assert_called_once_with(node.uuid)
+        self.assertIs(node, self.driver.node_cache[node.uuid])
 
     @mock.patch.object(FAKE_CLIENT.node, 'get')
     @mock.patch.object(FAKE_CLIENT.node, 'list')
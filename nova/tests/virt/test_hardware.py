@@ -666,6 +666,61 @@ class VCPUTopologyTest(test.NoDBTestCase):
             self.assertEqual(topo_test["expect"][1], topology.cores)
             self.assertEqual(topo_test["expect"][2], topology.threads)
 
+    def test_possible_configs_same_as_brute_force(self):
+        self.stubs.Set(hw, '_possible_topologies_cache', {})
+        for vcpus in (1, 6, 7, 12, 36, 64, 128, 240):
+            for maxsockets, maxcores, maxthreads in ((65536, 65536, 65536),
+                                                     (4, 32, 2),
+                                                     (2, 8, 1)):
+                for allow_threads in (True, False):
+                    threads = min(vcpus, maxthreads) if allow_threads else 1
+                    expect = []
+                    for s in range(1, min(vcpus, maxsockets) + 1):
+                        for c in range(1, min(vcpus, maxcores) + 1):
+                            for t in range(1, threads + 1):
+                                if s * c * t == vcpus:
+                                    expect.append((s, c, t))
+                    expect.sort(reverse=True,
+                                key=lambda x: (x[0] * x[1], x[0], x[2]))
+                    maxtopology = hw.VirtCPUTopology(maxsockets, maxcores,
+                                                     maxthreads)
+                    if not expect:
+                        self.assertRaises(
+                            exception.ImageVCPULimitsRangeImpossible,
+                            hw.VirtCPUTopology.get_possible_topologies,
+                            vcpus, maxtopology, allow_threads)
+                        continue
+                    actual = hw.VirtCPUTopology.get_possible_topologies(
+                        vcpus, maxtopology, allow_threads)
+                    self.assertEqual(expect,
+                                     [(t.sockets, t.cores, t.threads)
+                                      for t in actual])
+
+    def test_desirable_configs_cached(self):
+        self.stubs.Set(hw, '_possible_topologies_cache', {})
+        self.stubs.Set(hw, '_desirable_topologies_cache', {})
+        flavor = FakeFlavorObject(128, 2048, {"hw:cpu_sockets": "4"})
+
+        with mock.patch.object(hw.VirtCPUTopology, 'sort_possible_topologies',
+                side_effect=hw.VirtCPUTopology.sort_possible_topologies
+        ) as mock_sort:
+            first = hw.VirtCPUTopology.get_desirable_configs(flavor, {}, True)
+            second = hw.VirtCPUTopology.get_desirable_configs(flavor, {},
+                                                              True)
+
+        self.assertEqual(1, mock_sort.call_count)
+        self.assertEqual((4, 32, 1), (first[0].sockets, first[0].cores,
+                                      first[0].threads))
+        self.assertEqual([(t.sockets, t.cores, t.threads) for t in first],
+                         [(t.sockets, t.cores, t.threads) for t in second])
+        self.assertIsNot(first[0], second[0])
+
+    def test_divisors(self):
+        self.assertEqual([1], hw._divisors(1))
+        self.assertEqual([1, 2, 3, 4, 6, 12], hw._divisors(12))
+        self.assertEqual([1, 2, 4, 8, 16], hw._divisors(16))
+        self.assertEqual([1, 7], hw._divisors(7))
+
 
 class NUMATopologyTest(test.NoDBTestCase):
 
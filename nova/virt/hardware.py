@@ -189,6 +189,33 @@ def get_number_of_serial_ports(flavor, image_meta):
     return flavor_num_ports or image_num_ports or 1
 
 
+# Lists of (sockets, cores, threads) tuples computed by VirtCPUTopology, so
+# that large vCPU counts are only enumerated once per set of constraints.
+_CPU_TOPOLOGIES_CACHE_SIZE = 1024
+_possible_topologies_cache = {}
+_desirable_topologies_cache = {}
+
+
+def _cache_cpu_topologies(cache, key, topologies):
+    if len(cache) >= _CPU_TOPOLOGIES_CACHE_SIZE:
+        cache.clear()
+    cache[key] = topologies
+
+
+def _divisors(number):
+    """Return the divisors of a positive number, in ascending order."""
+    low = []
+    high = []
+    i = 1
+    while i * i <= number:
+        if number % i == 0:
+            low.append(i)
+            if i * i != number:
+                high.append(number // i)
+        i += 1
+    return low + high[::-1]
+
+
 class VirtCPUTopology(object):
 
     def __init__(self, sockets, cores, threads):
@@ -417,26 +444,30 @@ class VirtCPUTopology(object):
                   {"vcpus": vcpus, "maxsockets": maxsockets,
                    "maxcores": maxcores, "maxthreads": maxthreads})
 
-        # Figure out all possible topologies that match
-        # the required vcpus count and satisfy the declared
-        # limits. If the total vCPU count were very high
-        # it might be more efficient to factorize the vcpu
-        # count and then only iterate over its factors, but
-        # that's overkill right now
-        possible = []
-        for s in range(1, maxsockets + 1):
-            for c in range(1, maxcores + 1):
-                for t in range(1, maxthreads + 1):
-                    if t * c * s == vcpus:
-                        possible.append(VirtCPUTopology(s, c, t))
-
-        # We want to
-        #  - Minimize threads (ie larger sockets * cores is best)
-        #  - Prefer sockets over cores
-        possible = sorted(possible, reverse=True,
-                          key=lambda x: (x.sockets * x.cores,
-                                         x.sockets,
-                                         x.threads))
+        key = (vcpus, maxsockets, maxcores, maxthreads)
+        possible = _possible_topologies_cache.get(key)
+        if possible is None:
+            # Figure out all possible topologies that match
+            # the required vcpus count and satisfy the declared
+            # limits, iterating over the divisors of the vcpu
+            # count only.
+            possible = []
+            for s in _divisors(vcpus):
+                if s > maxsockets:
+                    break
+                for c in _divisors(vcpus // s):
+                    if c > maxcores:
+                        break
+                    t = vcpus // (s * c)
+                    if t <= maxthreads:
+                        possible.append((s, c, t))
+
+            # We want to
+            #  - Minimize threads (ie larger sockets * cores is best)
+            #  - Prefer sockets over cores
+            possible.sort(reverse=True,
+                          key=lambda x: (x[0] * x[1], x[0], x[2]))
+            _cache_cpu_topologies(_possible_topologies_cache, key, possible)
 
         LOG.debug("Got %d possible topologies", len(possible))
         if len(possible) == 0:
@@ -445,7 +476,7 @@ class VirtCPUTopology(object):
                                                            cores=maxcores,
                                                            threads=maxthreads)
 
-        return possible
+        return [VirtCPUTopology(*topology) for topology in possible]
 
     @staticmethod
     def sort_possible_topologies(possible, wanttopology):
@@ -504,12 +535,21 @@ class VirtCPUTopology(object):
             VirtCPUTopology.get_topology_constraints(flavor,
                                                      image_meta))
 
-        possible = VirtCPUTopology.get_possible_topologies(
-            flavor.vcpus, maximum, allow_threads)
-        desired = VirtCPUTopology.sort_possible_topologies(
-            possible, preferred)
-
-        return desired
+        key = (flavor.vcpus,
+               (preferred.sockets, preferred.cores, preferred.threads),
+               (maximum.sockets, maximum.cores, maximum.threads),
+               allow_threads)
+        desired = _desirable_topologies_cache.get(key)
+        if desired is None:
+            possible = VirtCPUTopology.get_possible_topologies(
+                flavor.vcpus, maximum, allow_threads)
+            desired = VirtCPUTopology.sort_possible_topologies(
+                possible, preferred)
+            desired = [(topology.sockets, topology.cores, topology.threads)
+                       for topology in desired]
+            _cache_cpu_topologies(_desirable_topologies_cache, key, desired)
+
+        return [VirtCPUTopology(s, c, t) for s, c, t in desired]
 
     @staticmethod
     def get_best_config(flavor, image_meta, allow_threads=True):
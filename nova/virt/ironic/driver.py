@@ -80,6 +80,12 @@ opts = [
                default=2,
                help=('How often to retry in seconds when a request '
                      'does conflict')),
+    cfg.IntOpt('node_cache_ttl',
+               default=0,
+               help='Number of seconds the nodes listed with their details '
+                    'from the Ironic API are reused by the resource '
+                    'tracker periodic task before being listed again. '
+                    'When 0, the nodes are listed on each run.'),
     ]
 
 ironic_group = cfg.OptGroup(name='ironic',
@@ -465,7 +471,11 @@ class IronicDriver(virt_driver.ComputeDriver):
         #             because it needs to happen in the resource tracker
         #             periodic task. This task doesn't pass refresh=True,
         #             unfortunately.
-        self._refresh_cache()
+        # The nodes of a large inventory are only listed again once the
+        # cache is older than node_cache_ttl, if set.
+        cache_age = time.time() - self.node_cache_time
+        if not self.node_cache or cache_age >= CONF.ironic.node_cache_ttl:
+            self._refresh_cache()
 
         node_uuids = list(self.node_cache.keys())
         LOG.debug("Returning %(num_nodes)s available node(s)",
@@ -501,6 +511,7 @@ class IronicDriver(virt_driver.ComputeDriver):
                       {'node': nodename, 'age': cache_age})
             ironicclient = client_wrapper.IronicClientWrapper()
             node = ironicclient.call("node.get", nodename)
+            self.node_cache[nodename] = node
         return self._node_resource(node)
 
     def get_info(self, instance):
@@ -18,6 +18,10 @@ Pluggable Weighing support
 """
 
 import abc
+import array
+import heapq
+import operator
+import time
 
 import six
 
@@ -53,8 +57,24 @@ def normalize(weight_list, minval=None, maxval=None):
     return ((i - minval) / range_ for i in weight_list)
 
 
+def top_weighed_objects(weighed_objs, limit=None):
+    """Return the weighed objects sorted by descending weight.
+
+    If limit is set, only the 'limit' objects with the highest weights are
+    returned, selected with a heap instead of sorting the whole list. Objects
+    with equal weights keep their relative order in both cases.
+    """
+    key = operator.attrgetter('weight')
+    if limit is None or limit >= len(weighed_objs):
+        return sorted(weighed_objs, key=key, reverse=True)
+    return heapq.nlargest(limit, weighed_objs, key=key)
+
+
 class WeighedObject(object):
     """Object with weight information."""
+
+    __slots__ = ('obj', 'weight')
+
     def __init__(self, obj, weight):
         self.obj = obj
         self.weight = weight
@@ -89,6 +109,16 @@ class BaseWeigher(object):
     def _weigh_object(self, obj, weight_properties):
         """Weigh an specific object."""
 
+    def weight_bounds(self, obj_list, weight_properties):
+        """Return the (minval, maxval) bounds of the weights, or None.
+
+        Override in a subclass knowing the bounds of the weights of the
+        objects beforehand, from their total capacity for instance, so that
+        the weights are not scanned for them. The bounds are authoritative,
+        the weights lying out of them are clamped to them.
+        """
+        return None
+
     def weigh_objects(self, weighed_obj_list, weight_properties):
         """Weigh multiple objects.
 
@@ -118,28 +148,131 @@ class BaseWeigher(object):
         return weights
 
 
+class WeightCache(object):
+    """Raw weights of objects, reused when the same objects are weighed again.
+
+    Only the weighers using the default BaseWeigher.weigh_objects() are
+    cached, since the raw weight they give to an object only depends on the
+    object and on the weighing properties. The cache must only be used while
+    the weighing properties stay the same, and an object must be invalidated
+    when it is modified.
+    """
+
+    def __init__(self):
+        self._weights = {}
+
+    @staticmethod
+    def is_cacheable(weigher):
+        return (six.get_unbound_function(type(weigher).weigh_objects) is
+                six.get_unbound_function(BaseWeigher.weigh_objects))
+
+    def invalidate(self, obj):
+        """Forget the raw weights of an object which was modified."""
+        for weights in self._weights.itervalues():
+            weights.pop(obj, None)
+
+    def weigh(self, weigher, obj_list, weight_properties):
+        """Return the raw weights of the objects, weighing uncached ones."""
+        cached = self._weights.setdefault(type(weigher), {})
+        weights = []
+        for obj in obj_list:
+            if obj not in cached:
+                cached[obj] = weigher._weigh_object(obj, weight_properties)
+            weights.append(cached[obj])
+        return weights
+
+    def weigh_objects(self, weigher, weighed_obj_list, weight_properties):
+        """Same as weigher.weigh_objects(), weighing only uncached objects."""
+        weights = self.weigh(weigher, [w.obj for w in weighed_obj_list],
+                             weight_properties)
+        _update_bounds(weigher, weights)
+        return weights
+
+
+def _update_bounds(weigher, weights):
+    """Same bounds as the ones set by BaseWeigher.weigh_objects()."""
+    if weights:
+        if weigher.minval is None or min(weights) < weigher.minval:
+            weigher.minval = min(weights)
+        if weigher.maxval is None or max(weights) > weigher.maxval:
+            weigher.maxval = max(weights)
+
+
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def weigher_finished(self, cls_name, elapsed):
+        """Called after each weigher run, with the seconds it took.
+        Override this in a subclass to instrument the weighers.
+        """
+        pass
+
     def get_weighed_objects(self, weigher_classes, obj_list,
-            weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+            weighing_properties, limit=None, cache=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        The raw weights of each weigher are kept in a float array, and are
+        normalized and added to the total weights in a single pass. Only
+        the returned objects are wrapped in WeighedObjects.
+
+        :param limit: only return the 'limit' objects with the highest
+                      weights.
+        :param cache: a WeightCache used to only weigh the objects whose raw
+                      weights are not known yet.
+        """
 
         if not obj_list:
             return []
 
-        weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
+        obj_list = list(obj_list)
+        totals = array.array('d', [0.0]) * len(obj_list)
+        # Only built for the weighers overriding weigh_objects().
+        weighed_objs = None
         for weigher_cls in weigher_classes:
+            start = time.time()
             weigher = weigher_cls()
-            weights = weigher.weigh_objects(weighed_objs, weighing_properties)
-
-            # Normalize the weights
-            weights = normalize(weights,
-                                minval=weigher.minval,
-                                maxval=weigher.maxval)
-
-            for i, weight in enumerate(weights):
-                obj = weighed_objs[i]
-                obj.weight += weigher.weight_multiplier() * weight
-
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+            bounds = None
+            if WeightCache.is_cacheable(weigher):
+                if cache is not None:
+                    weights = cache.weigh(weigher, obj_list,
+                                          weighing_properties)
+                else:
+                    weights = [weigher._weigh_object(obj, weighing_properties)
+                               for obj in obj_list]
+                weights = array.array('d', weights)
+                bounds = weigher.weight_bounds(obj_list, weighing_properties)
+                if bounds is not None:
+                    weigher.minval, weigher.maxval = bounds
+                else:
+                    _update_bounds(weigher, weights)
+            else:
+                if weighed_objs is None:
+                    weighed_objs = [self.object_class(obj, 0.0)
+                                    for obj in obj_list]
+                weights = weigher.weigh_objects(weighed_objs,
+                                                weighing_properties)
+                if weigher.minval is None:
+                    weigher.minval = min(weights)
+                if weigher.maxval is None:
+                    weigher.maxval = max(weights)
+
+            # Normalize the weights, all equal weights are normalized to 0
+            minval = float(weigher.minval)
+            range_ = float(weigher.maxval) - minval
+            multiplier = weigher.weight_multiplier()
+            if range_ and bounds is None:
+                for i, weight in enumerate(weights):
+                    totals[i] += multiplier * ((weight - minval) / range_)
+            elif range_:
+                maxval = float(weigher.maxval)
+                for i, weight in enumerate(weights):
+                    weight = min(max(weight, minval), maxval)
+                    totals[i] += multiplier * ((weight - minval) / range_)
+            self.weigher_finished(weigher_cls.__name__, time.time() - start)
+
+        key = totals.__getitem__
+        if limit is None or limit >= len(obj_list):
+            top = sorted(xrange(len(obj_list)), key=key, reverse=True)
+        else:
+            top = heapq.nlargest(limit, xrange(len(obj_list)), key=key)
+        return [self.object_class(obj_list[i], totals[i]) for i in top]
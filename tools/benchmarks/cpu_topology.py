@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Micro-benchmark of the guest CPU topology enumeration.
+
+VirtCPUTopology.get_desirable_configs() is timed for flavors with large
+vCPU counts, with the topology caches cleared before each call (cold) and
+left populated (warm).
+
+Run like:
+
+    ./tools/benchmarks/cpu_topology.py --vcpus 128,240,256 --iterations 100
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+from nova import objects
+from nova.virt import hardware
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the enumeration of the guest CPU topologies '
+                    'for large vCPU flavors.')
+    parser.add_argument('--vcpus', default='128,192,240,256',
+                        help='Comma separated vCPU counts of the flavors.')
+    parser.add_argument('--iterations', type=int, default=100,
+                        help='Number of calls timed for each flavor.')
+    parser.add_argument('--no-threads', action='store_true',
+                        help='Enumerate the topologies of a hypervisor '
+                             'without CPU threads support.')
+    return parser.parse_args()
+
+
+def clear_caches():
+    hardware._possible_topologies_cache.clear()
+    hardware._desirable_topologies_cache.clear()
+
+
+def time_calls(flavor, iterations, allow_threads, cold):
+    elapsed = 0.0
+    for i in range(iterations):
+        if cold:
+            clear_caches()
+        start = time.time()
+        configs = hardware.VirtCPUTopology.get_desirable_configs(
+            flavor, {}, allow_threads)
+        elapsed += time.time() - start
+    return elapsed / iterations, len(configs)
+
+
+def main():
+    options = parse_options()
+    objects.register_all()
+    allow_threads = not options.no_threads
+
+    print('%6s %10s %12s %12s' % ('vcpus', 'topologies', 'cold (ms)',
+                                  'warm (ms)'))
+    for vcpus in options.vcpus.split(','):
+        flavor = objects.Flavor(vcpus=int(vcpus), memory_mb=2048,
+                                extra_specs={})
+        cold, count = time_calls(flavor, options.iterations, allow_threads,
+                                 True)
+        warm, count = time_calls(flavor, options.iterations, allow_threads,
+                                 False)
+        print('%6d %10d %12.3f %12.3f' % (int(vcpus), count, cold * 1000,
+                                          warm * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
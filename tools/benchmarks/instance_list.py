@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the pagination of the instance listings.
+
+A synthetic set of instances, spread over several projects and partly
+deleted, is created in a database, an in-memory SQLite one by default, then
+listed page by page through instance_get_all_by_filters(), the way the
+servers API lists them: sorted by descending creation time, each page
+starting after the last instance of the previous one.
+
+The benchmark reports the p50/p99 latency of the pages and the latency of
+the first and last pages, for an admin listing all the projects and for a
+single project. Since the pages seek to their first instance, the latency
+of the last pages should not grow with the number of pages before them.
+
+Run like:
+
+    ./tools/benchmarks/instance_list.py --instances 500000 --pages 50
+
+    ./tools/benchmarks/instance_list.py --connection \\
+        mysql://nova:pw@dbhost/bench --instances 1000000 --page-size 1000
+
+The database must be empty or migrated by nova-manage db sync. Any nova
+option can be given after the benchmark options.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import random
+import sys
+import time
+
+from oslo.config import cfg
+from oslo.utils import timeutils
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova.openstack.common import uuidutils
+
+CONF = cfg.CONF
+
+# Rows inserted per statement when creating the synthetic instances.
+INSERT_CHUNK_SIZE = 1000
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the pagination of the instance listings.')
+    parser.add_argument('--instances', type=int, default=100000,
+                        help='Number of instances to create.')
+    parser.add_argument('--projects', type=int, default=10,
+                        help='Number of projects the instances are spread '
+                             'among.')
+    parser.add_argument('--deleted-ratio', type=float, default=0.5,
+                        help='Ratio of the instances which are deleted.')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='Number of instances of each page.')
+    parser.add_argument('--pages', type=int, default=20,
+                        help='Maximum number of pages listed.')
+    parser.add_argument('--connection', default='sqlite://',
+                        help='SQLAlchemy URL of the database to create the '
+                             'instances in; it must be empty.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generator.')
+    return parser.parse_known_args()
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def create_instances(engine, options):
+    table = models.Instance.__table__
+    now = timeutils.utcnow()
+    rows = []
+    for i in range(options.instances):
+        instance_id = i + 1
+        # Several instances are created within the same second, as when
+        # booting many servers at once, so the creation times have ties.
+        created_at = now - datetime.timedelta(
+            seconds=(options.instances - i) // 4)
+        deleted = random.random() < options.deleted_ratio
+        rows.append({
+            'id': instance_id,
+            'uuid': uuidutils.generate_uuid(),
+            'created_at': created_at,
+            'updated_at': created_at,
+            'deleted_at': now if deleted else None,
+            'deleted': instance_id if deleted else 0,
+            'project_id': 'project%d' % (i % options.projects),
+            'user_id': 'user%d' % (i % options.projects),
+            'display_name': 'server%d' % instance_id,
+            'hostname': 'server%d' % instance_id,
+            'host': 'host%d' % (i % 100),
+            'vm_state': 'deleted' if deleted else 'active',
+            'memory_mb': 2048,
+            'vcpus': 1,
+        })
+        if len(rows) == INSERT_CHUNK_SIZE:
+            engine.execute(table.insert(), rows)
+            rows = []
+    if rows:
+        engine.execute(table.insert(), rows)
+
+
+def list_pages(ctxt, options):
+    latencies = []
+    marker = None
+    for page in range(options.pages):
+        start = time.time()
+        instances = db.instance_get_all_by_filters(
+            ctxt, {'deleted': False}, 'created_at', 'desc',
+            limit=options.page_size, marker=marker, columns_to_join=[])
+        latencies.append(time.time() - start)
+        if len(instances) < options.page_size:
+            break
+        marker = instances[-1]['uuid']
+    return latencies
+
+
+def main():
+    options, nova_args = parse_options()
+    config.parse_args([sys.argv[0]] + nova_args, default_config_files=[])
+    CONF.set_override('connection', options.connection, group='database')
+    random.seed(options.seed)
+
+    engine = sqlalchemy_api.get_engine()
+    migration.db_sync()
+    start = time.time()
+    create_instances(engine, options)
+    print('Created %d instances in %.1fs' % (options.instances,
+                                            time.time() - start))
+
+    contexts = [('all projects', context.get_admin_context()),
+                ('one project', context.RequestContext('user0',
+                                                       'project0'))]
+    print('%-15s %6s %10s %10s %12s %12s' % ('listing', 'pages', 'p50 (ms)',
+                                             'p99 (ms)', 'first (ms)',
+                                             'last (ms)'))
+    for name, ctxt in contexts:
+        latencies = list_pages(ctxt, options)
+        print('%-15s %6d %10.2f %10.2f %12.2f %12.2f' % (
+            name, len(latencies), percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000, latencies[0] * 1000,
+            latencies[-1] * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the loading of the metadata of the listed instances.
+
+A synthetic set of instances, each with metadata and system metadata
+items, is created in a database, an in-memory SQLite one by default, then
+listed into an InstanceList with their metadata and system metadata, the
+way the servers API lists them:
+
+ - as rows: the metadata items are loaded as ORM objects, and converted to
+   dicts when building the Instance objects;
+ - as dicts: the key/value tuples of the metadata items are fetched by
+   plain SELECTs and the dicts are built directly.
+
+The benchmark reports the p50/p99 latency of the listings with each
+method.
+
+Run like:
+
+    ./tools/benchmarks/instance_metadata.py --instances 5000 --metadata 5
+
+The database must be empty or migrated by nova-manage db sync. Any nova
+option can be given after the benchmark options.
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+from oslo.config import cfg
+from oslo.utils import timeutils
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import objects
+from nova.objects import instance as instance_obj
+from nova.openstack.common import uuidutils
+
+CONF = cfg.CONF
+
+# Rows inserted per statement when creating the synthetic instances.
+INSERT_CHUNK_SIZE = 1000
+
+EXPECTED_ATTRS = ['metadata', 'system_metadata']
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the loading of the metadata of the listed '
+                    'instances.')
+    parser.add_argument('--instances', type=int, default=2000,
+                        help='Number of instances to create.')
+    parser.add_argument('--metadata', type=int, default=5,
+                        help='Number of metadata items of each instance.')
+    parser.add_argument('--system-metadata', type=int, default=20,
+                        help='Number of system metadata items of each '
+                             'instance.')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='Number of listings with each method.')
+    parser.add_argument('--connection', default='sqlite://',
+                        help='SQLAlchemy URL of the database to create the '
+                             'instances in; it must be empty.')
+    return parser.parse_known_args()
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def insert_rows(engine, table, rows):
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        engine.execute(table.insert(), rows[i:i + INSERT_CHUNK_SIZE])
+
+
+def create_instances(engine, options):
+    now = timeutils.utcnow()
+    instances = []
+    metadata = []
+    system_metadata = []
+    for i in range(options.instances):
+        instance_uuid = uuidutils.generate_uuid()
+        instances.append({
+            'id': i + 1,
+            'uuid': instance_uuid,
+            'created_at': now,
+            'deleted': 0,
+            'project_id': 'project',
+            'user_id': 'user',
+            'display_name': 'server%d' % (i + 1),
+            'vm_state': 'active',
+        })
+        for j in range(options.metadata):
+            metadata.append({'instance_uuid': instance_uuid,
+                             'key': 'key%d' % j,
+                             'value': 'value%d' % j,
+                             'deleted': 0})
+        for j in range(options.system_metadata):
+            system_metadata.append({'instance_uuid': instance_uuid,
+                                    'key': 'image_key%d' % j,
+                                    'value': 'value%d' % j,
+                                    'deleted': 0})
+    insert_rows(engine, models.Instance.__table__, instances)
+    insert_rows(engine, models.InstanceMetadata.__table__, metadata)
+    insert_rows(engine, models.InstanceSystemMetadata.__table__,
+                system_metadata)
+
+
+def list_instances(ctxt, compact_metadata):
+    db_instances = db.instance_get_all_by_filters(
+        ctxt, {'deleted': False}, 'created_at', 'desc',
+        columns_to_join=list(EXPECTED_ATTRS),
+        compact_metadata=compact_metadata)
+    return instance_obj._make_instance_list(ctxt, objects.InstanceList(),
+                                            db_instances,
+                                            list(EXPECTED_ATTRS))
+
+
+def main():
+    options, nova_args = parse_options()
+    config.parse_args([sys.argv[0]] + nova_args, default_config_files=[])
+    CONF.set_override('connection', options.connection, group='database')
+    objects.register_all()
+
+    engine = sqlalchemy_api.get_engine()
+    migration.db_sync()
+    start = time.time()
+    create_instances(engine, options)
+    print('Created %d instances in %.1fs' % (options.instances,
+                                            time.time() - start))
+
+    ctxt = context.get_admin_context()
+    print('%-10s %10s %10s' % ('metadata', 'p50 (ms)', 'p99 (ms)'))
+    for name, compact_metadata in (('rows', False), ('dicts', True)):
+        latencies = []
+        for run in range(options.runs):
+            start = time.time()
+            instances = list_instances(ctxt, compact_metadata)
+            latencies.append(time.time() - start)
+        assert len(instances) == options.instances
+        print('%-10s %10.2f %10.2f' % (name,
+                                       percentile(latencies, 50) * 1000,
+                                       percentile(latencies, 99) * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the concurrent quota reservations of a single project.
+
+Worker threads reserve and commit the quota of an instance in the same
+project, as the API workers do when booting servers, with each quota driver
+in turn. The benchmark reports the number of reserve/commit cycles per
+second, their p50/p99 latency and the failures, for each driver.
+
+DbQuotaDriver locks the quota usages of the project, so the difference
+between the drivers is only visible on a database running concurrent
+transactions, like MySQL or PostgreSQL, which must be empty or migrated
+by nova-manage db sync:
+
+    ./tools/benchmarks/quota.py --connection mysql://nova:pw@dbhost/bench \\
+        --workers 16 --cycles 200 --users 4
+
+Each driver uses its own project. Any nova option can be given after the
+benchmark options, for instance --quota_usage_update_attempts.
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import threading
+import time
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova.db import migration
+from nova import quota
+
+CONF = cfg.CONF
+
+DRIVERS = ['nova.quota.DbQuotaDriver', 'nova.quota.OptimisticDbQuotaDriver']
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the concurrent quota reservations of a '
+                    'single project.')
+    parser.add_argument('--connection', required=True,
+                        help='SQLAlchemy URL of the database.')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of concurrent worker threads.')
+    parser.add_argument('--cycles', type=int, default=100,
+                        help='Number of reserve/commit cycles of each '
+                             'worker.')
+    parser.add_argument('--users', type=int, default=1,
+                        help='Number of users of the project the workers '
+                             'are spread over.')
+    parser.add_argument('--drivers', default=','.join(DRIVERS),
+                        help='Comma separated quota drivers to compare.')
+    return parser.parse_known_args()
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def run_driver(driver, options):
+    engine = quota.QuotaEngine(quota_driver_class=driver)
+    engine.register_resources(quota.QUOTAS._resources.values())
+    project_id = 'bench-%s-%d' % (driver.rsplit('.', 1)[-1], time.time())
+    contexts = [context.RequestContext('bench-user-%d' % i, project_id)
+                for i in range(options.users)]
+
+    # The quota usages of each user are created by a first reservation,
+    # outside of the measurements.
+    for ctxt in contexts:
+        engine.rollback(ctxt, engine.reserve(ctxt, instances=1))
+
+    latencies = []
+    failures = {}
+    lock = threading.Lock()
+
+    def worker(index):
+        ctxt = contexts[index % options.users]
+        for i in range(options.cycles):
+            start = time.time()
+            try:
+                reservations = engine.reserve(ctxt, instances=1, cores=2,
+                                              ram=512)
+                engine.commit(ctxt, reservations)
+            except Exception as e:
+                with lock:
+                    name = type(e).__name__
+                    failures[name] = failures.get(name, 0) + 1
+                continue
+            with lock:
+                latencies.append(time.time() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(options.workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    return {'cycles_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'failures': failures}
+
+
+def main():
+    options, nova_args = parse_options()
+    config.parse_args([sys.argv[0]] + nova_args, default_config_files=[])
+    CONF.set_override('connection', options.connection, group='database')
+    # The committed usages are never released, the quotas must not be hit.
+    for resource in ('instances', 'cores', 'ram'):
+        CONF.set_override('quota_%s' % resource, 10 ** 9)
+    migration.db_sync()
+
+    print('%d workers, %d cycles each, %d user(s)' % (
+        options.workers, options.cycles, options.users))
+    print('%-40s %10s %10s %10s  %s' % ('driver', 'cycles/s', 'p50 (ms)',
+                                        'p99 (ms)', 'failures'))
+    for driver in options.drivers.split(','):
+        driver = driver.strip()
+        results = run_driver(driver, options)
+        failures = ', '.join('%s: %d' % item
+                             for item in sorted(results['failures'].items()))
+        print('%-40s %10.1f %10.2f %10.2f  %s' % (
+            driver, results['cycles_per_second'], results['p50_ms'],
+            results['p99_ms'], failures or '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
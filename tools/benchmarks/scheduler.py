@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Offline benchmark of the scheduling decisions of the FilterScheduler.
+
+A synthetic cloud (compute nodes and their services, host aggregates and
+availability zones, NUMA topologies, PCI device pools and server groups) is
+created in a database, an in-memory SQLite one by default, and a mix of boot
+requests is replayed through FilterScheduler.select_destinations(). Nothing
+is sent to the compute nodes.
+
+The benchmark reports the p50/p99 latency of the decisions, the number of
+decisions per second, the number of DB queries per decision, and the time
+spent in each filter and weigher.
+
+Run like:
+
+    ./tools/benchmarks/scheduler.py --hosts 10000 --requests 200
+
+    ./tools/benchmarks/scheduler.py --hosts 50000 --numa-cells 2 \\
+        --pci-pools 2 --mix plain=50,az=10,numa=20,pci=10,group=10
+
+Any nova option can be given after the benchmark options, for instance
+--scheduler_use_batch_engine or --config-file.
+
+The results can be saved with --output, and compared to a previous run with
+--baseline: the exit code is then non-zero if the p99 latency or the number
+of decisions per second regressed by more than --max-regression percent.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import sys
+import time
+
+from oslo.config import cfg
+from oslo.messaging import conffixture as messaging_conffixture
+from oslo.serialization import jsonutils
+from oslo.utils import timeutils
+from sqlalchemy import event
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import exception
+from nova import objects
+from nova.openstack.common import uuidutils
+from nova.scheduler import filter_scheduler
+from nova.virt import hardware
+
+CONF = cfg.CONF
+CONF.import_opt('service_down_time', 'nova.service')
+CONF.import_opt('scheduler_default_filters', 'nova.scheduler.host_manager')
+
+BENCHMARK_FILTERS = ['RetryFilter', 'AvailabilityZoneFilter', 'RamFilter',
+                     'ComputeFilter', 'ComputeCapabilitiesFilter',
+                     'ImagePropertiesFilter', 'CoreFilter', 'DiskFilter',
+                     'NUMATopologyFilter', 'PciPassthroughFilter',
+                     'ServerGroupAntiAffinityFilter',
+                     'ServerGroupAffinityFilter']
+
+FLAVORS = [
+    {'name': 'm1.small', 'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20},
+    {'name': 'm1.medium', 'memory_mb': 4096, 'vcpus': 2, 'root_gb': 40},
+    {'name': 'm1.large', 'memory_mb': 8192, 'vcpus': 4, 'root_gb': 80},
+]
+
+REQUEST_TYPES = ('plain', 'az', 'numa', 'pci', 'group')
+
+PCI_VENDOR_ID = '8086'
+
+# Rows inserted per statement when creating the synthetic cloud.
+INSERT_CHUNK_SIZE = 1000
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the scheduling decisions of the '
+                    'FilterScheduler against a synthetic cloud.')
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='Number of compute nodes.')
+    parser.add_argument('--aggregates', type=int, default=10,
+                        help='Number of host aggregates; the hosts are '
+                             'spread evenly among them.')
+    parser.add_argument('--availability-zones', type=int, default=2,
+                        help='Number of availability zones the aggregates '
+                             'are spread among.')
+    parser.add_argument('--numa-cells', type=int, default=0,
+                        help='Number of NUMA cells of the compute nodes, '
+                             '0 for no NUMA topology.')
+    parser.add_argument('--pci-pools', type=int, default=0,
+                        help='Number of PCI device pools of every other '
+                             'compute node.')
+    parser.add_argument('--server-groups', type=int, default=10,
+                        help='Number of server groups, alternatively with '
+                             'the affinity and anti-affinity policies.')
+    parser.add_argument('--group-members', type=int, default=3,
+                        help='Number of instances in each server group.')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='Number of boot requests to replay.')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='Number of requests run before measuring.')
+    parser.add_argument('--instances-per-request', type=int, default=1,
+                        help='Number of instances of each boot request.')
+    parser.add_argument('--mix', default='plain=60,az=10,numa=10,pci=10,'
+                                         'group=10',
+                        help='Comma separated list of request_type=weight, '
+                             'with request types among %s.' %
+                             ', '.join(REQUEST_TYPES))
+    parser.add_argument('--filters', default=','.join(BENCHMARK_FILTERS),
+                        help='Comma separated list of the filters to use.')
+    parser.add_argument('--connection', default='sqlite://',
+                        help='SQLAlchemy URL of the database to create the '
+                             'synthetic cloud in; it must be empty.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generator.')
+    parser.add_argument('--output',
+                        help='Save the results to this JSON file.')
+    parser.add_argument('--baseline',
+                        help='JSON file of a previous run to compare with.')
+    parser.add_argument('--max-regression', type=float, default=10.0,
+                        help='Maximum regression, in percent, of the p99 '
+                             'latency and decisions per second allowed '
+                             'when comparing with --baseline.')
+    return parser.parse_known_args()
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        request_type, _sep, weight = item.partition('=')
+        request_type = request_type.strip()
+        if request_type not in REQUEST_TYPES:
+            raise ValueError('Unknown request type %r' % request_type)
+        weights[request_type] = float(weight or 1)
+    return weights
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+# Synthetic cloud
+
+
+def _insert(engine, model, rows):
+    table = model.__table__
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        engine.execute(table.insert(), rows[i:i + INSERT_CHUNK_SIZE])
+
+
+def _host_name(index):
+    return 'host%05d' % index
+
+
+def _numa_topology(numa_cells, vcpus, memory_mb):
+    if not numa_cells:
+        return None
+    cpus_per_cell = vcpus // numa_cells
+    cells = [hardware.VirtNUMATopologyCellUsage(
+                 cell, set(range(cell * cpus_per_cell,
+                                 (cell + 1) * cpus_per_cell)),
+                 memory_mb // numa_cells)
+             for cell in range(numa_cells)]
+    return hardware.VirtNUMAHostTopology(cells=cells).to_json()
+
+
+def _pci_stats(pci_pools):
+    return jsonutils.dumps([{'vendor_id': PCI_VENDOR_ID,
+                             'product_id': '15%02d' % pool,
+                             'count': 8}
+                            for pool in range(pci_pools)])
+
+
+def create_cloud(ctxt, engine, options):
+    """Create the synthetic cloud and return the server group uuids."""
+    now = timeutils.utcnow()
+    services = []
+    compute_nodes = []
+    for i in range(options.hosts):
+        host = _host_name(i)
+        services.append({'id': i + 1, 'host': host, 'binary': 'nova-compute',
+                         'topic': 'compute', 'report_count': 1,
+                         'disabled': False, 'created_at': now,
+                         'updated_at': now, 'deleted': 0})
+
+        vcpus = random.choice((16, 32, 48))
+        memory_mb = vcpus * 4096
+        local_gb = vcpus * 64
+        num_instances = random.randint(0, vcpus // 2)
+        vcpus_used = num_instances * 2
+        memory_mb_used = num_instances * 4096
+        local_gb_used = num_instances * 40
+        compute_nodes.append({
+            'id': i + 1, 'service_id': i + 1, 'vcpus': vcpus,
+            'memory_mb': memory_mb, 'local_gb': local_gb,
+            'vcpus_used': vcpus_used, 'memory_mb_used': memory_mb_used,
+            'local_gb_used': local_gb_used,
+            'free_ram_mb': memory_mb - memory_mb_used,
+            'free_disk_gb': local_gb - local_gb_used,
+            'disk_available_least': local_gb - local_gb_used,
+            'current_workload': 0, 'running_vms': num_instances,
+            'hypervisor_type': 'QEMU', 'hypervisor_version': 2000000,
+            'hypervisor_hostname': host, 'cpu_info': '{}',
+            'host_ip': '10.%d.%d.%d' % (i >> 16, (i >> 8) & 255, i & 255),
+            'supported_instances': jsonutils.dumps(
+                [['x86_64', 'qemu', 'hvm']]),
+            'metrics': '[]',
+            'stats': jsonutils.dumps(
+                {'num_instances': num_instances,
+                 'io_workload': random.randint(0, 4)}),
+            'numa_topology': _numa_topology(options.numa_cells, vcpus,
+                                            memory_mb),
+            'pci_stats': (_pci_stats(options.pci_pools)
+                          if options.pci_pools and i % 2 == 0 else None),
+            'created_at': now, 'updated_at': now, 'deleted': 0})
+    _insert(engine, models.Service, services)
+    _insert(engine, models.ComputeNode, compute_nodes)
+
+    aggregate_hosts = []
+    for i in range(options.aggregates):
+        metadata = {'availability_zone':
+                        'az%d' % (i % max(options.availability_zones, 1))}
+        if i % 2:
+            metadata['ssd'] = 'true'
+        aggregate = db.aggregate_create(ctxt, {'name': 'aggregate%d' % i},
+                                        metadata=metadata)
+        for host in range(i, options.hosts, options.aggregates):
+            aggregate_hosts.append({'host': _host_name(host),
+                                    'aggregate_id': aggregate['id'],
+                                    'created_at': now, 'deleted': 0})
+    _insert(engine, models.AggregateHost, aggregate_hosts)
+
+    groups = []
+    instances = []
+    for i in range(options.server_groups):
+        policy = 'affinity' if i % 2 else 'anti-affinity'
+        if policy == 'affinity':
+            hosts = [_host_name(random.randrange(options.hosts))]
+        else:
+            hosts = [_host_name(host) for host in
+                     random.sample(range(options.hosts),
+                                   min(options.group_members, options.hosts))]
+        members = []
+        for member in range(options.group_members):
+            host = hosts[member % len(hosts)]
+            uuid = uuidutils.generate_uuid()
+            members.append(uuid)
+            instances.append({'uuid': uuid, 'host': host, 'node': host,
+                              'project_id': 'fake', 'user_id': 'fake',
+                              'vm_state': 'active', 'memory_mb': 2048,
+                              'vcpus': 1, 'root_gb': 20, 'ephemeral_gb': 0,
+                              'created_at': now, 'deleted': 0})
+        group = db.instance_group_create(
+            ctxt, {'name': 'group%d' % i, 'project_id': 'fake',
+                   'user_id': 'fake'},
+            policies=[policy], members=members)
+        groups.append(group['uuid'])
+    _insert(engine, models.Instance, instances)
+    return groups
+
+
+# Boot requests
+
+
+def build_request(request_type, options, groups, instance_uuid):
+    flavor = dict(random.choice(FLAVORS), ephemeral_gb=0, swap=0,
+                  extra_specs={})
+    instance_properties = {'uuid': instance_uuid, 'project_id': 'fake',
+                           'user_id': 'fake', 'os_type': 'linux',
+                           'availability_zone': None,
+                           'memory_mb': flavor['memory_mb'],
+                           'vcpus': flavor['vcpus'],
+                           'root_gb': flavor['root_gb'],
+                           'ephemeral_gb': 0, 'vm_state': 'building',
+                           'numa_topology': None}
+    filter_properties = {'scheduler_hints': {}, 'instance_type': flavor}
+
+    if request_type == 'az':
+        zone = 'az%d' % random.randrange(max(options.availability_zones, 1))
+        instance_properties['availability_zone'] = zone
+    elif request_type == 'numa' and options.numa_cells:
+        flavor['extra_specs']['hw:numa_nodes'] = str(options.numa_cells)
+        flavor['vcpus'] = instance_properties['vcpus'] = max(
+            flavor['vcpus'], options.numa_cells)
+        topology = hardware.VirtNUMAInstanceTopology.get_constraints(flavor,
+                                                                     {})
+        instance_properties['numa_topology'] = topology.to_json()
+    elif request_type == 'pci' and options.pci_pools:
+        spec = {'vendor_id': PCI_VENDOR_ID,
+                'product_id': '15%02d' % random.randrange(options.pci_pools)}
+        filter_properties['pci_requests'] = objects.InstancePCIRequests(
+            instance_uuid=instance_uuid,
+            requests=[objects.InstancePCIRequest(count=1, spec=[spec])])
+    elif request_type == 'group' and groups:
+        filter_properties['scheduler_hints']['group'] = random.choice(groups)
+
+    request_spec = {'instance_properties': instance_properties,
+                    'instance_type': flavor,
+                    'image': {'properties': {}},
+                    'num_instances': options.instances_per_request}
+    return request_spec, filter_properties
+
+
+# Instrumentation
+
+
+class QueryCounter(object):
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+
+class Timings(object):
+    """Time spent and number of hosts seen by each filter and weigher.
+
+    The timings are collected through the filter_finished() and
+    weigher_finished() hooks of the handlers, so the filters and weighers
+    run exactly as in production.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        # Number of hosts given to the weighers being run.
+        self._weighed_hosts = 0
+
+    def record(self, name, elapsed, num_hosts):
+        calls, total, hosts = self.stats.get(name, (0, 0.0, 0))
+        self.stats[name] = (calls + 1, total + elapsed, hosts + num_hosts)
+
+    def instrument(self, host_manager):
+        """Hook into the filter and weight handlers of a host manager."""
+        filter_handler = host_manager.filter_handler
+        weight_handler = host_manager.weight_handler
+        filter_finished = filter_handler.filter_finished
+        weigher_finished = weight_handler.weigher_finished
+        get_weighed_objects = weight_handler.get_weighed_objects
+
+        def _filter_finished(cls_name, num_in, num_out, elapsed):
+            filter_finished(cls_name, num_in, num_out, elapsed)
+            self.record(cls_name, elapsed, num_in)
+
+        def _weigher_finished(cls_name, elapsed):
+            weigher_finished(cls_name, elapsed)
+            self.record(cls_name, elapsed, self._weighed_hosts)
+
+        def _get_weighed_objects(weigher_classes, obj_list, *args, **kwargs):
+            obj_list = list(obj_list)
+            self._weighed_hosts = len(obj_list)
+            return get_weighed_objects(weigher_classes, obj_list, *args,
+                                       **kwargs)
+
+        filter_handler.filter_finished = _filter_finished
+        weight_handler.weigher_finished = _weigher_finished
+        weight_handler.get_weighed_objects = _get_weighed_objects
+
+
+def run_benchmark(options, mix):
+    ctxt = context.get_admin_context()
+    engine = sqlalchemy_api.get_engine()
+    migration.db_sync()
+
+    start = time.time()
+    groups = create_cloud(ctxt, engine, options)
+    print('Created %d hosts in %.1fs' % (options.hosts, time.time() - start))
+
+    scheduler = filter_scheduler.FilterScheduler()
+    host_manager = scheduler.host_manager
+    timings = Timings()
+    timings.instrument(host_manager)
+    queries = QueryCounter(engine)
+
+    request_types = sorted(mix)
+    cumulative = []
+    total_weight = 0.0
+    for request_type in request_types:
+        total_weight += mix[request_type]
+        cumulative.append(total_weight)
+
+    latencies = []
+    no_valid_host = 0
+    measure_start = None
+    for i in range(options.warmup + options.requests):
+        if i == options.warmup:
+            timings.stats.clear()
+            queries.count = 0
+            measure_start = time.time()
+        pick = random.random() * total_weight
+        request_type = request_types[
+            [pick < c for c in cumulative].index(True)]
+        request_spec, filter_properties = build_request(
+            request_type, options, groups, uuidutils.generate_uuid())
+        start = time.time()
+        try:
+            scheduler.select_destinations(ctxt, request_spec,
+                                          filter_properties)
+        except exception.NoValidHost:
+            no_valid_host += 1
+        if i >= options.warmup:
+            latencies.append(time.time() - start)
+    elapsed = time.time() - (measure_start or time.time())
+
+    num_requests = max(len(latencies), 1)
+    return {
+        'hosts': options.hosts,
+        'requests': len(latencies),
+        'no_valid_host': no_valid_host,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'decisions_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'db_queries_per_decision': float(queries.count) / num_requests,
+        'steps': dict((name, {'calls': calls,
+                              'ms_per_decision': total * 1000 / num_requests,
+                              'hosts_per_sec': hosts / total if total else 0})
+                      for name, (calls, total, hosts)
+                      in timings.stats.items()),
+    }
+
+
+def print_results(results):
+    print('Decisions:           %(requests)d (%(no_valid_host)d without '
+          'a valid host)' % results)
+    print('Latency p50:         %(p50_ms).2f ms' % results)
+    print('Latency p99:         %(p99_ms).2f ms' % results)
+    print('Decisions/sec:       %(decisions_per_sec).1f' % results)
+    print('DB queries/decision: %(db_queries_per_decision).1f' % results)
+    print()
+    print('%-34s %8s %16s %14s' % ('Filter / weigher', 'calls',
+                                    'ms/decision', 'hosts/sec'))
+    steps = sorted(results['steps'].items(),
+                   key=lambda item: item[1]['ms_per_decision'], reverse=True)
+    for name, step in steps:
+        print('%-34s %8d %16.3f %14.0f' % (name, step['calls'],
+                                          step['ms_per_decision'],
+                                          step['hosts_per_sec']))
+
+
+def compare_results(results, baseline, max_regression):
+    """Return the list of the regressions compared to the baseline."""
+    regressions = []
+    limit = 1 + max_regression / 100.0
+    if results['p99_ms'] > baseline['p99_ms'] * limit:
+        regressions.append('p99 latency %.2f ms > %.2f ms baseline' %
+                           (results['p99_ms'], baseline['p99_ms']))
+    if results['decisions_per_sec'] * limit < baseline['decisions_per_sec']:
+        regressions.append('%.1f decisions/sec < %.1f baseline' %
+                           (results['decisions_per_sec'],
+                            baseline['decisions_per_sec']))
+    return regressions
+
+
+def main():
+    options, nova_args = parse_options()
+    mix = parse_mix(options.mix)
+    random.seed(options.seed)
+
+    # Nothing is sent to the compute nodes, and the services must stay up
+    # during the whole run.
+    messaging_conf = messaging_conffixture.ConfFixture(CONF)
+    messaging_conf.transport_driver = 'fake'
+    CONF.set_default('service_down_time', 24 * 3600)
+    CONF.set_default('scheduler_default_filters',
+                     [name.strip() for name in options.filters.split(',')])
+    config.parse_args([sys.argv[0]] + nova_args, default_config_files=[])
+    CONF.set_override('connection', options.connection, group='database')
+    objects.register_all()
+
+    results = run_benchmark(options, mix)
+    print_results(results)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            jsonutils.dump(results, f, indent=4, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = jsonutils.load(f)
+        regressions = compare_results(results, baseline,
+                                      options.max_regression)
+        for regression in regressions:
+            print('REGRESSION: %s' % regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())